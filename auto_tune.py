@@ -0,0 +1,350 @@
+#!/usr/bin/env python3
+"""
+検出設定の自動チューニング（録画映像＋正解通過時刻）
+- replay_benchmark と同じ再生・照合で detect_motion_v7 の閾値を評価し、最も良い設定を config.json へ書き戻す
+- 探索対象: 動き画素数・輪郭面積・面積比率の上下限・MOG2 の history / varThreshold・検出クールダウン
+- 映像のデコードは最初に1回だけ：トリップワイヤーの帯をグレースケールで切り出して一時ファイル（.npy）へ保存し、
+  ワーカープロセスは memmap で共有（候補ごと・ワーカーごとにデコードし直さない）
+- 探索はランダムサンプリング → 上位候補の近傍を絞り込み。候補はプロセスプールで並列評価し、制限時間で打ち切り
+- 評価: 見逃し＋誤検出（＋学習中で評価できなかった通過）が少ないほど良く、同数ならラップタイム誤差（平均絶対値）が小さいほど良い
+
+使い方:
+    python auto_tune.py clip1.mp4 clip2.mp4 --annotations crossings.json
+    python auto_tune.py clip1.mp4 --annotations crossings.json --trials 120 --time-budget 300 --write
+"""
+
+import argparse
+import concurrent.futures
+import copy
+import json
+import math
+import os
+import random
+import shutil
+import sys
+import tempfile
+import time
+
+import cv2
+import numpy as np
+
+from camera_capture import CapturedFrame
+from lap_timing_engine import LapTimingEngine, format_time
+from replay_benchmark import evaluate_crossings, quiet_engine, replay_frames
+from start_line_tripwire import StartLineTripwire
+
+# 探索範囲: 設定キー → (セクション, 下限, 上限, 対数スケールか, 整数か)
+SEARCH_SPACE = {
+    'motion_pixels_threshold': ('detection_settings', 100, 30000, True, True),
+    'min_contour_area': ('detection_settings', 50, 5000, True, True),
+    'motion_area_ratio_min': ('detection_settings', 0.00001, 0.01, True, False),
+    'motion_area_ratio_max': ('detection_settings', 0.1, 1.0, False, False),
+    'history': ('background_subtractor_settings', 100, 2000, True, True),
+    'varThreshold': ('background_subtractor_settings', 8, 64, True, False),
+    'detection_cooldown': ('race_settings', 0.5, 5.0, False, False),
+}
+
+
+# ----------------------------------------------------------------------
+# 映像の前処理（親プロセスで1回だけ）
+# ----------------------------------------------------------------------
+def extract_band(path, config, work_dir):
+    """映像をデコードしてトリップワイヤーの帯（グレースケール）を切り出し .npy に保存
+
+    戻り値: 帯画像ファイル, 時刻ファイル, 切り出し後の座標に直したトリップワイヤー設定（帯なしは None）
+    """
+    camera_settings = config["camera_settings"]
+    frame_size = (camera_settings["frame_width"], camera_settings["frame_height"])
+    tripwire = StartLineTripwire.from_config(config.get("start_line_settings", {}), frame_size)
+    cap = cv2.VideoCapture(path)
+    fps = cap.get(cv2.CAP_PROP_FPS) or 30.0
+    bands, timestamps = [], []
+    try:
+        while True:
+            ret, frame = cap.read()
+            if not ret:
+                break
+            position_ms = cap.get(cv2.CAP_PROP_POS_MSEC)
+            timestamps.append(position_ms / 1000.0 if position_ms > 0 else len(timestamps) / fps)
+            if tripwire is not None:
+                tripwire.fit_frame(frame)
+                frame = tripwire.crop(frame)
+            bands.append(cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY))
+    finally:
+        cap.release()
+    if not bands:
+        raise ValueError(f"映像を読み込めません: {path}")
+
+    name = f"{len(os.listdir(work_dir)) // 2:03d}"
+    band_path = os.path.join(work_dir, name + "_band.npy")
+    time_path = os.path.join(work_dir, name + "_time.npy")
+    np.save(band_path, np.stack(bands))
+    np.save(time_path, np.array(timestamps))
+
+    band_tripwire = None
+    if tripwire is not None:
+        x0, y0 = tripwire.roi[:2]
+        band_tripwire = {
+            'points': [[x - x0, y - y0] for x, y in tripwire.points],
+            'band_width': tripwire.band_width,
+            'band_size': [bands[0].shape[1], bands[0].shape[0]],
+            'area_scale': tripwire.area_scale,  # 閾値の換算は元のフレームサイズ基準のまま
+        }
+    return band_path, time_path, band_tripwire
+
+
+# ----------------------------------------------------------------------
+# ワーカープロセス
+# ----------------------------------------------------------------------
+_clips = []
+
+
+def _init_worker(clips):
+    """帯画像を memmap で開く（ページキャッシュを全ワーカーで共有）・エンジンの表示を抑止"""
+    sys.stdout = open(os.devnull, 'w')
+    cv2.setNumThreads(1)  # 並列性はプロセス単位で確保
+    for clip in clips:
+        _clips.append(dict(clip, bands=np.load(clip['band_path'], mmap_mode='r'),
+                           timestamps=np.load(clip['time_path'])))
+
+
+def candidate_config(base, params):
+    """探索値を反映した設定（ログ・結果保存・背景キャッシュ・複数車両・ラインスキャンは無効）
+
+    検出解像度は固定：並列実行中の処理時間で解像度が変わると評価が再現しない
+    """
+    config = copy.deepcopy(base)
+    for key, value in params.items():
+        config.setdefault(SEARCH_SPACE[key][0], {})[key] = value
+    config['log_settings'] = {'file': None, 'console_level': 'off'}
+    config['results_settings'] = dict(config.get('results_settings', {}), enabled=False)
+    config['background_cache_settings'] = dict(config.get('background_cache_settings', {}), enabled=False)
+    config['tracking_settings'] = dict(config.get('tracking_settings', {}), enabled=False)
+    config['detector_settings'] = dict(config.get('detector_settings', {}), mode='mog2')
+    config['scaling_settings'] = dict(config.get('scaling_settings', {}), adaptive=False)
+    return config
+
+
+def evaluate_candidate(base, params, tolerance):
+    """1候補を全映像で評価 → 集計結果"""
+    started = time.perf_counter()
+    config = candidate_config(base, params)
+    missed = false = evaluated = ignored = 0
+    lap_errors, crossing_errors = [], []
+    for clip in _clips:
+        engine = LapTimingEngine(config=config)
+        quiet_engine(engine)
+        band = clip['band_tripwire']
+        if band is not None:
+            engine.start_line_tripwire = StartLineTripwire(band['points'], band['band_width'], band['band_size'])
+            engine.start_line_tripwire.area_scale = band['area_scale']
+        bands, timestamps = clip['bands'], clip['timestamps']
+        frames = (CapturedFrame(bands[i], float(timestamps[i]), i + 1) for i in range(len(timestamps)))
+        detected, armed, _, _ = replay_frames(engine, frames)
+        engine.log.close()
+        result = evaluate_crossings(detected, armed, clip['crossings'], tolerance)
+        missed += result['missed']
+        false += result['false']
+        evaluated += result['evaluated_crossings']
+        ignored += result['ignored_crossings']
+        lap_errors.extend(abs(lap['error_ms']) for lap in result['laps'])
+        crossing_errors.extend(abs(e) for e in result['crossing_errors_ms'])
+    return {
+        'params': params,
+        'missed': missed,
+        'false': false,
+        'evaluated': evaluated,
+        'ignored': ignored,
+        'lap_error_ms': float(np.mean(lap_errors)) if lap_errors else None,
+        'crossing_error_ms': float(np.mean(crossing_errors)) if crossing_errors else None,
+        'elapsed_s': time.perf_counter() - started,
+    }
+
+
+def score(result):
+    """小さいほど良い：(見逃し＋誤検出＋学習中で評価できなかった通過, ラップ誤差, 通過時刻誤差)
+
+    誤検出で規定周回が早く終わると再学習中の通過が評価から外れるため、その分も減点
+    """
+    lap_error = result['lap_error_ms'] if result['lap_error_ms'] is not None else math.inf
+    crossing_error = result['crossing_error_ms'] if result['crossing_error_ms'] is not None else math.inf
+    return (result['missed'] + result['false'] + result['ignored'], lap_error, crossing_error)
+
+
+# ----------------------------------------------------------------------
+# 探索
+# ----------------------------------------------------------------------
+def _clip_value(key, value, space):
+    _, low, high, _, integer = space[key]
+    value = min(max(value, low), high)
+    return int(round(value)) if integer else round(value, 6)
+
+
+def sample_params(rng, space):
+    params = {}
+    for key, (_, low, high, log_scale, _) in space.items():
+        if log_scale:
+            value = math.exp(rng.uniform(math.log(low), math.log(high)))
+        else:
+            value = rng.uniform(low, high)
+        params[key] = _clip_value(key, value, space)
+    return params
+
+
+def perturb_params(rng, params, space, spread):
+    """近傍の候補：対数スケールは倍率、線形は範囲に対する割合でずらす"""
+    result = {}
+    for key, (_, low, high, log_scale, _) in space.items():
+        value = params[key]
+        if log_scale:
+            value = value * math.exp(rng.gauss(0.0, spread))
+        else:
+            value = value + rng.gauss(0.0, spread) * (high - low)
+        result[key] = _clip_value(key, value, space)
+    if result['motion_area_ratio_min'] >= result['motion_area_ratio_max']:
+        result['motion_area_ratio_min'] = params['motion_area_ratio_min']
+    return result
+
+
+def current_params(config, space):
+    """現在の設定値（探索の基準候補）"""
+    params = {}
+    for key, (section, low, high, _, _) in space.items():
+        value = config.get(section, {}).get(key, (low + high) / 2.0)
+        params[key] = _clip_value(key, value, space)
+    return params
+
+
+def search_space_for(crossings_by_clip):
+    """クールダウンの上限は最短ラップの 0.8 倍（次の通過を捨てない）"""
+    space = dict(SEARCH_SPACE)
+    laps = [b - a for crossings in crossings_by_clip for a, b in zip(crossings, crossings[1:])]
+    if laps:
+        section, low, high, log_scale, integer = space['detection_cooldown']
+        space['detection_cooldown'] = (section, low, max(low, min(high, min(laps) * 0.8)), log_scale, integer)
+    return space
+
+
+def run_search(base, clips, args):
+    space = search_space_for([clip['crossings'] for clip in clips])
+    rng = random.Random(args.seed)
+    workers = args.workers or os.cpu_count() or 1
+    deadline = time.perf_counter() + args.time_budget if args.time_budget else None
+    explore = max(1, int(args.trials * 0.6))
+    results = []
+
+    def over_budget():
+        return deadline is not None and time.perf_counter() > deadline
+
+    def run_round(executor, candidates, label):
+        futures = [executor.submit(evaluate_candidate, base, params, args.tolerance) for params in candidates]
+        for done, future in enumerate(concurrent.futures.as_completed(futures), 1):
+            results.append(future.result())
+            if over_budget():
+                for pending in futures:
+                    pending.cancel()
+                print(f"⏱️ 制限時間に達したため {label} を打ち切り（{done}/{len(futures)}）")
+                return False
+        best = min(results, key=score)
+        print(f"🔎 {label}: {len(candidates)}候補  ベスト 失点 {score(best)[0]}  "
+              f"ラップ誤差 {best['lap_error_ms'] if best['lap_error_ms'] is not None else float('nan'):.1f}ms")
+        return True
+
+    with concurrent.futures.ProcessPoolExecutor(workers, initializer=_init_worker, initargs=(clips,)) as executor:
+        candidates = [current_params(base, space)] + [sample_params(rng, space) for _ in range(explore - 1)]
+        finished = run_round(executor, candidates, "探索")
+        spread = 0.35
+        remaining = args.trials - explore
+        while finished and remaining > 0:
+            # 上位候補の近傍を徐々に狭めて評価（1ラウンド = ワーカー数の倍数で空きを作らない）
+            top = sorted(results, key=score)[:max(1, args.top)]
+            size = min(remaining, max(workers, len(top)) * 2)
+            candidates = [perturb_params(rng, top[i % len(top)]['params'], space, spread) for i in range(size)]
+            finished = run_round(executor, candidates, f"絞り込み（幅 {spread:.2f}）")
+            remaining -= size
+            spread *= 0.6
+    return sorted(results, key=score)
+
+
+def write_config(config_path, config, params):
+    """最良候補を config.json へ書き戻す（LapTimingEngine.save_config と同じ形式）"""
+    for key, value in params.items():
+        config.setdefault(SEARCH_SPACE[key][0], {})[key] = value
+    with open(config_path, 'w', encoding='utf-8') as f:
+        json.dump(config, f, indent=2, ensure_ascii=False)
+    print(f"💾 {config_path} に書き戻しました")
+
+
+def print_result(label, result):
+    lap_error = f"{result['lap_error_ms']:.1f}ms" if result['lap_error_ms'] is not None else "-"
+    crossing_error = f"{result['crossing_error_ms']:.1f}ms" if result['crossing_error_ms'] is not None else "-"
+    print(f"{label}: 見逃し {result['missed']}/{result['evaluated']}  誤検出 {result['false']}  "
+          f"学習中 {result['ignored']}  "
+          f"ラップ誤差 {lap_error}  通過時刻誤差 {crossing_error}")
+    for key, value in result['params'].items():
+        print(f"   {key:<24} {value}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="録画映像による検出設定の自動チューニング")
+    parser.add_argument('videos', nargs='+', help="スタートライン映像ファイル")
+    parser.add_argument('--annotations', required=True, help="正解通過時刻のJSONファイル")
+    parser.add_argument('--config', default='config.json', help="基準にする設定（--write で書き戻す）")
+    parser.add_argument('--trials', type=int, default=96, help="評価する候補数")
+    parser.add_argument('--top', type=int, default=4, help="絞り込みで近傍を探す上位候補数")
+    parser.add_argument('--workers', type=int, default=0, help="ワーカープロセス数（0 = CPU数）")
+    parser.add_argument('--time-budget', type=float, default=600.0, help="制限時間[秒]（0 = 無制限）")
+    parser.add_argument('--tolerance', type=float, default=0.5, help="正解と見なす時刻差[秒]")
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--write', action='store_true', help="最良の設定を config.json へ書き戻す")
+    parser.add_argument('--json', dest='json_path', help="全候補の結果をJSONで保存")
+    args = parser.parse_args()
+
+    with open(args.config, 'r', encoding='utf-8') as f:
+        config = json.load(f)
+    with open(args.annotations, 'r', encoding='utf-8') as f:
+        annotations = json.load(f)
+
+    started = time.perf_counter()
+    work_dir = tempfile.mkdtemp(prefix="auto_tune_")
+    try:
+        clips = []
+        for video in args.videos:
+            crossings = sorted(annotations.get(os.path.basename(video), annotations.get(video, [])))
+            if not crossings:
+                print(f"⚠️ {video} の正解通過時刻がありません（スキップ）")
+                continue
+            band_path, time_path, band_tripwire = extract_band(video, config, work_dir)
+            clips.append({'video': video, 'crossings': crossings, 'band_path': band_path,
+                          'time_path': time_path, 'band_tripwire': band_tripwire})
+        if not clips:
+            print("❌ 評価できる映像がありません")
+            return 1
+        print(f"🎬 {len(clips)}本の映像を前処理（{time.perf_counter() - started:.1f}s）")
+
+        results = run_search(config, clips, args)
+    finally:
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+    reference = current_params(config, search_space_for([clip['crossings'] for clip in clips]))
+    baseline = next((result for result in results if result['params'] == reference), None)
+    best = results[0]
+    print(f"\n✅ {len(results)}候補を評価（{format_time(time.perf_counter() - started)}）")
+    if baseline is not None:
+        print_result("現在の設定", baseline)
+    print_result("最良の設定", best)
+
+    if args.json_path:
+        with open(args.json_path, 'w', encoding='utf-8') as f:
+            json.dump(results, f, indent=2, ensure_ascii=False)
+        print(f"💾 {args.json_path} に保存しました")
+    if args.write:
+        if baseline is None or score(best) < score(baseline):
+            write_config(args.config, config, best['params'])
+        else:
+            print("ℹ️ 現在の設定より良い候補がないため書き戻しません")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,107 @@
+#!/usr/bin/env python3
+"""
+背景モデルのウォームスタート
+- 背景学習完了時に、直近フレームの中央値（帯のグレースケール・フル解像度）を背景画像として保存
+- 保存キー: 接続中のスタートライン入力（デバイス識別子・ファイル・URL）・フレームサイズ・トリップワイヤー × 明るさ区分（照明条件）
+- 計測準備時に同じカメラ・近い明るさの背景画像があれば MOG2 を即座に初期化し、
+  最新フレームとの差（残留前景）で収束を確認：合格なら短い追加学習だけで検出開始
+- MOG2 の内部状態は保存できないため、同等の平均的な背景画像で代用（分散は追加学習中に合わせ込む）
+"""
+
+import hashlib
+import json
+import os
+import threading
+import time
+
+import cv2
+import numpy as np
+
+
+class BackgroundCache:
+    """カメラ・照明条件ごとの背景画像の保存と読み込み"""
+
+    def __init__(self, settings):
+        self.enabled = settings.get("enabled", True)
+        self.directory = settings.get("directory", "background_cache")
+        self.bucket_size = max(1, settings.get("brightness_bucket", 16))  # 明るさ区分の幅（0-255）
+        self.max_age = settings.get("max_age_hours", 24) * 3600.0
+        self.warm_learning_duration = settings.get("warm_learning_duration", 0.5)
+        self.max_residual_ratio = settings.get("max_residual_ratio", 0.3)  # 検出閾値に対する残留前景の上限
+        self._lock = threading.Lock()
+        self._images = {}  # 読み込み済み画像（ファイル名 → 画像）
+        self._index = self._load_index() if self.enabled else {}
+
+    @property
+    def index_path(self):
+        return os.path.join(self.directory, "index.json")
+
+    def _load_index(self):
+        try:
+            with open(self.index_path, 'r', encoding='utf-8') as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return {}
+
+    @staticmethod
+    def camera_key(source_identity, frame_size, tripwire_config):
+        """入力と検出帯の組み合わせごとのキー"""
+        source = json.dumps([source_identity, list(frame_size), tripwire_config], sort_keys=True)
+        return hashlib.sha1(source.encode('utf-8')).hexdigest()[:12]
+
+    def brightness(self, gray):
+        return float(cv2.mean(gray)[0])
+
+    def load(self, key, gray):
+        """現在の帯画像に近い明るさの背景画像（なければ None）"""
+        if not self.enabled:
+            return None
+        level = self.brightness(gray)
+        bucket = int(level // self.bucket_size)
+        with self._lock:
+            entries = dict(self._index.get(key, {}))
+        now = time.time()
+        candidates = []
+        for name, entry in entries.items():
+            if abs(int(name) - bucket) > 1 or now - entry['saved_at'] > self.max_age:
+                continue
+            candidates.append((abs(entry['brightness'] - level), entry['file']))
+        if not candidates:
+            return None
+        filename = min(candidates)[1]
+        image = self._images.get(filename)
+        if image is None:
+            image = cv2.imread(os.path.join(self.directory, filename), cv2.IMREAD_GRAYSCALE)
+            if image is None:
+                return None
+            self._images[filename] = image
+        return image
+
+    def store(self, key, frames):
+        """直近フレーム（帯のグレースケール）の中央値を背景画像として保存（書き込みは別スレッド）"""
+        if not self.enabled or not frames:
+            return
+        shapes = {f.shape for f in frames}
+        if len(shapes) != 1:
+            return
+        background = np.median(np.stack(frames), axis=0).astype(np.uint8)
+        threading.Thread(target=self._write, args=(key, background), daemon=True).start()
+
+    def _write(self, key, background):
+        level = self.brightness(background)
+        bucket = str(int(level // self.bucket_size))
+        filename = f"{key}_{bucket}.png"
+        try:
+            os.makedirs(self.directory, exist_ok=True)
+            cv2.imwrite(os.path.join(self.directory, filename), background)
+            with self._lock:
+                self._index.setdefault(key, {})[bucket] = {
+                    'file': filename, 'brightness': level, 'saved_at': time.time(),
+                }
+                self._images[filename] = background
+                tmp_path = self.index_path + ".tmp"
+                with open(tmp_path, 'w', encoding='utf-8') as f:
+                    json.dump(self._index, f, indent=2)
+                os.replace(tmp_path, self.index_path)
+        except OSError as e:
+            print(f"⚠️ 背景画像の保存に失敗しました: {e}")
@@ -0,0 +1,333 @@
+#!/usr/bin/env python3
+"""
+カメラキャプチャサブシステム
+- カメラ1台につき1スレッドで cv2.VideoCapture を読み続ける
+- 最新フレームとキャプチャ時刻をロック付きリングバッファへ公開（メインループはI/Oで待たない）
+- キャプチャ時刻は grab() 直後に単調増加クロック（capture_clock）で取得
+- 未読のまま上書きされたフレーム（dropped）と同一フレームの再取得（stale）をカウント
+- on_frame フックで新フレーム到着を通知（待ち受けスレッドなしでワーカープールへ処理を割り当てる）
+- 同期キャプチャ（SynchronizedCapture）：1スレッドで全カメラを続けて grab() してから必要な分だけ retrieve()
+  （俯瞰とスタートラインの組を同じ瞬間から作る・使わないフレームはデコードしない）
+- 入力が FrameSource（frame_sources）なら、公開したフレームの配列は新しいフレームが retain 枚届いた時点で
+  release_buffer() で入力のプールへ返す（次のデコード先として再利用）
+  → 公開したフレームは retain 枚先まで上書きされない。使い終わった時点で holds() を確認し、それより長く保持する場合はコピーすること
+"""
+
+import threading
+import time
+from collections import deque, namedtuple
+
+# ラップ計測と共通の単調増加クロック（Windowsでも高分解能なperf_counterを使用）
+capture_clock = time.perf_counter
+
+# frame: BGR画像, timestamp: キャプチャ時刻（capture_clock）, frame_id: カメラごとの連番（1始まり）
+CapturedFrame = namedtuple('CapturedFrame', ['frame', 'timestamp', 'frame_id'])
+
+# 同期キャプチャの1周期分の組：frames はカメラ名 → CapturedFrame、timestamp は grab 時刻の平均、skew はカメラ間の時刻差
+SyncedFrames = namedtuple('SyncedFrames', ['frames', 'timestamp', 'skew'])
+
+
+class CaptureBuffer:
+    """直近フレームのリングと読み出し・統計（キャプチャ方式に共通）"""
+
+    def __init__(self, name, buffer_size=2, capture=None):
+        self.camera_name = name
+        self.capture = capture
+        self._frames = deque(maxlen=max(1, buffer_size))  # 直近フレームのリング
+        # デコード先の配列を入力へ返す（FrameSource のみ：cv2.VideoCapture は毎回新しい配列）
+        self._release_buffer = getattr(capture, 'release_buffer', None)
+        self.retain = max(1, buffer_size, getattr(capture, 'retain_frames', 0))
+        self._held = deque()  # 返却待ちの配列（キャプチャスレッドのみが触る）
+        self._lock = threading.Lock()
+        self._new_frame = threading.Condition(self._lock)  # 新フレーム到着通知
+        self._last_read_id = 0
+
+        # 統計カウンタ
+        self.frame_count = 0  # 取得成功したフレーム数
+        self.dropped_frames = 0  # 一度も読まれずに新しいフレームに置き換わった数
+        self.stale_frames = 0  # 新フレームが無く前回と同じフレームを返した回数
+        self.read_failures = 0  # grab()/retrieve() 失敗回数
+        self._started_at = None
+        self.stage_timer = None  # 計測用フック: stage_timer(ステージ名, 秒)
+        self.on_frame = None  # 新フレーム通知フック（ロック外で呼ぶ：複数トラックのスケジューラ用）
+
+    def publish(self, frame, timestamp):
+        """デコード済みフレームをリングへ追加して待機側・on_frame へ通知"""
+        captured = self.append(frame, timestamp)
+        self.notify()
+        return captured
+
+    def append(self, frame, timestamp):
+        """リングへ追加のみ（通知は notify：同期キャプチャは組を記録してから通知する）"""
+        with self._lock:
+            self.frame_count += 1
+            captured = CapturedFrame(frame, timestamp, self.frame_count)
+            self._frames.append(captured)
+        if self._release_buffer is not None:
+            self._held.append(frame)
+            if len(self._held) > self.retain:
+                self._release_buffer(self._held.popleft())
+        return captured
+
+    def holds(self, captured):
+        """captured の配列がまだ上書きされていないか（retain 枚より古いフレームは再利用されている）"""
+        return self._release_buffer is None or captured.frame_id > self.frame_count - self.retain
+
+    def notify(self):
+        with self._lock:
+            self._new_frame.notify_all()
+        if self.on_frame is not None:
+            self.on_frame()
+
+    def read_latest(self):
+        """最新フレームを取得（ブロックしない）
+
+        戻り値: (CapturedFrame または None, 新しいフレームかどうか)
+        """
+        with self._lock:
+            return self._consume_latest()
+
+    def wait_for_frame(self, timeout=0.05):
+        """未読フレームが届くまで最大timeout秒待って取得（検出スレッド用）"""
+        with self._lock:
+            if not self._frames or self._frames[-1].frame_id == self._last_read_id:
+                self._new_frame.wait(timeout)
+            return self._consume_latest()
+
+    def peek_latest(self):
+        """最新フレームを参照のみ（統計を変えない：表示用の2次利用者向け）
+
+        配列は retain 枚先まで有効：使い終わった時点（または使う前）に holds() で確認すること
+        """
+        with self._lock:
+            return self._frames[-1] if self._frames else None
+
+    def _consume_latest(self):
+        """ロック取得済みで呼ぶこと"""
+        if not self._frames:
+            return None, False
+        latest = self._frames[-1]
+        if latest.frame_id == self._last_read_id:
+            self.stale_frames += 1
+            return latest, False
+        self.dropped_frames += latest.frame_id - self._last_read_id - 1
+        self._last_read_id = latest.frame_id
+        return latest, True
+
+    def recent_frames(self):
+        """リング内の直近フレーム一覧（古い順）"""
+        with self._lock:
+            return list(self._frames)
+
+    def get_stats(self):
+        """キャプチャ統計"""
+        elapsed = capture_clock() - self._started_at if self._started_at else 0.0
+        with self._lock:
+            return {
+                'camera': self.camera_name,
+                'frames': self.frame_count,
+                'dropped': self.dropped_frames,
+                'stale': self.stale_frames,
+                'read_failures': self.read_failures,
+                'fps': self.frame_count / elapsed if elapsed > 0 else 0.0,
+            }
+
+    def demand(self, frames=1):
+        """表示側のデコード要求（全フレームをデコードする方式では何もしない）"""
+
+    def wake(self):
+        """待機中の wait_for_frame を起こす（停止時）"""
+        with self._lock:
+            self._new_frame.notify_all()
+
+
+class CameraCaptureWorker(CaptureBuffer, threading.Thread):
+    """カメラ1台分のキャプチャスレッド"""
+
+    def __init__(self, capture, name, buffer_size=2):
+        CaptureBuffer.__init__(self, name, buffer_size, capture)
+        threading.Thread.__init__(self, name=f"capture-{name}", daemon=True)
+        self._stop_event = threading.Event()
+
+    def run(self):
+        self._started_at = capture_clock()
+        while not self._stop_event.is_set():
+            # grab() で露光済みフレームを確保した時刻を記録し、デコードはその後
+            t0 = capture_clock()
+            ret = self.capture.grab()
+            timestamp = capture_clock()
+            frame = None
+            if ret:
+                ret, frame = self.capture.retrieve()
+            if self.stage_timer is not None:
+                self.stage_timer(f'grab_{self.camera_name}', timestamp - t0)
+                self.stage_timer(f'retrieve_{self.camera_name}', capture_clock() - timestamp)
+            if not ret or frame is None:
+                self.read_failures += 1
+                self._stop_event.wait(0.01)  # 切断時のビジーループ防止
+                continue
+            self.publish(frame, timestamp)
+
+    def stop(self, timeout=1.0):
+        """スレッド停止（read() の完了を待ってから戻る）"""
+        self._stop_event.set()
+        self.wake()
+        if self.is_alive():
+            self.join(timeout)
+
+
+class SyncedCameraView(CaptureBuffer):
+    """同期キャプチャ内のカメラ1台分（CameraCaptureWorker と同じ読み出しインターフェース）
+
+    デコードするのは needed() が真のとき、または表示側が demand() で要求した次のフレームだけ
+    （read_latest/peek_latest の参照ではデコードを要求しない）
+    """
+
+    def __init__(self, group, capture, name, buffer_size=2):
+        super().__init__(name, buffer_size, capture)
+        self.group = group
+        self.needed = None  # 必要判定フック（エンジンのループ状態から）
+        self.skipped_decodes = 0  # grab のみでデコードしなかったフレーム数
+        self._demanded = 0  # 表示側が要求した残りデコード枚数
+
+    def demand(self, frames=1):
+        """表示側の要求：次に grab するフレームから frames 枚をデコード対象にする（プレビュー更新時だけ呼ぶ）"""
+        self._demanded = max(self._demanded, frames)
+
+    def wanted(self):
+        if self._demanded > 0:
+            self._demanded -= 1
+            return True
+        needed = self.needed
+        return needed is not None and needed()
+
+    def get_stats(self):
+        stats = super().get_stats()
+        stats['skipped'] = self.skipped_decodes
+        return stats
+
+    def stop(self, timeout=1.0):
+        self.group.stop(timeout)
+
+
+class SynchronizedCapture(threading.Thread):
+    """複数カメラを1スレッドで同期キャプチャ
+
+    1周期: 全カメラの grab() を続けて発行（露光の取得時刻を揃える）→ 必要なカメラだけ retrieve()
+    全カメラがデコードされカメラ間の時刻差が tolerance 以内の周期は組（SyncedFrames）として保持
+    """
+
+    def __init__(self, captures, tolerance=0.02, buffer_size=2, history=8):
+        super().__init__(name="capture-sync", daemon=True)
+        self.views = {name: SyncedCameraView(self, capture, name, buffer_size) for name, capture in captures}
+        self.tolerance = tolerance  # 組として扱うカメラ間の時刻差の上限（秒）
+        self._synced = deque(maxlen=max(1, history))
+        self._lock = threading.Lock()
+        self._stop_event = threading.Event()
+        self.stage_timer = None  # 計測用フック: stage_timer(ステージ名, 秒)
+
+        # 統計カウンタ
+        self.cycles = 0
+        self.synced_cycles = 0
+        self.misaligned = 0  # 全カメラ揃ったが時刻差が許容外だった周期
+        self.max_skew = 0.0
+
+    def run(self):
+        started = capture_clock()
+        for view in self.views.values():
+            view._started_at = started
+        while not self._stop_event.is_set():
+            grabbed = self._grab_all()
+            if not grabbed:
+                self._stop_event.wait(0.01)  # 切断時のビジーループ防止
+                continue
+            decoded = {}
+            for view, timestamp in grabbed:
+                if not view.wanted():
+                    view.skipped_decodes += 1
+                    continue
+                t0 = capture_clock()
+                ret, frame = view.capture.retrieve()
+                if self.stage_timer is not None:
+                    self.stage_timer(f'retrieve_{view.camera_name}', capture_clock() - t0)
+                if not ret or frame is None:
+                    view.read_failures += 1
+                    continue
+                decoded[view.camera_name] = view.append(frame, timestamp)
+            self._record_cycle(decoded)
+            for name in decoded:
+                self.views[name].notify()
+
+    def _grab_all(self):
+        """全カメラの grab() を間を空けずに発行 → [(view, grab時刻)]"""
+        grabbed = []
+        t0 = capture_clock()
+        for view in self.views.values():
+            ret = view.capture.grab()
+            timestamp = capture_clock()
+            if self.stage_timer is not None:
+                self.stage_timer(f'grab_{view.camera_name}', timestamp - t0)
+            t0 = timestamp
+            if ret:
+                grabbed.append((view, timestamp))
+            else:
+                view.read_failures += 1
+        return grabbed
+
+    def _record_cycle(self, decoded):
+        with self._lock:
+            self.cycles += 1
+            if len(decoded) < len(self.views):
+                return
+            times = [captured.timestamp for captured in decoded.values()]
+            skew = max(times) - min(times)
+            self.max_skew = max(self.max_skew, skew)
+            if skew > self.tolerance:
+                self.misaligned += 1
+                return
+            self.synced_cycles += 1
+            self._synced.append(SyncedFrames(decoded, sum(times) / len(times), skew))
+
+    def demand(self, frames=1):
+        """全カメラの次のフレームをデコード対象にする（表示用の組を作る）"""
+        for view in self.views.values():
+            view.demand(frames)
+
+    def _valid_pairs(self):
+        """配列がまだ再利用されていない組（ロック取得済みで呼ぶこと）"""
+        return [synced for synced in self._synced
+                if all(self.views[name].holds(captured) for name, captured in synced.frames.items())]
+
+    def latest_pair(self):
+        """最新の同期した組（参照のみ：組を作るには demand() で要求する）"""
+        with self._lock:
+            pairs = self._valid_pairs()
+        return pairs[-1] if pairs else None
+
+    def pair_near(self, timestamp, max_distance=None):
+        """timestamp に最も近い同期した組（max_distance 秒より離れていれば None）"""
+        with self._lock:
+            pairs = self._valid_pairs()
+        if not pairs:
+            return None
+        pair = min(pairs, key=lambda synced: abs(synced.timestamp - timestamp))
+        if max_distance is not None and abs(pair.timestamp - timestamp) > max_distance:
+            return None
+        return pair
+
+    def get_stats(self):
+        with self._lock:
+            return {
+                'cycles': self.cycles,
+                'synced': self.synced_cycles,
+                'misaligned': self.misaligned,
+                'max_skew': self.max_skew,
+            }
+
+    def stop(self, timeout=1.0):
+        """スレッド停止（複数のビューから呼ばれても1回だけ待つ）"""
+        self._stop_event.set()
+        for view in self.views.values():
+            view.wake()
+        if self.is_alive() and threading.current_thread() is not self:
+            self.join(timeout)
@@ -0,0 +1,127 @@
+#!/usr/bin/env python3
+"""
+カメラの高速検出
+- 候補インデックスを並列に開く（存在しないデバイスの待ち時間が台数分積み重ならない）
+- 1台ごとにタイムアウト：期限までに開けなかったデバイスは「なし」扱い（遅れて開いた場合はそのスレッドが解放）
+- 前回使えたインデックス一覧（inventory）を保存し、次回はまずそれだけを開く
+  （全台開ければ残りの候補は試さない：存在しないデバイスの検出待ちを毎回払わない）
+- 開いたハンドルはそのまま返す：閉じて開き直す二度手間をしない
+- ハンドルは DeviceSource（VideoCapture 互換・確保済みバッファへデコード）
+"""
+
+import json
+import os
+import threading
+import time
+
+from frame_sources import DeviceSource
+
+
+class CameraProbe:
+    """並列オープン＋前回構成のキャッシュによるカメラ検出"""
+
+    def __init__(self, settings=None):
+        settings = settings or {}
+        self.max_index = max(1, settings.get("probe_max_index", 4))  # 0..max_index-1 を試す
+        self.timeout = settings.get("probe_timeout", 3.0)  # 1台あたりのオープン待ち（秒）
+        self.inventory_path = settings.get("inventory_file", "data/camera_inventory.json")
+        self.pool_size = settings.get("buffer_pool_size", 8)
+
+    # ------------------------------------------------------------------
+    # 前回構成
+    # ------------------------------------------------------------------
+    def load_inventory(self):
+        if not self.inventory_path:
+            return []
+        try:
+            with open(self.inventory_path, 'r', encoding='utf-8') as f:
+                return [int(i) for i in json.load(f).get("available", [])]
+        except (OSError, ValueError, TypeError, AttributeError):
+            return []
+
+    def save_inventory(self, indices):
+        if not self.inventory_path:
+            return
+        try:
+            os.makedirs(os.path.dirname(self.inventory_path) or '.', exist_ok=True)
+            tmp_path = self.inventory_path + ".tmp"
+            with open(tmp_path, 'w', encoding='utf-8') as f:
+                json.dump({'available': sorted(indices), 'saved_at': time.time()}, f, indent=2)
+            os.replace(tmp_path, self.inventory_path)
+        except OSError as e:
+            print(f"⚠️ カメラ構成の保存に失敗しました: {e}")
+
+    # ------------------------------------------------------------------
+    # 並列オープン
+    # ------------------------------------------------------------------
+    def open_parallel(self, indices):
+        """indices を同時に開き、期限内に開けたものを {index: DeviceSource} で返す"""
+        results = {}
+        lock = threading.Lock()
+        state = {'expired': False}
+
+        def open_one(index):
+            capture = DeviceSource(index, self.pool_size)
+            if not capture.isOpened():
+                capture.release()
+                return
+            with lock:
+                if not state['expired']:
+                    results[index] = capture
+                    return
+            capture.release()  # 期限切れ後に開いた：使わない
+
+        threads = [threading.Thread(target=open_one, args=(i,), name=f"camera-probe-{i}", daemon=True)
+                   for i in indices]
+        for thread in threads:
+            thread.start()
+        deadline = time.perf_counter() + self.timeout
+        for thread in threads:
+            thread.join(max(0.0, deadline - time.perf_counter()))
+        with lock:
+            state['expired'] = True
+            return dict(results)
+
+    def probe(self, keep_open=True):
+        """利用可能なカメラ {index: DeviceSource}（keep_open=False なら解放して index → None）"""
+        started = time.perf_counter()
+        inventory = self.load_inventory()
+        opened = self.open_parallel(inventory) if inventory else {}
+        if not inventory or len(opened) < len(inventory):
+            # 前回構成なし・構成が変わった：全候補を検出し直して保存
+            rest = [i for i in range(self.max_index) if i not in opened]
+            opened.update(self.open_parallel(rest))
+            self.save_inventory(list(opened))
+            source = "全候補"
+        else:
+            source = "前回構成"
+        for index in sorted(opened):
+            print(f"🔍 カメラインデックス {index} が利用可能")
+        print(f"⏱️ カメラ検出 {(time.perf_counter() - started) * 1000:.0f}ms（{source}）")
+        if not keep_open:
+            for capture in opened.values():
+                capture.release()
+            return {index: None for index in opened}
+        return opened
+
+
+def assign_cameras(available, overview_index, startline_index):
+    """設定のインデックスを優先して (overview, start_line) を割り当て
+
+    設定のカメラがない・2つが同じインデックスの場合は、利用可能な順に別のカメラを使う
+    """
+    ordered = sorted(available)
+    overview = overview_index if overview_index in available else (ordered[0] if ordered else None)
+    others = [i for i in ordered if i != overview]
+    if startline_index in others:
+        start_line = startline_index
+    else:
+        start_line = others[0] if others else None
+    return overview, start_line
+
+
+def release_unused(captures, *used):
+    """割り当てなかったハンドルを解放"""
+    for index, capture in captures.items():
+        if index not in used and capture is not None:
+            capture.release()
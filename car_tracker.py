@@ -0,0 +1,247 @@
+#!/usr/bin/env python3
+"""
+スタートライン複数車両トラッカー
+- MOG2の前景マスク1枚から連結成分（ブロブ）を一括抽出し、重心追跡で帯内の通過を追う
+- 色（ブロブ内平均BGR）と大きさ（通過中の最大面積）を車両シグネチャとして周回をまたいだ同一性を判定
+- 車両ごとにラップカウンタ・ラップタイム・クールダウンを持つ（N台でもMOG2は1回）
+- ラップタイムは直近 lap_history 周だけ保持し、ベスト等は逐次統計（練習走行でもメモリ一定）
+"""
+
+from collections import deque
+
+import cv2
+import numpy as np
+
+from lap_stats import LapStats
+
+
+class TrackedCar:
+    """周回をまたいで同一と判定された車両"""
+
+    def __init__(self, car_id, color, area, lap_history=None, recent_laps=5):
+        self.car_id = car_id
+        self.color = np.array(color, dtype=np.float64)  # 平均BGR
+        self.area = float(area)  # 帯内の最大面積
+        self.lap_count = 0
+        self.lap_times = deque(maxlen=lap_history)
+        self.stats = LapStats(recent_laps)
+        self.current_lap_start = None
+        self.start_time = None
+        self.last_crossing_time = None
+        self.claimed_at = None  # トラッカーが最後にこの車両と判定した時刻
+        self.finished = False
+
+    @property
+    def best_lap(self):
+        return self.stats.best
+
+    def update_signature(self, color, area, alpha=0.3):
+        """照明変化に追従するため指数移動平均で更新"""
+        self.color = (1 - alpha) * self.color + alpha * np.asarray(color, dtype=np.float64)
+        self.area = (1 - alpha) * self.area + alpha * float(area)
+
+    def record_crossing(self, crossing_time, max_laps, cooldown):
+        """スタートライン通過を記録（戻り値: 'start'/'lap'/'finish'/None）"""
+        if self.finished:
+            return None
+        if self.last_crossing_time is not None and crossing_time - self.last_crossing_time < cooldown:
+            return None
+        self.last_crossing_time = crossing_time
+
+        if self.current_lap_start is None:
+            self.start_time = crossing_time
+            self.current_lap_start = crossing_time
+            return 'start'
+
+        self.lap_times.append(crossing_time - self.current_lap_start)
+        self.lap_count += 1
+        self.stats.add(self.lap_times[-1], self.lap_count)
+        self.current_lap_start = crossing_time
+        if max_laps and self.lap_count >= max_laps:
+            self.finished = True
+            return 'finish'
+        return 'lap'
+
+    def shift_times(self, offset):
+        """一時停止時間を計測から除外"""
+        if self.current_lap_start is not None:
+            self.current_lap_start += offset
+        if self.last_crossing_time is not None:
+            self.last_crossing_time += offset
+        if self.claimed_at is not None:
+            self.claimed_at += offset
+
+
+class _BlobTrack:
+    """帯内を通過中のブロブ（1回の通過ごとの短期トラック）"""
+
+    def __init__(self, centroid, area, color, distance, timestamp):
+        self.centroid = centroid
+        self.max_area = area
+        self.color_sum = np.array(color, dtype=np.float64)
+        self.samples = 1
+        self.distance = distance
+        self.last_seen = timestamp
+        self.crossed = False
+        self.car = None
+
+    @property
+    def color(self):
+        return self.color_sum / self.samples
+
+    def update(self, centroid, area, color, distance, timestamp):
+        self.centroid = centroid
+        self.max_area = max(self.max_area, area)
+        self.color_sum += color
+        self.samples += 1
+        self.distance = distance
+        self.last_seen = timestamp
+
+
+class CarTracker:
+    """前景マスク1枚から全車両の通過を検出"""
+
+    def __init__(self, settings, tripwire, frame_size, lap_history=None, recent_laps=5):
+        self.settings = settings
+        self.tripwire = tripwire
+        self.frame_size = frame_size
+        self.lap_history = lap_history  # 車両ごとに保持するラップ数（None: 全周回）
+        self.recent_laps = recent_laps
+        self.base_min_blob_area = settings.get("min_blob_area", 400)  # 全画面基準
+        self.max_match_distance = settings.get("max_match_distance", 80)
+        self.max_missing_time = settings.get("max_missing_time", 0.3)
+        self.color_tolerance = settings.get("signature_color_tolerance", 40)
+        self.area_tolerance = settings.get("signature_area_tolerance", 0.5)
+        self.tracks = []
+        self.cars = {}
+        self._next_car_id = 1
+
+    def reset(self):
+        self.tracks = []
+        self.cars = {}
+        self._next_car_id = 1
+
+    def _signed_distance(self, point):
+        """通過判定用の符号付き距離（線：左右、多角形：内側が正）"""
+        if self.tripwire is None:
+            return point[0] - self.frame_size[0] / 2.0  # 未設定時は画面中央の縦線
+        if self.tripwire.is_line:
+            (x0, y0), (x1, y1) = self.tripwire.points
+            length = max(1e-6, np.hypot(x1 - x0, y1 - y0))
+            return float(((x1 - x0) * (point[1] - y0) - (y1 - y0) * (point[0] - x0)) / length)
+        polygon = np.array(self.tripwire.points, dtype=np.float32)
+        return cv2.pointPolygonTest(polygon, (float(point[0]), float(point[1])), True)
+
+    def _extract_blobs(self, fg_mask, roi_bgr, origin, scale=1):
+        """連結成分を一括抽出し、ブロブごとの重心・面積・平均色を返す
+
+        scale: 縮小した前景マスクの1画素がフレーム上で何画素分か（面積・座標はフレーム基準で返す）
+        """
+        count, labels, stats, centroids = cv2.connectedComponentsWithStats(fg_mask, connectivity=8)
+        if count <= 1:
+            return []
+        # 全画面基準→帯面積換算（fit_frameでの再構築に追従）
+        area_scale = self.tripwire.area_scale if self.tripwire is not None else 1.0
+        areas = stats[1:, cv2.CC_STAT_AREA] * (scale * scale)
+        valid = np.nonzero(areas >= self.base_min_blob_area * area_scale)[0] + 1
+        if len(valid) == 0:
+            return []
+
+        # ラベル画像1パスで全ブロブのチャンネル和を集計
+        flat_labels = labels.ravel()
+        color_sums = np.stack([
+            np.bincount(flat_labels, weights=roi_bgr[:, :, c].ravel(), minlength=count)
+            for c in range(3)
+        ], axis=1)
+
+        blobs = []
+        for label in valid:
+            pixels = float(stats[label, cv2.CC_STAT_AREA])
+            centroid = (centroids[label][0] * scale + origin[0], centroids[label][1] * scale + origin[1])
+            blobs.append((centroid, pixels * scale * scale, color_sums[label] / pixels))
+        return blobs
+
+    def _identify(self, track, crossing_time, cooldown):
+        """シグネチャで既知車両と照合（該当なしなら新規登録）"""
+        best, best_score = None, None
+        for car in self.cars.values():
+            if car.claimed_at is not None and abs(crossing_time - car.claimed_at) < cooldown:
+                continue  # 直前に通過した車両とは別車両
+            color_distance = np.linalg.norm(car.color - track.color)
+            area_ratio = abs(track.max_area - car.area) / max(car.area, 1.0)
+            if color_distance > self.color_tolerance or area_ratio > self.area_tolerance:
+                continue
+            score = color_distance / self.color_tolerance + area_ratio / self.area_tolerance
+            if best_score is None or score < best_score:
+                best, best_score = car, score
+
+        if best is None:
+            best = TrackedCar(self._next_car_id, track.color, track.max_area,
+                              self.lap_history, self.recent_laps)
+            self.cars[best.car_id] = best
+            self._next_car_id += 1
+        else:
+            best.update_signature(track.color, track.max_area)
+        best.claimed_at = crossing_time
+        return best
+
+    def update(self, fg_mask, roi_bgr, origin, timestamp, prev_timestamp, cooldown, scale=1):
+        """1フレーム分の追跡更新
+
+        fg_mask/roi_bgr: 帯のバウンディング矩形内の前景マスクとBGR画像（同じ解像度）
+        origin: 矩形の左上（フレーム座標）
+        scale: 検出解像度の縮小率（pyrDown 1回で2）
+        戻り値: [(TrackedCar, 補間した通過時刻)]
+        """
+        blobs = self._extract_blobs(fg_mask, roi_bgr, origin, scale)
+
+        # 重心距離の近い順に既存トラックへ割り当て
+        candidates = sorted(
+            (np.hypot(c[0] - t.centroid[0], c[1] - t.centroid[1]), bi, ti)
+            for bi, (c, _, _) in enumerate(blobs) for ti, t in enumerate(self.tracks)
+        )
+        matched_blobs, matched_tracks = set(), set()
+        crossings = []
+        born_tolerance = (self.tripwire.band_width / 4.0) if self.tripwire is not None and self.tripwire.is_line else 0.0
+
+        for distance, bi, ti in candidates:
+            if distance > self.max_match_distance:
+                break
+            if bi in matched_blobs or ti in matched_tracks:
+                continue
+            matched_blobs.add(bi)
+            matched_tracks.add(ti)
+            track = self.tracks[ti]
+            centroid, area, color = blobs[bi]
+            prev_distance = track.distance
+            new_distance = self._signed_distance(centroid)
+            track.update(centroid, area, color, new_distance, timestamp)
+
+            # 符号が変わった（線上に達した）フレームで通過：距離で線形補間
+            if not track.crossed and (prev_distance < 0 <= new_distance or prev_distance > 0 >= new_distance):
+                ratio = abs(prev_distance) / max(abs(prev_distance - new_distance), 1e-6)
+                crossing_time = prev_timestamp + ratio * (timestamp - prev_timestamp) if prev_timestamp is not None else timestamp
+                track.crossed = True
+                track.car = self._identify(track, crossing_time, cooldown)
+                crossings.append((track.car, float(crossing_time)))
+
+        # 新規トラック（帯に入ってきたブロブ）
+        for bi, (centroid, area, color) in enumerate(blobs):
+            if bi in matched_blobs:
+                continue
+            distance = self._signed_distance(centroid)
+            track = _BlobTrack(centroid, area, color, distance, timestamp)
+            # 初出現時にすでに線上（高速通過）なら出現時刻を通過時刻とする
+            if abs(distance) <= born_tolerance or (self.tripwire is not None and not self.tripwire.is_line and distance >= 0):
+                track.crossed = True
+                track.car = self._identify(track, timestamp, cooldown)
+                crossings.append((track.car, timestamp))
+            self.tracks.append(track)
+
+        # 見失ったトラックを破棄
+        self.tracks = [t for t in self.tracks if timestamp - t.last_seen <= self.max_missing_time]
+        return crossings
+
+    def shift_times(self, offset):
+        for car in self.cars.values():
+            car.shift_times(offset)
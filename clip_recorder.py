@@ -0,0 +1,230 @@
+#!/usr/bin/env python3
+"""
+通過前後の映像クリップ保存（ラップ判定の確認用）
+- スタートライン映像を固定長のリング（起動時に1回だけ確保、容量は clip_settings.max_memory_mb で上限）へコピー
+- 検出（process_detection）ごとに通過時刻の前 pre_frames・後 post_frames のクリップを予約
+  後側のフレームが揃った時点でエンコーダースレッドへ渡す（検出スレッドはエンコード・ディスク書き込みで待たない）
+- エンコーダーはリングから1フレームずつ取り出して書き込む：スロットごとの番号で上書き済みを判定（ロック不要）
+  書き込みが追いつかず上書きされたフレームは飛ばして数える（検出フレームは決して落とさない）
+- クリップと一緒に各フレームの通過時刻からの相対時刻を JSON で保存
+- バックログ（未保存のクリップ・フレーム数、リングの余裕）を stats() で公開
+"""
+
+import json
+import os
+import queue
+import threading
+import time
+
+import cv2
+import numpy as np
+
+
+class ClipRecorder:
+    """スタートライン映像のリングと非同期クリップ書き出し"""
+
+    def __init__(self, settings):
+        settings = settings or {}
+        self.enabled = settings.get("enabled", False)
+        self.directory = settings.get("directory", "clips")
+        self.pre_frames = max(1, settings.get("pre_frames", 45))
+        self.post_frames = max(1, settings.get("post_frames", 45))
+        self.max_memory = settings.get("max_memory_mb", 128) * 1024 * 1024
+        self.max_pending = max(1, settings.get("max_pending_clips", 8))
+        self.codec = settings.get("codec", "MJPG")
+        self.extension = settings.get("extension", ".avi")
+
+        self._lock = threading.Lock()
+        self._frames = None  # リング本体 (slots, h, w, c)：最初のフレームで確保
+        self._seqs = None  # スロットごとのフレーム番号（書き込み中は -1）
+        self._times = None
+        self.slots = 0
+        self.newest = 0  # 最後に書き込んだフレーム番号（1始まり）
+        self._waiting = []  # 後側のフレーム待ちのクリップ
+        self._jobs = queue.Queue()
+        self._writing = None  # エンコード中のクリップ
+        self._thread = None
+
+        # 統計カウンタ
+        self.saved_clips = 0
+        self.dropped_clips = 0  # 未保存が max_pending_clips を超えて捨てたクリップ
+        self.overrun_frames = 0  # 書き込み前にリングで上書きされたフレーム
+
+    # ------------------------------------------------------------------
+    # 検出スレッド側
+    # ------------------------------------------------------------------
+    def _allocate(self, frame):
+        frame_bytes = frame.nbytes
+        self.slots = max(4, int(self.max_memory // frame_bytes))
+        usable = self.slots - max(1, self.slots // 4)  # 残りはエンコーダーが読み終えるまでの余裕
+        if usable < self.pre_frames + self.post_frames + 1:
+            # 上限内に収まるよう前後のフレーム数を比例配分で縮める
+            total = self.pre_frames + self.post_frames
+            self.pre_frames = max(1, (usable - 1) * self.pre_frames // total)
+            self.post_frames = max(1, usable - 1 - self.pre_frames)
+            print(f"⚠️ クリップ用メモリ上限のため前後 {self.pre_frames}/{self.post_frames} フレームに縮小")
+        self._frames = np.empty((self.slots,) + frame.shape, dtype=frame.dtype)
+        self._seqs = np.zeros(self.slots, dtype=np.int64)
+        self._times = np.zeros(self.slots, dtype=np.float64)
+        self.newest = 0
+        print(f"🎞️ クリップ用リング {self.slots}フレーム（{self._frames.nbytes / 1024 / 1024:.0f}MB）")
+
+    def push(self, captured):
+        """新フレームをリングへコピー（検出スレッドから毎フレーム）"""
+        if not self.enabled:
+            return
+        frame = captured.frame
+        if self._frames is None or self._frames.shape[1:] != frame.shape:
+            with self._lock:
+                self._waiting = []  # サイズが変わった：以前のフレームは使えない
+            self._allocate(frame)
+        seq = self.newest + 1
+        slot = seq % self.slots
+        self._seqs[slot] = -1
+        self._frames[slot] = frame
+        self._times[slot] = captured.timestamp
+        self._seqs[slot] = seq
+        self.newest = seq
+        if self._waiting:
+            self._release_ready()
+
+    def trigger(self, crossing_time, label):
+        """通過時刻の前後のクリップを予約（後側のフレームが揃ったらエンコーダーへ）"""
+        if not self.enabled or self._frames is None:
+            return
+        # 通過時刻以前の最後のフレーム（補間した通過時刻は検出フレームより前）
+        crossing_seq = self.newest
+        oldest = max(1, self.newest - self.slots + 1)
+        while crossing_seq > oldest and self._times[crossing_seq % self.slots] > crossing_time:
+            crossing_seq -= 1
+        job = {
+            'label': label,
+            'crossing_time': crossing_time,
+            'first': max(oldest, crossing_seq - self.pre_frames + 1),
+            'last': crossing_seq + self.post_frames,
+        }
+        with self._lock:
+            if len(self._waiting) + self._jobs.qsize() >= self.max_pending:
+                self.dropped_clips += 1
+                print(f"⚠️ クリップ保存が追いつかないため {label} を破棄")
+                return
+            self._waiting.append(job)
+        self._start_writer()
+        self._release_ready()
+
+    def _release_ready(self):
+        with self._lock:
+            ready = [job for job in self._waiting if job['last'] <= self.newest]
+            if not ready:
+                return
+            self._waiting = [job for job in self._waiting if job['last'] > self.newest]
+        for job in ready:
+            self._jobs.put(job)
+
+    # ------------------------------------------------------------------
+    # エンコーダースレッド
+    # ------------------------------------------------------------------
+    def _start_writer(self):
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._writer_loop, name="clip-writer", daemon=True)
+            self._thread.start()
+
+    def read_frame(self, seq):
+        """リングから1フレームをコピー（上書き済み・書き込み中なら None）"""
+        slot = seq % self.slots
+        if self._seqs[slot] != seq:
+            return None, None
+        frame = self._frames[slot].copy()
+        timestamp = float(self._times[slot])
+        if self._seqs[slot] != seq:
+            return None, None  # コピー中に上書きされた
+        return frame, timestamp
+
+    def _writer_loop(self):
+        while True:
+            job = self._jobs.get()
+            if job is None:
+                return
+            self._writing = job
+            try:
+                self._write_clip(job)
+            except (OSError, cv2.error) as e:
+                print(f"⚠️ クリップ保存に失敗しました: {e}")
+            finally:
+                self._writing = None
+
+    def _write_clip(self, job):
+        os.makedirs(self.directory, exist_ok=True)
+        base = os.path.join(self.directory, f"{time.strftime('%Y%m%d-%H%M%S')}_{job['label']}")
+        writer = None
+        offsets = []
+        fps = 30.0
+        try:
+            for seq in range(job['first'], min(job['last'], self.newest) + 1):
+                frame, timestamp = self.read_frame(seq)
+                if frame is None:
+                    self.overrun_frames += 1
+                    continue
+                if writer is None:
+                    fps = self._estimate_fps(job['first'], job['last'])
+                    height, width = frame.shape[:2]
+                    writer = cv2.VideoWriter(base + self.extension, cv2.VideoWriter_fourcc(*self.codec), fps,
+                                             (width, height), len(frame.shape) == 3)
+                writer.write(frame)
+                offsets.append(round(timestamp - job['crossing_time'], 4))
+        finally:
+            if writer is not None:
+                writer.release()
+        if not offsets:
+            return
+        with open(base + ".json", 'w', encoding='utf-8') as f:
+            json.dump({'label': job['label'], 'fps': fps, 'frame_offsets': offsets}, f)
+        self.saved_clips += 1
+
+    def _estimate_fps(self, first, last):
+        """クリップ範囲のフレーム間隔の中央値から再生レート"""
+        times = [self._times[seq % self.slots] for seq in range(first, min(last, self.newest) + 1)
+                 if self._seqs[seq % self.slots] == seq]
+        if len(times) < 2:
+            return 30.0
+        interval = float(np.median(np.diff(times)))
+        return min(120.0, 1.0 / interval) if interval > 0 else 30.0
+
+    # ------------------------------------------------------------------
+    # 統計・終了
+    # ------------------------------------------------------------------
+    def stats(self):
+        """バックログ：未保存クリップ・フレーム数とリングの余裕（上書きまでのフレーム数）"""
+        with self._lock:
+            pending = list(self._waiting)
+        with self._jobs.mutex:
+            pending.extend(job for job in self._jobs.queue if job is not None)
+        writing = self._writing
+        if writing is not None:
+            pending.append(writing)
+        pending_frames = sum(max(0, job['last'] - job['first'] + 1) for job in pending)
+        headroom = self.slots
+        if pending:
+            oldest = min(job['first'] for job in pending)
+            headroom = self.slots - (self.newest - oldest + 1)
+        return {
+            'pending_clips': len(pending),
+            'pending_frames': pending_frames,
+            'ring_headroom': headroom,
+            'saved': self.saved_clips,
+            'dropped': self.dropped_clips,
+            'overrun_frames': self.overrun_frames,
+            'memory_mb': self._frames.nbytes / 1024 / 1024 if self._frames is not None else 0.0,
+        }
+
+    def close(self, timeout=5.0):
+        """後側が揃っていないクリップも含めて書き出してから停止"""
+        if self._thread is None:
+            return
+        with self._lock:
+            waiting, self._waiting = self._waiting, []
+        for job in waiting:
+            self._jobs.put(job)
+        self._jobs.put(None)
+        self._thread.join(timeout)
+        self._thread = None
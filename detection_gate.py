@@ -0,0 +1,64 @@
+#!/usr/bin/env python3
+"""
+ラップタイム予測による検出の間引き
+- 完了したラップの最速タイムから次のスタートライン通過時刻を予測
+- 予測時刻の手前（窓）に入るまでは idle_stride フレームに1回、背景モデル更新と動き量の確認だけ行う
+- 窓に入ったら毎フレーム・フル解像度の通常検出（通過するまで窓は閉じない：遅いラップでも見逃さない）
+- 窓の外でも動き量が検出閾値の wake_ratio 倍を超えたら即座に通常検出へ戻す（速いラップ・予測外の通過への安全策）
+"""
+
+
+class DetectionGate:
+    """予測通過時刻に応じてフレームごとの処理内容を決める"""
+
+    FULL = 'full'  # 通常検出
+    IDLE = 'idle'  # 背景モデル更新と動き量確認のみ
+    SKIP = 'skip'  # 処理しない
+
+    def __init__(self, settings):
+        self.enabled = settings.get("enabled", True)
+        self.idle_stride = max(1, settings.get("idle_stride", 3))
+        self.window_ratio = settings.get("window_ratio", 0.3)  # 予測ラップタイムに対する窓の幅
+        self.min_window = settings.get("min_window", 1.5)  # 窓の最小幅（秒）
+        self.wake_hold = settings.get("wake_hold", 1.0)  # 動きで起きた後に通常検出を続ける秒数
+        # 検出閾値に対する起床閾値の割合：車両が帯に入り始めた段階で起こし、閾値の通過は毎フレームで捉える
+        self.wake_ratio = settings.get("wake_ratio", 0.3)
+        self.reset()
+
+    def reset(self):
+        self.window_open_at = None
+        self.awake_until = None
+        self.in_window = False
+        self._idle_count = 0
+
+    def predict_window(self, lap_start, best_lap):
+        """窓が開く時刻（予測できない場合は None）"""
+        if lap_start is None or best_lap is None:
+            return None
+        predicted = best_lap  # 最速ラップ基準：速い側に外れても早めに窓が開く
+        margin = max(self.min_window, predicted * self.window_ratio)
+        return lap_start + predicted - margin
+
+    def classify(self, timestamp, lap_start, best_lap):
+        """このフレームの処理内容（FULL / IDLE / SKIP）"""
+        if not self.enabled:
+            return self.FULL
+        self.window_open_at = self.predict_window(lap_start, best_lap)
+        if self.window_open_at is None:
+            self.in_window = False
+            return self.FULL  # 予測できるラップがまだない（LAP1）
+        self.in_window = (timestamp >= self.window_open_at or
+                          (self.awake_until is not None and timestamp < self.awake_until))
+        if self.in_window:
+            self._idle_count = 0
+            return self.FULL
+        self._idle_count += 1
+        if self._idle_count >= self.idle_stride:
+            self._idle_count = 0
+            return self.IDLE
+        return self.SKIP
+
+    def wake(self, timestamp):
+        """窓の外で動きを検出：しばらく通常検出を続ける"""
+        self.awake_until = timestamp + self.wake_hold
+        self.in_window = True
@@ -0,0 +1,112 @@
+#!/usr/bin/env python3
+"""
+検出解像度の自動調整
+- 検出用グレースケール画像を cv2.pyrDown で 1/2, 1/4 ... に縮小（レベル = pyrDown回数）
+- 全画面基準のピクセル閾値はレベルに合わせて自動換算（面積なので 1/4^レベル）
+- 1フレームの処理時間の移動平均が目標FPSの予算を超えたら縮小、余裕があれば戻す
+- レベル変更時は直近フレームから新しい解像度の背景モデルを作り直す（学習し直しで誤検出しない）
+"""
+
+from collections import deque
+
+import cv2
+
+
+class DetectionScale:
+    """検出解像度（pyrDownレベル）の管理"""
+
+    def __init__(self, settings):
+        self.adaptive = settings.get("adaptive", True)
+        self.min_level = settings.get("min_level", 0)
+        self.max_level = settings.get("max_level", 2)
+        self.level = min(max(settings.get("initial_level", 0), self.min_level), self.max_level)
+        target_fps = settings.get("target_fps", 30)
+        self.frame_budget = 1.0 / target_fps if target_fps > 0 else 0.0
+        self.step_down_ratio = settings.get("step_down_ratio", 0.8)  # 予算の80%超で縮小
+        self.step_up_ratio = settings.get("step_up_ratio", 0.3)  # 予算の30%未満で拡大
+        self.ema_alpha = settings.get("ema_alpha", 0.1)
+        self.min_dwell_frames = settings.get("min_dwell_frames", 60)  # 切り替え直後の往復を防ぐ
+        self.frame_time = None  # 処理時間の指数移動平均（秒）
+        self._frames_at_level = 0
+        self._frame_count = 0
+        # 予算超過で離れたレベルへ戻るのを待つフレーム数（離れるたびに倍増して往復を防ぐ）
+        self._retry_backoff = {}
+        self._retry_after = {}
+        self._mask_cache = {}
+        self.held = False  # True: 適応を止めてレベル固定中
+        # 背景モデル再構築用の直近フレーム（フル解像度の帯グレースケール）
+        self.recent_frames = deque(maxlen=settings.get("rebuild_frames", 30))
+
+    @property
+    def area_factor(self):
+        """フル解像度に対する画素数の比"""
+        return 1.0 / (4 ** self.level)
+
+    @property
+    def linear_factor(self):
+        """縮小画像の1画素がフル解像度で何画素分か"""
+        return 2 ** self.level
+
+    def downscale(self, image):
+        for _ in range(self.level):
+            image = cv2.pyrDown(image)
+        return image
+
+    def scaled_mask(self, tripwire):
+        """トリップワイヤーの帯マスクを現在のレベルに縮小（レベルごとにキャッシュ）"""
+        key = (id(tripwire.mask), self.level)
+        mask = self._mask_cache.get(key)
+        if mask is None:
+            mask = tripwire.mask
+            for _ in range(self.level):
+                mask = cv2.pyrDown(mask)
+            _, mask = cv2.threshold(mask, 127, 255, cv2.THRESH_BINARY)
+            self._mask_cache = {key: mask}  # 帯の再構築で古いものは不要
+        return mask
+
+    def reset(self):
+        self.frame_time = None
+        self._frames_at_level = 0
+        self.held = False
+        self.recent_frames.clear()
+
+    def hold(self, level):
+        """適応を止めて指定レベルに固定（レベルを変えた場合True）"""
+        self.held = True
+        level = min(max(level, self.min_level), self.max_level)
+        if level == self.level:
+            return False
+        self.level = level
+        self._frames_at_level = 0
+        self.frame_time = None
+        return True
+
+    def release(self):
+        """固定を解除して適応を再開"""
+        self.held = False
+
+    def record(self, seconds):
+        """1フレームの処理時間を記録（レベルを変えた場合True）"""
+        if self.frame_time is None:
+            self.frame_time = seconds
+        else:
+            self.frame_time += self.ema_alpha * (seconds - self.frame_time)
+        self._frames_at_level += 1
+        self._frame_count += 1
+        if (not self.adaptive or self.held or self.frame_budget <= 0 or
+                self._frames_at_level < self.min_dwell_frames):
+            return False
+
+        if self.frame_time > self.frame_budget * self.step_down_ratio and self.level < self.max_level:
+            backoff = self._retry_backoff.get(self.level, self.min_dwell_frames) * 2
+            self._retry_backoff[self.level] = min(backoff, 30 * 60 * 10)
+            self._retry_after[self.level] = self._frame_count + self._retry_backoff[self.level]
+            self.level += 1
+        elif (self.frame_time < self.frame_budget * self.step_up_ratio and self.level > self.min_level
+              and self._frame_count >= self._retry_after.get(self.level - 1, 0)):
+            self.level -= 1
+        else:
+            return False
+        self._frames_at_level = 0
+        self.frame_time = None
+        return True
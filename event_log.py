@@ -0,0 +1,158 @@
+#!/usr/bin/env python3
+"""
+構造化イベントログ（検出ループをブロックしない）
+- log() はレコード（時刻・レベル・分類・メッセージ雛形・値）をメモリ上のリングへ追加するだけ
+  （文字列の整形・JSON化・ファイル書き込み・コンソール出力はすべて書き込みスレッド側）
+- 書き込みスレッドがリングを定期的に取り出し、JSON Lines でローテーションするファイルへ保存
+- コンソール（標準出力）へは console_level 以上のみ表示：stdout が詰まっても検出ループは止まらない
+- リングが溢れた場合は古いレコードから捨て、捨てた件数を記録（dropped）
+"""
+
+import json
+import logging
+import logging.handlers
+import os
+import threading
+import time
+from collections import deque
+
+
+LEVELS = {'debug': 10, 'info': 20, 'warning': 30, 'error': 40, 'off': 100}
+
+
+class EventLog:
+    """メモリ上のリング＋バックグラウンド書き込みのログ"""
+
+    def __init__(self, settings=None):
+        settings = settings or {}
+        self.path = settings.get("file", "logs/laptime.log")  # None: ファイル出力なし
+        self.max_bytes = settings.get("max_bytes", 5 * 1024 * 1024)
+        self.backup_count = settings.get("backup_count", 5)
+        self.file_level = LEVELS.get(settings.get("file_level", "debug"), 10)
+        self.console_level = LEVELS.get(settings.get("console_level", "info"), 20)
+        self.flush_interval = settings.get("flush_interval", 0.2)
+        self._buffer = deque(maxlen=max(100, settings.get("buffer_size", 10000)))
+        self.dropped = 0
+
+        # どちらにも出力しないレベルは log() の入口で捨てる
+        self.min_level = min(self.console_level, self.file_level if self.path else LEVELS['off'])
+
+        self._handler = None
+        self._thread = None
+        self._wakeup = threading.Event()
+        self._stopping = False
+        self._start_lock = threading.Lock()
+
+    def enabled(self, level):
+        """そのレベルが出力対象か（値の計算自体が重い場合の事前チェック用）"""
+        return LEVELS[level] >= self.min_level
+
+    def log(self, level, category, message, **fields):
+        """レコード追加（ノンブロッキング）
+
+        message は str.format の雛形：fields で値を渡すと整形は書き込みスレッドで行う
+        """
+        levelno = LEVELS[level]
+        if levelno < self.min_level:
+            return
+        if len(self._buffer) == self._buffer.maxlen:
+            self.dropped += 1
+        self._buffer.append((time.time(), levelno, level, category, message, fields))
+        if self._thread is None:
+            self._start_writer()
+
+    def debug(self, category, message, **fields):
+        self.log('debug', category, message, **fields)
+
+    def info(self, category, message, **fields):
+        self.log('info', category, message, **fields)
+
+    def warning(self, category, message, **fields):
+        self.log('warning', category, message, **fields)
+
+    def error(self, category, message, **fields):
+        self.log('error', category, message, **fields)
+
+    def event(self, event):
+        """エンジンイベント（dict）をそのまま記録する購読者"""
+        fields = {k: v for k, v in event.items() if k not in ('type', 'time')}
+        self.log('debug', 'event', event['type'], **fields)
+
+    # ------------------------------------------------------------------
+    # 書き込みスレッド
+    # ------------------------------------------------------------------
+    def _start_writer(self):
+        with self._start_lock:
+            if self._thread is not None or self._stopping:
+                return
+            self._thread = threading.Thread(target=self._run, name="event-log-writer", daemon=True)
+            self._thread.start()
+
+    def _open_file(self):
+        if not self.path or self._handler is not None:
+            return
+        try:
+            os.makedirs(os.path.dirname(self.path) or '.', exist_ok=True)
+            self._handler = logging.handlers.RotatingFileHandler(
+                self.path, maxBytes=self.max_bytes, backupCount=self.backup_count, encoding='utf-8'
+            )
+            self._handler.setFormatter(logging.Formatter('%(message)s'))
+        except OSError as e:
+            print(f"⚠️ ログファイルを開けません ({self.path}): {e}")
+            self.path = None
+
+    def _run(self):
+        self._open_file()
+        while not self._stopping:
+            self._wakeup.wait(self.flush_interval)
+            self._wakeup.clear()
+            self._drain()
+        self._drain()
+
+    def _drain(self):
+        written = False
+        while self._buffer:
+            wall_time, levelno, level, category, message, fields = self._buffer.popleft()
+            text = message
+            if fields:
+                try:
+                    text = message.format(**fields)
+                except (KeyError, IndexError, ValueError):
+                    pass
+            if levelno >= self.console_level:
+                print(text)
+            if self._handler is not None and levelno >= self.file_level:
+                record = {
+                    'time': round(wall_time, 6),
+                    'level': level,
+                    'category': category,
+                    'message': text,
+                }
+                record.update(fields)
+                line = json.dumps(record, ensure_ascii=False, default=str)
+                self._handler.emit(logging.makeLogRecord({'msg': line, 'levelno': levelno,
+                                                          'levelname': level.upper()}))
+                written = True
+        if self.dropped and written:
+            # 溢れた件数もファイルに残す（次に溢れるまで再出力しない）
+            dropped, self.dropped = self.dropped, 0
+            line = json.dumps({'time': round(time.time(), 6), 'level': 'warning', 'category': 'log',
+                               'message': 'buffer overflow', 'dropped': dropped})
+            self._handler.emit(logging.makeLogRecord({'msg': line, 'levelno': 30, 'levelname': 'WARNING'}))
+
+    def flush(self):
+        """バッファ内のレコードを書き込みスレッドへ促す（待たない）"""
+        self._wakeup.set()
+
+    def close(self, timeout=2.0):
+        """残りを書き出して停止"""
+        self._stopping = True
+        self._wakeup.set()
+        if self._thread is not None:
+            self._thread.join(timeout)
+        else:
+            self._open_file()
+            self._drain()
+        if self._handler is not None:
+            self._handler.close()
+            self._handler = None
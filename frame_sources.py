@@ -0,0 +1,361 @@
+#!/usr/bin/env python3
+"""
+フレーム入力（カメラ・録画ファイル・ネットワークストリーム・合成映像）
+- どの入力も cv2.VideoCapture と同じインターフェース（isOpened/set/get/grab/retrieve/read/release）
+  → キャプチャスレッド・同期キャプチャ・プロセス分離モードはそのまま使える
+- retrieve(image=None) はバッファプールの確保済み配列へデコード（フレームごとに ndarray を確保しない）
+  使い終わった配列は release_buffer() で明示的に返す：キャプチャのリング（camera_capture.CaptureBuffer）が
+  retain_frames 枚新しいフレームを公開した時点で返すので、公開したフレームはそれまで上書きされない
+  空きがなければ追加で確保し、返却された配列は次のデコードで再利用（定常状態では確保なし）
+- retrieve(image) で呼び出し側のバッファを渡した場合はそこへ直接デコード（共有メモリのスロットなど）
+- 入力の指定（camera_settings.overview_source / startline_source）:
+    0, "1"                      … カメラデバイス番号
+    "clips/start.mp4"           … 録画ファイル（映像のFPSで送出・末尾で先頭へ戻る）
+    "rtsp://…", "http://…"      … ネットワークストリーム（切断時は再接続）
+    "synthetic", "synthetic:period=4.3,fps=30" … 合成映像（ブロックが一定周期で画面を横切る）
+"""
+
+import os
+import time
+
+import cv2
+import numpy as np
+
+
+class BufferPool:
+    """フレーム用の確保済み配列（明示的な acquire/release）
+
+    形状は最初のフレームで決まり、その時点で size 枚を確保。空きがなければ追加で確保し、
+    release で返された配列を次の acquire で再利用する（空きは size 枚まで保持）
+    """
+
+    def __init__(self, size=8):
+        self.size = max(1, size)
+        self._free = []
+        self._template = None  # (shape, dtype)
+        self.reuses = 0
+        self.allocations = 0
+
+    def acquire(self):
+        """空き配列（形状が未確定なら None：デコーダーに確保させて adopt する）"""
+        if self._free:
+            self.reuses += 1
+            return self._free.pop()
+        if self._template is None:
+            return None
+        self.allocations += 1
+        return np.empty(*self._template)
+
+    def adopt(self, frame):
+        """デコーダーが確保した配列（初回・フレームサイズ変更）：形状を記録して残りを確保"""
+        self.allocations += 1
+        template = (frame.shape, frame.dtype)
+        if template != self._template:
+            self._template = template
+            self._free = [np.empty(*template) for _ in range(self.size - 1)]
+            self.allocations += len(self._free)
+
+    def release(self, buffer):
+        """使い終わった配列を返す（形状が違う・空きが size 枚ある場合は捨てる）"""
+        if (buffer.shape, buffer.dtype) == self._template and len(self._free) < self.size:
+            self._free.append(buffer)
+
+    def stats(self):
+        return {'free': len(self._free), 'reuses': self.reuses, 'allocations': self.allocations}
+
+
+class FrameSource:
+    """フレーム入力の基底クラス（cv2.VideoCapture 互換）"""
+
+    description = "source"
+
+    def __init__(self, pool_size=8):
+        self.pool = BufferPool(pool_size)
+        self.log = None  # 構造化ログ（EventLog）：エンジンが接続時に設定
+
+    @property
+    def identity(self):
+        """入力の識別子（背景キャッシュ等の保存キー：割り当て順や番号が変わっても同じ入力なら同じ値）"""
+        return f"{type(self).__name__}:{self.description}"
+
+    @property
+    def retain_frames(self):
+        """キャプチャ側が配列を返すまでに公開するフレーム数"""
+        return self.pool.size
+
+    def isOpened(self):
+        return False
+
+    def set(self, prop, value):
+        return False
+
+    def get(self, prop):
+        return 0.0
+
+    def grab(self):
+        return False
+
+    def _retrieve(self, image):
+        """image（None なら新規確保）へデコード → (ret, frame)"""
+        return False, None
+
+    def retrieve(self, image=None):
+        target = image if image is not None else self.pool.acquire()
+        ret, frame = self._retrieve(target)
+        if image is None and frame is not target:
+            if target is not None:
+                self.pool.release(target)  # 使われなかった（失敗・サイズ違い）
+            if ret and frame is not None:
+                self.pool.adopt(frame)
+        return ret, frame
+
+    def release_buffer(self, frame):
+        """retrieve() で受け取った配列を使い終わった：次のデコード先として再利用"""
+        self.pool.release(frame)
+
+    def read(self, image=None):
+        if not self.grab():
+            return False, None
+        return self.retrieve(image)
+
+    def release(self):
+        pass
+
+    def __repr__(self):
+        return f"<{type(self).__name__} {self.description}>"
+
+
+class VideoCaptureSource(FrameSource):
+    """cv2.VideoCapture によるデコード（デバイス・ファイル・ストリーム共通）"""
+
+    def __init__(self, target, pool_size=8):
+        super().__init__(pool_size)
+        self.target = target
+        self.description = str(target)
+        self.capture = cv2.VideoCapture(target)
+
+    def isOpened(self):
+        return self.capture.isOpened()
+
+    def set(self, prop, value):
+        return self.capture.set(prop, value)
+
+    def get(self, prop):
+        return self.capture.get(prop)
+
+    def grab(self):
+        return self.capture.grab()
+
+    def _retrieve(self, image):
+        if image is None:
+            return self.capture.retrieve()
+        return self.capture.retrieve(image)
+
+    def release(self):
+        self.capture.release()
+
+
+class DeviceSource(VideoCaptureSource):
+    """カメラデバイス（インデックス指定）"""
+
+    def __init__(self, index, pool_size=8):
+        super().__init__(int(index), pool_size)
+        self.index = int(index)
+        self.description = f"device {index}"
+
+    @property
+    def identity(self):
+        """Linux では機種名と接続ポート（sysfs のデバイスパス）：USB の列挙順で番号が変わっても同じカメラなら同じ値"""
+        sysfs = f"/sys/class/video4linux/video{self.index}"
+        try:
+            with open(os.path.join(sysfs, "name"), 'r', encoding='utf-8') as f:
+                name = f.read().strip()
+            return f"device:{name}@{os.path.realpath(os.path.join(sysfs, 'device'))}"
+        except OSError:
+            return f"device:{self.index}"
+
+
+class FileSource(VideoCaptureSource):
+    """録画ファイル：realtime なら映像のFPSで送出（カメラと同じ速度で読まれる）、loop なら末尾で先頭へ"""
+
+    def __init__(self, path, pool_size=8, loop=True, realtime=True):
+        super().__init__(path, pool_size)
+        self.loop = loop
+        self.realtime = realtime
+        self.description = os.path.abspath(path)
+        fps = self.capture.get(cv2.CAP_PROP_FPS) if self.capture.isOpened() else 0.0
+        self.interval = 1.0 / fps if fps and fps > 0 else 1.0 / 30.0
+        self._next_due = None
+
+    def set(self, prop, value):
+        # ファイルの解像度は変えられない（キャプチャ側の解像度設定は無視）
+        if prop in (cv2.CAP_PROP_FRAME_WIDTH, cv2.CAP_PROP_FRAME_HEIGHT):
+            return False
+        return self.capture.set(prop, value)
+
+    def grab(self):
+        if self.realtime:
+            now = time.perf_counter()
+            if self._next_due is None or now - self._next_due > self.interval:
+                self._next_due = now  # 初回・処理が遅れた場合は遅れを取り戻そうとせず今から数え直す
+            elif self._next_due > now:
+                time.sleep(self._next_due - now)
+            self._next_due += self.interval
+        ret = self.capture.grab()
+        if not ret and self.loop:
+            self.capture.set(cv2.CAP_PROP_POS_FRAMES, 0)
+            ret = self.capture.grab()
+        return ret
+
+
+class StreamSource(VideoCaptureSource):
+    """ネットワークストリーム（RTSP/HTTP）：読めなくなったら reconnect_interval ごとに開き直す"""
+
+    def __init__(self, url, pool_size=8, reconnect_interval=2.0):
+        super().__init__(url, pool_size)
+        self.reconnect_interval = reconnect_interval
+        self.reconnects = 0
+        self._props = {}
+        self._last_attempt = time.perf_counter()
+        self.capture.set(cv2.CAP_PROP_BUFFERSIZE, 1)  # 古いフレームを溜めない（遅延を増やさない）
+
+    def isOpened(self):
+        return True  # 切断中も再接続を続ける（キャプチャ側には読み込み失敗として見える）
+
+    def set(self, prop, value):
+        self._props[prop] = value  # 再接続後にも適用
+        return self.capture.set(prop, value)
+
+    def grab(self):
+        if self.capture.grab():
+            return True
+        now = time.perf_counter()
+        if now - self._last_attempt >= self.reconnect_interval:
+            self._last_attempt = now
+            self.capture.release()
+            self.capture = cv2.VideoCapture(self.target)
+            self.capture.set(cv2.CAP_PROP_BUFFERSIZE, 1)
+            for prop, value in self._props.items():
+                self.capture.set(prop, value)
+            self.reconnects += 1
+            if self.log is not None:
+                self.log.warning('capture', "🔌 ストリーム {url} に再接続（{count}回目）",
+                                 url=self.target, count=self.reconnects)
+        return False
+
+
+class SyntheticSource(FrameSource):
+    """合成映像：first 秒から period 秒ごとにブロックが画面を横切る（カメラなしで検出・計測の全経路を動かす）"""
+
+    def __init__(self, pool_size=8, width=640, height=480, fps=30.0, period=4.3, first=2.0, speed=600.0):
+        super().__init__(pool_size)
+        self.fps = float(fps)
+        self.period = float(period)
+        self.first = float(first)
+        self.speed = float(speed)
+        self.description = f"synthetic period={self.period}s first={self.first}s speed={self.speed}"
+        self._opened = True
+        self._resize(int(width), int(height))
+        self._started = time.perf_counter()
+        self._next_due = None
+        self._grab_time = self._started
+
+    def _resize(self, width, height):
+        self.width, self.height = width, height
+        self._background = np.full((height, width, 3), 60, dtype=np.uint8)
+        self._background[::8, :] = 80  # 横縞（背景差分が平坦な画面にならないよう）
+
+    def isOpened(self):
+        return self._opened
+
+    def set(self, prop, value):
+        if prop == cv2.CAP_PROP_FRAME_WIDTH:
+            self._resize(int(value), self.height)
+        elif prop == cv2.CAP_PROP_FRAME_HEIGHT:
+            self._resize(self.width, int(value))
+        elif prop == cv2.CAP_PROP_FPS and value > 0:
+            self.fps = float(value)
+        else:
+            return False
+        return True
+
+    def get(self, prop):
+        return {cv2.CAP_PROP_FRAME_WIDTH: float(self.width), cv2.CAP_PROP_FRAME_HEIGHT: float(self.height),
+                cv2.CAP_PROP_FPS: self.fps}.get(prop, 0.0)
+
+    def grab(self):
+        if not self._opened:
+            return False
+        now = time.perf_counter()
+        interval = 1.0 / self.fps
+        if self._next_due is None or now - self._next_due > interval:
+            self._next_due = now
+        elif self._next_due > now:
+            time.sleep(self._next_due - now)
+        self._next_due += interval
+        self._grab_time = time.perf_counter()
+        return True
+
+    def _retrieve(self, image):
+        if image is None or image.shape != self._background.shape:
+            image = np.empty_like(self._background)
+        image[...] = self._background
+        t = self._grab_time - self._started
+        if t >= self.first - self.width / self.speed:
+            # 今画面内にいる周回のブロック（中央を通過する時刻が first + n * period）
+            lap = round((t - self.first) / self.period)
+            for n in (lap - 1, lap, lap + 1):
+                if n < 0:
+                    continue
+                x = int(self.width / 2 + (t - self.first - n * self.period) * self.speed)
+                x0, x1 = max(0, x - 60), min(self.width, x + 60)
+                if x0 < x1:
+                    image[self.height * 35 // 100:self.height * 48 // 100, x0:x1] = (0, 0, 255)
+                    image[self.height * 52 // 100:self.height * 65 // 100, x0:x1] = (255, 0, 0)
+        return True, image
+
+    def release(self):
+        self._opened = False
+
+
+def source_identity(capture, index=None):
+    """接続した入力の識別子（FrameSource 以外の VideoCapture はインデックスで代用）"""
+    if isinstance(capture, FrameSource):
+        return capture.identity
+    return f"device:{index}" if index is not None else None
+
+
+def _parse_options(text):
+    """"period=4.3,fps=30" → {'period': 4.3, 'fps': 30.0}"""
+    options = {}
+    for item in text.split(','):
+        key, sep, value = item.partition('=')
+        if sep and key.strip():
+            options[key.strip()] = float(value)
+    return options
+
+
+def open_source(spec, settings=None):
+    """入力の指定から FrameSource を開く（開けなかった場合は None）"""
+    settings = settings or {}
+    pool_size = settings.get("buffer_pool_size", 8)
+    if spec is None:
+        return None
+    if isinstance(spec, str) and spec.strip().isdigit():
+        spec = int(spec)
+    if isinstance(spec, int):
+        source = DeviceSource(spec, pool_size)
+    elif spec.startswith("synthetic"):
+        options = _parse_options(spec.partition(':')[2])
+        options.setdefault('width', settings.get("frame_width", 640))
+        options.setdefault('height', settings.get("frame_height", 480))
+        source = SyntheticSource(pool_size, **options)
+    elif "://" in spec:
+        source = StreamSource(spec, pool_size, settings.get("stream_reconnect_interval", 2.0))
+    else:
+        source = FileSource(spec, pool_size, settings.get("file_source_loop", True))
+    if not source.isOpened():
+        print(f"⚠️ 入力 {spec} を開けませんでした")
+        source.release()
+        return None
+    return source
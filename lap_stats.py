@@ -0,0 +1,86 @@
+#!/usr/bin/env python3
+"""
+ラップタイムの逐次統計（練習走行など周回数無制限でもメモリ一定）
+- 全周回の平均・標準偏差は Welford 法で1周ごとに更新（全ラップを保持しない）
+- ベストラップ（タイムと周回番号）・直前ラップ
+- 直近 recent 周の平均・標準偏差と安定度（100 × (1 - 変動係数)）：窓は固定長なので1周あたりの計算量も一定
+"""
+
+import math
+from collections import deque
+
+
+class LapStats:
+    """ラップタイムの逐次集計"""
+
+    def __init__(self, recent=5):
+        self.recent_size = max(2, recent)
+        self.reset()
+
+    def reset(self):
+        self.count = 0
+        self.mean = 0.0
+        self._m2 = 0.0  # 平均からの偏差平方和（Welford）
+        self.best = None
+        self.best_lap = None
+        self.last = None
+        self.recent = deque(maxlen=self.recent_size)
+
+    def add(self, lap_time, lap=None):
+        """1周分を追加（lap: 周回番号。省略時は追加順）"""
+        self.count += 1
+        delta = lap_time - self.mean
+        self.mean += delta / self.count
+        self._m2 += delta * (lap_time - self.mean)
+        if self.best is None or lap_time < self.best:
+            self.best = lap_time
+            self.best_lap = lap if lap is not None else self.count
+        self.last = lap_time
+        self.recent.append(lap_time)
+
+    @property
+    def stddev(self):
+        """全周回の標準偏差（標本、2周未満は0）"""
+        return math.sqrt(self._m2 / (self.count - 1)) if self.count > 1 else 0.0
+
+    @property
+    def recent_mean(self):
+        return sum(self.recent) / len(self.recent) if self.recent else 0.0
+
+    @property
+    def recent_stddev(self):
+        n = len(self.recent)
+        if n < 2:
+            return 0.0
+        mean = self.recent_mean
+        return math.sqrt(sum((t - mean) ** 2 for t in self.recent) / (n - 1))
+
+    @property
+    def consistency(self):
+        """直近の安定度（%）：ばらつきがないほど100（2周未満は None）"""
+        if len(self.recent) < 2:
+            return None
+        mean = self.recent_mean
+        if mean <= 0:
+            return None
+        return max(0.0, 100.0 * (1.0 - self.recent_stddev / mean))
+
+    def to_dict(self):
+        """別プロセスへ送る状態（pickle/JSON可能な値のみ）"""
+        return {
+            'count': self.count, 'mean': self.mean, 'm2': self._m2, 'best': self.best,
+            'best_lap': self.best_lap, 'last': self.last, 'recent': list(self.recent),
+            'recent_size': self.recent_size,
+        }
+
+    @classmethod
+    def from_dict(cls, data):
+        stats = cls(data['recent_size'])
+        stats.count = data['count']
+        stats.mean = data['mean']
+        stats._m2 = data['m2']
+        stats.best = data['best']
+        stats.best_lap = data['best_lap']
+        stats.last = data['last']
+        stats.recent.extend(data['recent'])
+        return stats
@@ -0,0 +1,1377 @@
+#!/usr/bin/env python3
+"""
+ヘッドレス ラップ計測エンジン（pygame非依存）
+- カメラ入力（キャプチャスレッド）・スタートライン検出・レース/一時停止状態管理を担当
+- 計測結果はイベント（dict）として購読者へ通知（pygame表示は購読者の1つ）
+- import してもpygameは初期化されない：ディスプレイなしのサーバーでも計測可能
+
+単体起動（ヘッドレス）:
+    python lap_timing_engine.py
+    標準入力コマンド: s=計測準備, r=一時停止/再開, q=停止, d=手動検出, exit=終了
+"""
+
+import cv2
+import math
+import time
+import numpy as np
+import json
+import sys
+import threading
+from collections import deque
+
+from camera_capture import CameraCaptureWorker, SynchronizedCapture, capture_clock
+from start_line_tripwire import StartLineTripwire, interpolate_crossing_time
+from car_tracker import CarTracker
+from detection_scale import DetectionScale
+from detection_gate import DetectionGate
+from background_cache import BackgroundCache
+from camera_probe import CameraProbe, assign_cameras, release_unused
+from frame_sources import FrameSource, open_source, source_identity
+from lap_stats import LapStats
+from sector_timing import SectorTimer, sector_times
+from line_scan_detector import LineScanDetector
+from live_timing_server import LiveTimingServer
+from clip_recorder import ClipRecorder
+from event_log import EventLog
+from results_store import ResultsStore
+
+
+def format_time(seconds):
+    """時間フォーマット - MM:SS.sss形式"""
+    minutes = int(seconds // 60)
+    secs = seconds % 60
+    return f"{minutes:02d}:{secs:06.3f}"
+
+
+class LapTimingEngine:
+    """カメラ入力・検出・レース状態管理（UIなし）
+
+    発行イベント（すべて 'type' と 'time' キーを持つdict）:
+        state            : 状態遷移（state = standby/ready/active/paused/resumed/finished）
+        learning_complete: 背景学習完了
+        race_start       : スタートライン通過で計測開始
+        lap              : ラップ完了（lap, lap_time）
+        race_complete    : 規定周回完了（lap_times, total_time, total_pause_time, pause_count）
+                           max_laps = 0（練習走行）では発行しない（Qで終了）
+        car_start/car_lap/car_finished: 複数車両モードの車両別通過（car_id, lap, lap_time）
+    """
+
+    def __init__(self, config_path='config.json', config=None):
+        self.config_path = config_path
+        self.camera_overview = None
+        self.camera_start_line = None
+        self.capture_overview = None  # キャプチャスレッド
+        self.capture_start_line = None
+        self.capture_group = None  # 同期キャプチャ（camera_settings.capture_mode = "synchronized"）
+        self.bg_subtractor = None
+
+        # v8: 周回計測システム状態管理
+        self.race_ready = False  # S押し後の計測準備状態
+        self.race_active = False  # 実際の計測開始状態
+        self.lap_count = 0  # 完了したラップ数
+        self.current_lap_number = 0  # 現在計測中のラップ番号
+        self.current_lap_start = None
+        self.race_start_time = None
+        self.total_time = 0.0
+        self.current_lap_time = 0.0  # 現在のラップの進行時間
+
+        # ラップタイム記録（完了したラップのみ・古い順）
+        self.max_laps = 3  # 規定周回数（0 = 無制限の練習走行）
+        self.lap_history = 3  # lap_times に残す周回数（規定周回数、練習走行は直近分のみ）
+        self.lap_times = deque(maxlen=self.lap_history)
+        self.lap_stats = LapStats()  # ベスト・平均・標準偏差・安定度（全周回を保持せず逐次集計）
+        self.race_complete = False  # 規定周回完了フラグ
+
+        # v12: 一時停止/再開システム
+        self.race_paused = False  # レース一時停止フラグ
+        self.pause_countdown = 0  # 5秒カウントダウン
+        self.pause_start_time = None  # 一時停止開始時刻
+        self.paused_lap_time = None  # 一時停止時のラップ経過時間
+        self.paused_total_time = None  # 一時停止時の総経過時間
+        self.total_pause_time = 0.0  # 総一時停止時間
+        self.pause_count = 0  # 一時停止回数
+
+        # v7継承: 検出関連
+        # 時刻はすべてキャプチャと共通の単調増加クロック（capture_clock）
+        self.last_detection_time = 0
+        self.last_crossing_time = None  # 直近の検出で補間したスタートライン通過時刻
+        self.prev_motion_sample = (None, 0)  # 直前フレームの (キャプチャ時刻, 動き量)
+        self.max_interpolation_gap = 0.2  # これ以上離れたフレーム間では補間しない（秒）
+        self.preparation_start_time = None  # 準備開始時刻
+        self.learning_duration = 5.0  # 背景学習時間（秒）
+        self.race_learning_duration = self.learning_duration  # 今回の準備での学習時間（ウォームスタート時は短縮）
+        self._learning_completed = False
+        self.last_motion_pixels = 0
+        self.motion_area_ratio = 0.0
+        self.stage_timer = None  # 計測用フック: stage_timer(ステージ名, 秒)
+        self.current_overview_frame = None  # 最新のCapturedFrame
+        self.current_startline_frame = None
+        self.startline_source_identity = None  # 接続中のスタートライン入力（背景キャッシュのキー）
+        self.crossing_pairs = deque(maxlen=self.lap_history)  # 同期キャプチャ：通過時刻の (周回, SyncedFrames)
+        self.lap_splits = deque(maxlen=self.lap_history)  # 完了ラップのセクタースプリット（lap_times と同じ並び）
+        self._last_sector_frame_id = 0
+
+        # スタートライン トリップワイヤー
+        self.start_line_tripwire = None
+        self.start_line_roi = None  # 直近の検出対象（帯の切り出し）
+
+        # 複数車両追跡（tracking_settings.enabled）
+        self.tracking_enabled = False
+        self.car_tracker = None
+
+        # 検出解像度（pyrDownレベル）の自動調整
+        self.detection_scale = None
+
+        # ラップタイム予測による検出の間引き（gating_settings）
+        self.detection_gate = None
+
+        # 検出方式（detector_settings.mode: "mog2" / "line_scan"）
+        self.detector_mode = "mog2"
+        self.line_scan = None
+
+        # イベント購読者とエンジンスレッド
+        self._subscribers = []
+        self.state_lock = threading.RLock()  # 状態変更はエンジンスレッドとUIの双方から
+        self.running = False
+        self._thread = None
+
+        self.load_config(config)
+
+        # 構造化ログ（検出ループからは print せずリングへ積むだけ）
+        self.log = EventLog(self.config.get("log_settings", {}))
+        self.subscribe(self.log.event)
+
+        # 走行結果の保存（チーム・セッション別）
+        self.results = ResultsStore(self.config.get("results_settings", {}))
+        if self.results.enabled:
+            self.subscribe(self.results.on_event)
+
+        # 通過前後のスタートライン映像クリップ（判定確認用）
+        self.clip_recorder = ClipRecorder(self.config.get("clip_settings", {}))
+
+    # ------------------------------------------------------------------
+    # 設定
+    # ------------------------------------------------------------------
+    def load_config(self, config=None):
+        """設定読み込み（config を渡した場合はファイルを読まずにその dict を使う）"""
+        try:
+            if config is not None:
+                self.config = config
+            else:
+                with open(self.config_path, 'r') as f:
+                    self.config = json.load(f)
+        except FileNotFoundError:
+            # v7継承: 高感度設定
+            self.config = {
+                "camera_settings": {
+                    "overview_camera_index": 0,
+                    "startline_camera_index": 0,  # 修正: 同じカメラを使用
+                    "frame_width": 640,
+                    "frame_height": 480
+                },
+                "detection_settings": {
+                    "motion_pixels_threshold": 300,      # v7高感度設定継承
+                    "min_contour_area": 200,
+                    "motion_area_ratio_min": 0.008,
+                    "motion_area_ratio_max": 0.9,
+                    "stable_frames_required": 2,
+                    "motion_consistency_check": False
+                },
+                "race_settings": {
+                    "max_laps": 3,  # 0 = 無制限の練習走行
+                    "recent_laps": 5,  # 直近平均・安定度の周回数
+                    "detection_cooldown": 5.0  # 誤検出防止のため延長
+                },
+                "start_line_settings": {
+                    "tripwire": None,  # 未設定：全画面で検出
+                    "band_width": 40
+                },
+                "tracking_settings": {
+                    "enabled": False  # True: 複数車両を色・大きさで識別して個別計測
+                },
+                "pipeline_settings": {
+                    "mode": "thread"  # "process": カメラごとに別プロセスで検出
+                },
+                "results_settings": {
+                    "enabled": True,
+                    "database": "data/results.db",
+                    "teams": ["TEAM A"]
+                },
+                "log_settings": {
+                    "console_level": "info",  # 検出ごとの詳細は "debug"
+                    "file_level": "debug"
+                }
+            }
+            print("⚠️ config.json not found, using v8 3-lap system with v7 sensitivity settings")
+
+        # 設定値を変数に展開
+        camera_settings = self.config["camera_settings"]
+        detection_settings = self.config["detection_settings"]
+        race_settings = self.config["race_settings"]
+
+        self.overview_camera_index = camera_settings["overview_camera_index"]
+        self.startline_camera_index = camera_settings["startline_camera_index"]
+        self.frame_width = camera_settings["frame_width"]
+        self.frame_height = camera_settings["frame_height"]
+        self.camera_probe = CameraProbe(camera_settings)
+        # 入力の指定（ファイル・ストリーム・合成映像・デバイス番号）：指定があればカメラ検出の代わりに使う
+        self.overview_source = camera_settings.get("overview_source")
+        self.startline_source = camera_settings.get("startline_source")
+        self.source_settings = camera_settings
+        # "threaded": カメラごとのスレッド / "synchronized": 全カメラを続けて grab し必要な分だけデコード
+        self.capture_mode = camera_settings.get("capture_mode", "threaded")
+        self.sync_tolerance = camera_settings.get("sync_tolerance", 0.02)
+
+        self.motion_pixels_threshold = detection_settings["motion_pixels_threshold"]
+        self.min_contour_area = detection_settings["min_contour_area"]
+        self.motion_area_ratio_min = detection_settings["motion_area_ratio_min"]
+        self.motion_area_ratio_max = detection_settings["motion_area_ratio_max"]
+        self.stable_frames_required = detection_settings["stable_frames_required"]
+        self.motion_consistency_check = detection_settings["motion_consistency_check"]
+        subtractor_settings = self.config.get("background_subtractor_settings", {})
+        self.mog2_history = subtractor_settings.get("history", 1000)
+        self.mog2_var_threshold = subtractor_settings.get("varThreshold", 25)
+        self.mog2_detect_shadows = subtractor_settings.get("detectShadows", True)
+
+        self.max_laps = max(0, int(race_settings.get("max_laps", 3)))
+        self.lap_stats = LapStats(race_settings.get("recent_laps", 5))
+        # 表示のスクロール窓（3行）と直近統計に足りる分だけ保持
+        self.lap_history = self.max_laps or max(3, self.lap_stats.recent_size)
+        self.lap_times = deque(maxlen=self.lap_history)
+        self.crossing_pairs = deque(maxlen=self.lap_history)
+        self.lap_splits = deque(maxlen=self.lap_history)
+        self.detection_cooldown = race_settings["detection_cooldown"]
+
+        # トリップワイヤー（座標はframe_width x frame_height基準）
+        self.start_line_tripwire = StartLineTripwire.from_config(
+            self.config.get("start_line_settings", {}), (self.frame_width, self.frame_height)
+        )
+
+        self.tracking_settings = self.config.get("tracking_settings", {})
+        self.tracking_enabled = self.tracking_settings.get("enabled", False)
+        self.build_car_tracker()
+
+        self.detection_scale = DetectionScale(self.config.get("scaling_settings", {}))
+        self.detection_gate = DetectionGate(self.config.get("gating_settings", {}))
+        self.background_cache = BackgroundCache(self.config.get("background_cache_settings", {}))
+        # セクター境界（オーバービュー映像上の複数トリップワイヤー）
+        self.sector_timer = SectorTimer(self.config.get("sector_settings", {}), (self.frame_width, self.frame_height))
+
+        self.detector_settings = self.config.get("detector_settings", {})
+        self.detector_mode = self.detector_settings.get("mode", "mog2")
+        if self.detector_mode == "line_scan":
+            # ライン上の背景色だけなので短い学習で足りる
+            self.learning_duration = self.detector_settings.get("learning_duration", 1.0)
+        self.build_line_scan_detector()
+
+    def build_line_scan_detector(self):
+        """ラインスキャン検出器作成（トリップワイヤー変更時も作り直す）"""
+        if self.detector_mode != "line_scan":
+            self.line_scan = None
+            return
+        frame_size = (self.frame_width, self.frame_height)
+        if self.start_line_tripwire is not None:
+            frame_size = self.start_line_tripwire.frame_size
+        self.line_scan = LineScanDetector(self.detector_settings, self.start_line_tripwire, frame_size)
+
+    def build_car_tracker(self):
+        """複数車両トラッカー作成（トリップワイヤー変更時も作り直す）"""
+        if not self.tracking_enabled:
+            self.car_tracker = None
+            return
+        frame_size = (self.frame_width, self.frame_height)
+        if self.start_line_tripwire is not None:
+            frame_size = self.start_line_tripwire.frame_size
+        self.car_tracker = CarTracker(self.tracking_settings, self.start_line_tripwire, frame_size,
+                                      self.lap_history, self.lap_stats.recent_size)
+
+    def save_config(self):
+        """現在の設定をconfig.jsonへ保存"""
+        try:
+            with open(self.config_path, 'w', encoding='utf-8') as f:
+                json.dump(self.config, f, indent=2, ensure_ascii=False)
+            print("💾 config.json を保存しました")
+        except OSError as e:
+            print(f"⚠️ config.json 保存失敗: {e}")
+
+    # ------------------------------------------------------------------
+    # イベント通知
+    # ------------------------------------------------------------------
+    def subscribe(self, callback):
+        """イベント購読（callback(event_dict) はエンジンスレッドから呼ばれる）"""
+        self._subscribers.append(callback)
+
+    def unsubscribe(self, callback):
+        if callback in self._subscribers:
+            self._subscribers.remove(callback)
+
+    def _emit(self, event_type, **data):
+        event = {'type': event_type, 'time': capture_clock()}
+        event.update(data)
+        for callback in list(self._subscribers):
+            try:
+                callback(event)
+            except Exception as e:
+                print(f"⚠️ イベント購読者エラー ({event_type}): {e}")
+
+    def race_state(self):
+        """表示・通知用のレース状態名"""
+        if self.race_complete:
+            return "finished"
+        if self.race_paused:
+            return "paused"
+        if self.race_active:
+            return "active"
+        if self.race_ready:
+            return "ready"
+        return "standby"
+
+    # ------------------------------------------------------------------
+    # カメラ
+    # ------------------------------------------------------------------
+    @property
+    def has_cameras(self):
+        return self.camera_overview is not None or self.camera_start_line is not None
+
+    def probe_camera_indices(self):
+        """利用可能なカメラインデックスを列挙（ハンドルは閉じる：別プロセスで開き直す場合用）"""
+        return sorted(self.camera_probe.probe(keep_open=False))
+
+    def init_cameras(self):
+        """カメラ初期化（ラズパイ対応・カメラなしモード対応・並列検出）"""
+        try:
+            print("📷 カメラを初期化中...")
+
+            if self.overview_source is not None or self.startline_source is not None:
+                # 入力の指定どおりに開く（指定のない側はカメラなし）
+                self.attach_cameras(open_source(self.overview_source, self.source_settings),
+                                    open_source(self.startline_source, self.source_settings),
+                                    self.overview_source, self.startline_source)
+                return True
+
+            # 並列検出（前回構成を優先）：開いたハンドルをそのまま使う
+            captures = self.camera_probe.probe()
+            overview_index, start_line_index = assign_cameras(
+                captures, self.overview_camera_index, self.startline_camera_index)
+            release_unused(captures, overview_index, start_line_index)
+
+            if not captures:
+                print("⚠️ 利用可能なカメラが見つかりません")
+            elif start_line_index is None:
+                print(f"📷 1台のカメラ（インデックス {overview_index}）を使用")
+            else:
+                print(f"📷 {len(captures)}台のカメラを検出：{sorted(captures)}")
+
+            self.attach_cameras(captures.get(overview_index), captures.get(start_line_index),
+                                overview_index, start_line_index)
+            return True  # カメラなしでも続行
+
+        except Exception as e:
+            print(f"⚠️ カメラ初期化警告: {e}")
+            print("📺 カメラなしモードで続行します")
+            self.camera_overview = None
+            self.camera_start_line = None
+            self.bg_subtractor = cv2.createBackgroundSubtractorMOG2(
+                history=500, varThreshold=16, detectShadows=True
+            )
+            return True  # カメラなしでも続行
+
+    def attach_cameras(self, overview, start_line, overview_index=None, start_line_index=None):
+        """開いたカメラを割り当ててキャプチャスレッドを起動（複数トラック運用ではスケジューラが呼ぶ）"""
+        self.camera_overview = overview
+        self.camera_start_line = start_line
+        camera_available = False
+        for camera in (overview, start_line):
+            if isinstance(camera, FrameSource):
+                camera.log = self.log  # 再接続などはキャプチャスレッドから構造化ログへ
+        self.startline_source_identity = source_identity(start_line, start_line_index)
+
+        if self.camera_overview and self.camera_overview.isOpened():
+            print(f"✅ Overview camera (index {overview_index}) opened successfully")
+            camera_available = True
+            # カメラ設定
+            self.camera_overview.set(cv2.CAP_PROP_FRAME_WIDTH, self.frame_width)
+            self.camera_overview.set(cv2.CAP_PROP_FRAME_HEIGHT, self.frame_height)
+        else:
+            print(f"⚠️ Overview camera could not be opened")
+            self.camera_overview = None
+
+        if self.camera_start_line and self.camera_start_line.isOpened():
+            print(f"✅ Start line camera (index {start_line_index}) opened successfully")
+            camera_available = True
+            # カメラ設定
+            self.camera_start_line.set(cv2.CAP_PROP_FRAME_WIDTH, self.frame_width)
+            self.camera_start_line.set(cv2.CAP_PROP_FRAME_HEIGHT, self.frame_height)
+        else:
+            print(f"⚠️ Start line camera could not be opened")
+            self.camera_start_line = None
+
+        # カメラごとにキャプチャスレッドを起動
+        self.start_capture_workers()
+
+        # 背景差分初期化（より安定した設定）
+        self.bg_subtractor = cv2.createBackgroundSubtractorMOG2(
+            history=500, varThreshold=16, detectShadows=True
+        )
+
+        if camera_available:
+            print("✅ カメラ初期化完了（一部カメラ利用可能）")
+        else:
+            print("⚠️ カメラなしモードで起動（デモモード）")
+            print("🎮 手動検出シミュレーションでテスト可能")
+
+    def start_capture_workers(self):
+        """カメラ1台につき1本のキャプチャスレッドを起動（同期モードで2台あれば1本で同期キャプチャ）"""
+        if (self.capture_mode == "synchronized" and self.camera_overview is not None and
+                self.camera_start_line is not None):
+            self.start_synchronized_capture()
+            return
+        if self.camera_overview is not None:
+            self.capture_overview = CameraCaptureWorker(self.camera_overview, "overview")
+            self.capture_overview.stage_timer = self.stage_timer
+            self.capture_overview.start()
+        if self.camera_start_line is not None:
+            self.capture_start_line = CameraCaptureWorker(self.camera_start_line, "start_line")
+            self.capture_start_line.stage_timer = self.stage_timer
+            self.capture_start_line.start()
+
+    def start_synchronized_capture(self):
+        """俯瞰・スタートラインを1スレッドで同期キャプチャ（ループ状態が必要とするフレームだけデコード）"""
+        group = SynchronizedCapture([("overview", self.camera_overview), ("start_line", self.camera_start_line)],
+                                    self.sync_tolerance)
+        group.stage_timer = self.stage_timer
+        self.capture_overview = group.views["overview"]
+        self.capture_start_line = group.views["start_line"]
+        self.capture_overview.needed = self.overview_frames_needed
+        self.capture_start_line.needed = self.startline_frames_needed
+        self.capture_group = group
+        group.start()
+        print(f"🔗 同期キャプチャ（許容時刻差 {self.sync_tolerance * 1000:.0f}ms）")
+
+    def startline_frames_needed(self):
+        """同期キャプチャ：検出ループがスタートライン映像を使う状態か（表示側は demand() で別途要求）"""
+        return (self.race_ready or self.race_active) and not self.race_paused and not self.race_complete
+
+    def overview_frames_needed(self):
+        """同期キャプチャ：セクター計測・通過確認に俯瞰映像が要る状態か
+
+        セクター計測なしなら予測通過時刻から遠い間は俯瞰をデコードしない
+        """
+        if not self.startline_frames_needed():
+            return False
+        gate = self.detection_gate
+        if self.sector_timer.enabled or not self.race_active or not gate.enabled or gate.window_open_at is None:
+            return True
+        return gate.in_window
+
+    def stop_capture_workers(self):
+        """キャプチャスレッド停止（カメラ解放前に必ず実行）"""
+        for worker in (self.capture_overview, self.capture_start_line):
+            if worker is not None:
+                worker.stop()
+                stats = worker.get_stats()
+                print(f"📊 [{stats['camera']}] frames={stats['frames']} dropped={stats['dropped']} "
+                      f"stale={stats['stale']} read_failures={stats['read_failures']}"
+                      + (f" skipped={stats['skipped']}" if 'skipped' in stats else ""))
+        if self.capture_group is not None:
+            stats = self.capture_group.get_stats()
+            print(f"📊 [sync] cycles={stats['cycles']} synced={stats['synced']} "
+                  f"misaligned={stats['misaligned']} max_skew={stats['max_skew'] * 1000:.1f}ms")
+        self.capture_overview = None
+        self.capture_start_line = None
+        self.capture_group = None
+
+    # ------------------------------------------------------------------
+    # トリップワイヤー
+    # ------------------------------------------------------------------
+    def set_start_line_tripwire(self, points):
+        """トリップワイヤー更新（Noneで全画面検出に戻す）"""
+        with self.state_lock:
+            if self.race_active:
+                print("⚠️ レース中はトリップワイヤーを変更できません")
+                return
+
+            settings = self.config.setdefault("start_line_settings", {"band_width": 40})
+            settings["tripwire"] = [list(p) for p in points] if points else None
+            frame_size = (self.frame_width, self.frame_height)
+            if self.current_startline_frame is not None:
+                frame_size = self.current_startline_frame.frame.shape[1::-1]
+            self.start_line_tripwire = StartLineTripwire.from_config(settings, frame_size)
+            if self.start_line_tripwire is not None:
+                settings["tripwire"] = [list(p) for p in self.start_line_tripwire.points]
+                print(f"📐 トリップワイヤー設定: {settings['tripwire']} (幅 {self.start_line_tripwire.band_width}px)")
+            else:
+                print("📐 トリップワイヤー解除：全画面で検出")
+            self.save_config()
+            self.build_car_tracker()
+            self.build_line_scan_detector()
+            self.detection_scale.reset()  # 直近フレームは古い帯の大きさ
+
+            # 検出領域が変わるので背景モデルを作り直す
+            if self.race_ready:
+                self.prepare_race()
+
+    def detection_thresholds(self):
+        """検出閾値（全画面基準の値をトリップワイヤーの帯面積・検出解像度に合わせて換算）"""
+        scale = self.detection_scale.area_factor
+        if self.start_line_tripwire is not None:
+            scale *= self.start_line_tripwire.area_scale
+        return self.motion_pixels_threshold * scale, self.min_contour_area * scale
+
+    def prepare_detection_input(self, frame):
+        """スタートライン映像から検出対象（帯の切り出し・グレースケール）を作成"""
+        if self.start_line_tripwire is not None:
+            if self.start_line_tripwire.fit_frame(frame):
+                self.log.info('detection', "📐 トリップワイヤーを実フレームサイズ {width}x{height} に合わせて再構築",
+                              width=frame.shape[1], height=frame.shape[0])
+            self.start_line_roi = self.start_line_tripwire.crop(frame)
+        else:
+            self.start_line_roi = frame
+        if len(self.start_line_roi.shape) == 3:
+            return cv2.cvtColor(self.start_line_roi, cv2.COLOR_BGR2GRAY)
+        return self.start_line_roi
+
+    def detection_input(self, frame):
+        """背景モデルへ渡す画像（帯のグレースケールを現在の検出解像度へ縮小）"""
+        gray = self.prepare_detection_input(frame)
+        self.detection_scale.recent_frames.append(gray)
+        return self.detection_scale.downscale(gray)
+
+    def create_background_subtractor(self):
+        """計測用の背景減算器（準備時・解像度変更時）"""
+        return cv2.createBackgroundSubtractorMOG2(
+            history=self.mog2_history,              # より長い履歴で安定した学習
+            varThreshold=self.mog2_var_threshold,   # より高い閾値でノイズ耐性向上
+            detectShadows=self.mog2_detect_shadows
+        )
+
+    def rebuild_background_model(self):
+        """検出解像度変更時：直近フレームから新しい解像度の背景モデルを作成"""
+        scale = self.detection_scale
+        self.bg_subtractor = self.create_background_subtractor()
+        for gray in scale.recent_frames:
+            self.bg_subtractor.apply(scale.downscale(gray), learningRate=-1)  # 自動レート（1/フレーム数）
+        self.prev_motion_sample = (None, 0)  # 動き量の単位が変わるので補間しない
+        self.log.info('detection', "📐 検出解像度を 1/{factor} に変更 （直近{frames}フレームで背景モデル再構築）",
+                      factor=scale.linear_factor, frames=len(scale.recent_frames))
+
+    # ------------------------------------------------------------------
+    # レース状態管理
+    # ------------------------------------------------------------------
+    def prepare_race(self, now=None):
+        """計測準備状態へ移行（Sキー押下時）"""
+        now = now if now is not None else capture_clock()
+        with self.state_lock:
+            self.race_ready = True
+            self.race_active = False
+            self.lap_count = 0
+            self.current_lap_number = 0
+            self.current_lap_start = None
+            self.race_start_time = None
+            self.total_time = 0.0
+            self.current_lap_time = 0.0
+            self.lap_times = deque(maxlen=self.lap_history)
+            self.lap_stats.reset()
+            self.crossing_pairs.clear()
+            self.lap_splits.clear()
+            self.sector_timer.reset()
+            self.race_complete = False
+            self.race_paused = False
+            self.pause_countdown = 0
+            self.total_pause_time = 0.0
+            self.pause_count = 0
+
+            # クールダウンは実際の検出・計測開始の後だけ（ウォームスタートで学習が短くても学習直後から検出できる）
+            self.last_detection_time = -math.inf
+            self.preparation_start_time = now  # 準備開始時刻を記録
+            self._learning_completed = False  # 学習完了フラグをリセット
+            self.prev_motion_sample = (None, 0)
+            if self.car_tracker is not None:
+                self.car_tracker.reset()
+            if self.line_scan is not None:
+                self.line_scan.reset()
+            self.detection_scale.reset()
+            self.detection_gate.reset()
+
+            # 背景減算器を新しく初期化（前回の学習をクリア）
+            self.log.info('learning', "🔄 背景減算器を新規初期化中...")
+            self.bg_subtractor = self.create_background_subtractor()
+            self.log.info('learning', "✅ 背景減算器初期化完了")
+
+            # 保存済みの背景画像があれば学習を短縮
+            self.race_learning_duration = self.learning_duration
+            if self.warm_start_background():
+                self.race_learning_duration = self.background_cache.warm_learning_duration
+
+            self.log.info('race', "🏁 計測準備完了！ローリングスタートモード")
+            self.log.info('race', "📋 待機中：スタートライン通過でTOTAL TIME計測開始")
+            if self.max_laps:
+                self.log.info('race', "🔄 {laps}周完了で自動的に計測終了・結果表示", laps=self.max_laps)
+            else:
+                self.log.info('race', "🔄 練習走行モード：周回数無制限（Qで終了）")
+            self.log.info('learning', "⏳ 背景学習中...{duration:.1f}秒お待ちください（重要）",
+                          duration=self.race_learning_duration)
+            self._emit('state', state='ready')
+
+    def background_cache_key(self):
+        """背景画像の保存キー（接続中のスタートライン入力・フレームサイズ・トリップワイヤー）"""
+        tripwire = self.start_line_tripwire.to_config() if self.start_line_tripwire is not None else None
+        return self.background_cache.camera_key(self.startline_source_identity,
+                                                (self.frame_width, self.frame_height), tripwire)
+
+    def warm_start_background(self):
+        """保存済みの背景画像で背景モデルを初期化し、最新フレームで収束を確認（合格ならTrue）"""
+        captured = self.current_startline_frame
+        if not self.background_cache.enabled or self.line_scan is not None or captured is None:
+            return False
+        gray = self.prepare_detection_input(captured.frame)
+        if self.capture_start_line is not None and not self.capture_start_line.holds(captured):
+            return False  # エンジンが止まっていて最新フレームの配列が再利用済み：通常の背景学習
+        background = self.background_cache.load(self.background_cache_key(), gray)
+        if background is None or background.shape != gray.shape:
+            return False
+
+        scale = self.detection_scale
+        self.bg_subtractor.apply(scale.downscale(background), learningRate=1.0)  # 背景画像で初期化
+        fg_mask = self.mask_to_band(self.bg_subtractor.apply(scale.downscale(gray), learningRate=0))
+        residual = cv2.countNonZero(fg_mask)
+        pixels_threshold, _ = self.detection_thresholds()
+        if residual > pixels_threshold * self.background_cache.max_residual_ratio:
+            # 照明・カメラ位置が変わった等：通常の学習からやり直す
+            self.log.warning('learning', "🧊 保存済み背景と一致しません（残留 {residual}px）：通常の背景学習を行います",
+                             residual=residual)
+            self.bg_subtractor = self.create_background_subtractor()
+            return False
+        self.log.info('learning', "🔥 保存済み背景でウォームスタート（残留 {residual}px）", residual=residual)
+        return True
+
+    def start_race(self, start_time=None):
+        """レース開始（スタートライン通過時）"""
+        if self.race_ready and not self.race_active:
+            self.race_active = True
+            self.race_ready = False  # 重要：準備状態を解除してレース状態に移行
+            self.race_start_time = start_time if start_time is not None else capture_clock()
+            self.current_lap_start = self.race_start_time
+            self.current_lap_number = 1  # LAP1開始
+            self.last_detection_time = self.race_start_time  # 初回検出時間をリセット
+            self.sector_timer.start_lap()
+            self.log.info('race', "🏁 計測開始！LAP{lap} スタート - TOTAL TIMEカウント開始", lap=self.current_lap_number)
+            self._emit('race_start', start_time=self.race_start_time)
+            self._emit('state', state='active', lap=self.current_lap_number)
+
+    def set_team(self, team):
+        """計測するチームを切り替え（次の計測開始から反映）"""
+        with self.state_lock:
+            if self.race_active:
+                print("⚠️ レース中はチームを変更できません")
+                return False
+            self.results.team = team
+            print(f"👥 チーム: {team}")
+            return True
+
+    def stop_race(self):
+        """v8: レース停止"""
+        with self.state_lock:
+            self.race_ready = False
+            self.race_active = False
+            self.race_complete = False
+            self.race_paused = False
+            self.pause_countdown = 0
+            print("⏹️ 計測停止")
+            self._emit('state', state='standby')
+
+    def toggle_pause(self):
+        """v12: レース一時停止/再開トグル - LAP・TOTALカウント制御"""
+        with self.state_lock:
+            if not self.race_active:
+                return  # レース中でない場合は何もしない
+
+            if not self.race_paused:
+                # 1回目Rキー：LAP・TOTALの時間計測（カウントアップ）を停止
+                current_time = capture_clock()
+                self.race_paused = True
+                self.pause_start_time = current_time
+                self.pause_count += 1  # 一時停止回数をインクリメント
+
+                # 現在のラップ時間と総時間を保存（計測停止）
+                if self.current_lap_start is not None:
+                    self.paused_lap_time = current_time - self.current_lap_start
+                if self.race_start_time is not None:
+                    self.paused_total_time = current_time - self.race_start_time
+
+                print("⏸️ LAP・TOTAL時間計測停止")
+                print("🔄 次のRキーでLAP・TOTAL計測再開 + 5秒カウントダウン表示")
+                self._emit('state', state='paused', pause_count=self.pause_count,
+                           lap_time=self.paused_lap_time, total_time=self.paused_total_time)
+            else:
+                # 2回目Rキー：カウントダウン表示開始と同時にLAP・TOTAL計測を再開
+                current_time = capture_clock()
+
+                # 一時停止時間を計算して累積
+                pause_duration = current_time - self.pause_start_time
+                self.total_pause_time += pause_duration
+
+                # ラップ時間と総時間を即座再計算（一時停止分を除外して復元）
+                if self.paused_lap_time is not None:
+                    self.current_lap_start = current_time - self.paused_lap_time
+                if self.paused_total_time is not None:
+                    self.race_start_time = current_time - self.paused_total_time
+
+                # 5秒カウントダウン表示を開始（カウントアップは即座再開）
+                self.pause_countdown = 5.0
+                self.pause_start_time = current_time  # カウントダウン開始時刻
+
+                print("▶️ LAP・TOTAL計測再開！5秒カウントダウン表示開始")
+                print("⏳ カウントアップとカウントダウンを同時実行中")
+                print(f"📊 総一時停止時間: {self.total_pause_time:.1f}秒（計測から除外）")
+
+                # 複数車両モード：各車両のラップ開始時刻も一時停止分ずらす
+                if self.car_tracker is not None:
+                    self.car_tracker.shift_times(pause_duration)
+
+                # 一時変数をクリア
+                self.paused_lap_time = None
+                self.paused_total_time = None
+                self._emit('state', state='resumed', pause_duration=pause_duration,
+                           total_pause_time=self.total_pause_time)
+
+    def update_pause_countdown(self):
+        """v12: 一時停止カウントダウン更新 - 表示用カウントダウンのみ管理"""
+        if self.race_paused and self.pause_countdown > 0:
+            current_time = capture_clock()
+            elapsed = current_time - self.pause_start_time
+            remaining = 5.0 - elapsed
+
+            if remaining <= 0:
+                # カウントダウン表示完了（カウントアップは既に再開済み）
+                self.race_paused = False
+                self.pause_countdown = 0
+
+                self.log.info('state', "✅ 5秒カウントダウン表示完了！LAP・TOTAL計測継続中")
+                self.paused_total_time = None
+                self._emit('state', state='active', lap=self.current_lap_number)
+            else:
+                self.pause_countdown = remaining
+
+    def current_lap_elapsed(self, now=None):
+        """表示用：現在ラップの経過時間（一時停止中は停止時点の値）"""
+        if not (self.race_active and self.current_lap_start is not None):
+            return 0.0
+        if self.race_paused and self.pause_countdown <= 0 and self.paused_lap_time is not None:
+            return self.paused_lap_time
+        return (now if now is not None else capture_clock()) - self.current_lap_start
+
+    def total_elapsed(self, now=None):
+        """表示用：総経過時間（完了後は確定値、一時停止中は停止時点の値）"""
+        if self.race_complete:
+            return self.total_time
+        if not (self.race_active and self.race_start_time is not None):
+            return 0.0
+        if self.race_paused and self.pause_countdown <= 0 and self.paused_total_time is not None:
+            return self.paused_total_time
+        return (now if now is not None else capture_clock()) - self.race_start_time
+
+    # ------------------------------------------------------------------
+    # 検出
+    # ------------------------------------------------------------------
+    def detection_learning_rate(self):
+        """背景学習レート調整：準備中は高速学習、レース中は低速更新で誤検出防止"""
+        if self.race_ready and not self.race_active:
+            return 0.01  # 準備中：高速学習
+        elif self.race_active:
+            return 0.001  # レース中：微更新で誤検出防止
+        return 0.005  # その他：中程度更新
+
+    def mask_to_band(self, fg_mask):
+        """前景マスクから帯（多角形・斜めの線）の外側を除去"""
+        tripwire = self.start_line_tripwire
+        if tripwire is not None and tripwire.needs_mask:
+            if self.detection_scale.level == 0:
+                return tripwire.apply_mask(fg_mask)
+            return cv2.bitwise_and(fg_mask, self.detection_scale.scaled_mask(tripwire))
+        return fg_mask
+
+    def gated_detection_mode(self, frame, timestamp):
+        """予測通過時刻から遠い間は検出を間引く（DetectionGate.FULL / IDLE / SKIP）"""
+        gate = self.detection_gate
+        if not self.race_active:
+            return DetectionGate.FULL
+        was_in_window = gate.in_window
+        mode = gate.classify(timestamp, self.current_lap_start, self.lap_stats.best)
+        if mode == DetectionGate.IDLE and self.idle_motion_check(frame, timestamp):
+            gate.wake(timestamp)  # 予測より速いラップ：次のフレームから通常検出
+        if gate.in_window != was_in_window:
+            if gate.in_window:
+                # 通過が近い：毎フレーム・フル解像度で検出
+                if self.detection_scale.hold(self.detection_scale.min_level):
+                    self.rebuild_background_model()
+            else:
+                self.detection_scale.release()
+            self.log.debug('gating', "🎯 [LAP{lap}] 検出{state}（窓の開始 {opens:+.2f}s）",
+                           lap=self.current_lap_number, state="通常" if gate.in_window else "間引き",
+                           opens=gate.window_open_at - timestamp if gate.window_open_at is not None else 0.0)
+        return mode
+
+    def idle_motion_check(self, frame, timestamp):
+        """間引き中のフレーム：背景モデル更新と動き量の確認のみ（ノイズ除去・輪郭抽出なし）
+
+        クールダウン後に動き量が起床閾値（検出閾値 x wake_ratio）を超えたら True
+        """
+        gray = self.detection_input(frame)
+        fg_mask = self.mask_to_band(self.bg_subtractor.apply(gray, learningRate=self.detection_learning_rate()))
+        motion_pixels = cv2.countNonZero(fg_mask)
+        pixels_threshold, _ = self.detection_thresholds()
+        self.last_motion_pixels = motion_pixels
+        self.prev_motion_sample = (timestamp, motion_pixels)
+        return (motion_pixels > pixels_threshold * self.detection_gate.wake_ratio and
+                timestamp - self.last_detection_time >= self.detection_cooldown)
+
+    def compute_foreground(self, frame, learning_rate):
+        """前景マスク作成（帯の切り出し→MOG2→帯外除去→ノイズ除去）
+
+        1フレームにつきMOG2は1回だけ：単一車両検出と複数車両追跡で共用
+        戻り値: (前景マスク, 帯のグレースケール画像)
+        """
+        # トリップワイヤー周辺の帯だけを処理（検出解像度へ縮小）
+        t0 = capture_clock()
+        gray = self.detection_input(frame)
+        t1 = capture_clock()
+        fg_mask = self.mask_to_band(self.bg_subtractor.apply(gray, learningRate=learning_rate))
+        t2 = capture_clock()
+
+        # ノイズ除去
+        kernel = np.ones((3,3), np.uint8)
+        fg_mask = cv2.morphologyEx(fg_mask, cv2.MORPH_CLOSE, kernel)
+        fg_mask = cv2.morphologyEx(fg_mask, cv2.MORPH_OPEN, kernel)
+        if self.stage_timer is not None:
+            t3 = capture_clock()
+            self.stage_timer('gray_roi', t1 - t0)
+            self.stage_timer('mog2', t2 - t1)
+            self.stage_timer('morphology', t3 - t2)
+        return fg_mask, gray
+
+    def detect_motion_v7(self, frame, timestamp=None):
+        """v7継承: 高感度動き検出（timestamp: フレームのキャプチャ時刻）"""
+        try:
+            current_time = timestamp if timestamp is not None else capture_clock()
+
+            # クールダウン期間チェック（背景学習中はスキップ）
+            if not (self.race_ready and not self.race_active and self.preparation_start_time is not None and
+                    (current_time - self.preparation_start_time) < self.race_learning_duration):
+                time_since_last = current_time - self.last_detection_time
+                if time_since_last < self.detection_cooldown:
+                    # 2周目以降のデバッグ情報を追加
+                    if self.race_active and time_since_last < self.detection_cooldown:
+                        self.log.debug('detection', "⏱️ クールダウン中: {elapsed:.1f}s / {cooldown}s (LAP{lap})",
+                                       elapsed=time_since_last, cooldown=self.detection_cooldown,
+                                       lap=self.current_lap_number)
+                    return False
+
+            learning_rate = self.detection_learning_rate()
+            fg_mask, gray = self.compute_foreground(frame, learning_rate)
+
+            # 輪郭検出
+            t0 = capture_clock()
+            contours, _ = cv2.findContours(fg_mask, cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_SIMPLE)
+            if self.stage_timer is not None:
+                self.stage_timer('contours', capture_clock() - t0)
+
+            # v7高感度検出条件
+            motion_pixels = cv2.countNonZero(fg_mask)
+            max_contour_area = max([cv2.contourArea(c) for c in contours]) if contours else 0
+
+            if self.start_line_tripwire is not None:
+                frame_area = self.start_line_tripwire.mask_area * self.detection_scale.area_factor
+            else:
+                frame_area = gray.shape[0] * gray.shape[1]
+            motion_ratio = motion_pixels / frame_area
+            pixels_threshold, contour_threshold = self.detection_thresholds()
+
+            # v7高感度検出条件（安定版）
+            motion_detected = False
+
+            # 基本的な動き検出条件
+            basic_motion = motion_pixels > pixels_threshold and max_contour_area > contour_threshold
+
+            # 面積比率チェック
+            area_ratio_ok = self.motion_area_ratio_min <= motion_ratio <= self.motion_area_ratio_max
+
+            # 輪郭数チェック
+            contour_count_ok = len(contours) >= 1
+
+            # 検出条件：基本動き + 面積比率 + 輪郭数（レース中はより厳しく）
+            if self.race_active:
+                # レース中：より厳しい条件（AND条件）
+                if basic_motion and area_ratio_ok and contour_count_ok and len(contours) >= 2:
+                    motion_detected = True
+                    conditions_met = 4
+            else:
+                # 準備中：従来の条件（OR条件）
+                if basic_motion and (area_ratio_ok or contour_count_ok):
+                    motion_detected = True
+                    conditions_met = 2 + (1 if area_ratio_ok else 0) + (1 if contour_count_ok else 0)
+
+            # デバッグ情報更新
+            self.last_motion_pixels = motion_pixels
+            self.motion_area_ratio = motion_ratio
+            prev_timestamp, prev_pixels = self.prev_motion_sample
+            self.prev_motion_sample = (current_time, motion_pixels)
+
+            if motion_detected:
+                # 直前フレームとの間で動き量が閾値を横切った時刻を通過時刻とする
+                if prev_timestamp is not None and current_time - prev_timestamp <= self.max_interpolation_gap:
+                    self.last_crossing_time = interpolate_crossing_time(
+                        prev_timestamp, prev_pixels, current_time, motion_pixels, pixels_threshold
+                    )
+                else:
+                    self.last_crossing_time = current_time
+                self.log.debug('detection', "🔥 [{lap_info}] Motion detected! Conditions: {conditions}/4 "
+                               "pixels={pixels}/{pixels_threshold:.0f} contour={contour:.0f}/{contour_threshold:.0f} "
+                               "ratio={ratio:.4f} since_last={since_last:.2f}s lr={learning_rate} "
+                               "interpolated=-{interpolated_ms:.1f}ms",
+                               lap_info=f"LAP{self.current_lap_number}" if self.race_active else "READY",
+                               conditions=conditions_met, pixels=motion_pixels, pixels_threshold=pixels_threshold,
+                               contour=max_contour_area, contour_threshold=contour_threshold, ratio=motion_ratio,
+                               since_last=current_time - self.last_detection_time, learning_rate=learning_rate,
+                               interpolated_ms=(current_time - self.last_crossing_time) * 1000)
+                return True
+            else:
+                # 2周目以降で検出失敗時の詳細情報
+                if self.race_active and self.current_lap_number >= 2:
+                    self.log.debug('detection', "❌ [LAP{lap}] 検出失敗 - Motion:{pixels}, Area:{contour:.0f}, Ratio:{ratio:.4f}",
+                                   lap=self.current_lap_number, pixels=motion_pixels, contour=max_contour_area,
+                                   ratio=motion_ratio)
+                # デバッグ: 動きが検出されない理由を表示
+                elif motion_pixels > 100:  # 最小限の動きがある場合のみ表示
+                    self.log.debug('detection', "📊 No motion: pixels={pixels}/{pixels_threshold:.0f}, "
+                                   "contour={contour:.0f}/{contour_threshold:.0f}, ratio={ratio:.4f}",
+                                   pixels=motion_pixels, pixels_threshold=pixels_threshold,
+                                   contour=max_contour_area, contour_threshold=contour_threshold, ratio=motion_ratio)
+
+            return False
+
+        except Exception as e:
+            self.log.error('detection', "❌ 動き検出エラー: {error}", error=repr(e))
+            return False
+
+    def process_detection(self, crossing_time=None):
+        """検出処理とラップ計測（4回検出システム）
+
+        crossing_time: キャプチャ時刻から補間した通過時刻（手動検出時はNone=現在時刻）
+        """
+        current_time = crossing_time if crossing_time is not None else capture_clock()
+
+        # 一時停止中は検出処理をスキップ
+        if self.race_paused:
+            return
+
+        # 1回目：計測準備中にスタートライン通過で計測開始
+        if self.race_ready and not self.race_active:
+            # 背景学習時間を十分に確保（準備開始から5秒待機）
+            if self.preparation_start_time is not None and (current_time - self.preparation_start_time) < self.race_learning_duration:
+                learning_time = current_time - self.preparation_start_time
+                self.log.debug('learning', "⏳ 背景学習中... {elapsed:.1f}/{duration:.1f}秒",
+                               elapsed=learning_time, duration=self.race_learning_duration)
+                return  # 背景学習中は検出しない
+            elif not self._learning_completed:
+                gray = None
+                if self.start_line_roi is not None:
+                    gray = cv2.cvtColor(self.start_line_roi, cv2.COLOR_BGR2GRAY) if len(self.start_line_roi.shape) == 3 else self.start_line_roi
+                self.complete_learning(gray)
+
+            self.log.info('race', "🏁 レース計測開始 - スタートライン通過を検出")
+            self.start_race(current_time)
+            self.record_crossing_pair(0, current_time)
+            self.clip_recorder.trigger(current_time, "start")
+            return
+
+        # 2回目以降：レース中のラップ計測
+        if self.race_active and not self.race_complete:
+            # 現在のラップ時間を記録してラップ完了
+            if self.current_lap_start is not None:
+                lap_time = current_time - self.current_lap_start
+
+                # ラップ完了処理
+                self.lap_times.append(lap_time)
+                self.lap_stats.add(lap_time, self.current_lap_number)
+                self.lap_count += 1
+                self.log.info('lap', "⏱️ LAP{lap}: {formatted} 完了", lap=self.current_lap_number,
+                              lap_time=lap_time, formatted=format_time(lap_time))
+                if self.sector_timer.enabled:
+                    splits = self.sector_timer.finish_lap()
+                    self.lap_splits.append(splits)
+                    self._emit('lap', lap=self.current_lap_number, lap_time=lap_time, crossing_time=current_time,
+                               splits=splits, sectors=sector_times(splits, lap_time))
+                else:
+                    self._emit('lap', lap=self.current_lap_number, lap_time=lap_time, crossing_time=current_time)
+                self.record_crossing_pair(self.current_lap_number, current_time)
+                self.clip_recorder.trigger(current_time, f"lap{self.current_lap_number}")
+
+                # 規定周回完了チェック（練習走行は周回数無制限）
+                if self.max_laps and self.current_lap_number >= self.max_laps:
+                    # 規定周回+1回目の検出 = 完了
+                    self.total_time = current_time - self.race_start_time
+                    self.race_complete = True
+                    self.race_active = False
+                    self.current_lap_number = 0  # 計測終了
+
+                    self.log.info('race', "🏁 {laps}周完了！ 総時間: {formatted}", laps=self.max_laps,
+                                  total_time=self.total_time, formatted=format_time(self.total_time))
+                    self.log.info('race', "=== 最終結果 ===")
+                    for lap, recorded in enumerate(self.lap_times, 1):
+                        self.log.info('race', "LAP{lap}: {formatted}", lap=lap, formatted=format_time(recorded))
+                    self.log.info('race', "TOTAL: {formatted}", formatted=format_time(self.total_time))
+                    if self.total_pause_time > 0:
+                        self.log.info('race', "一時停止: {pause:.1f}秒（計測から除外）", pause=self.total_pause_time)
+                        self.log.info('race', "純計測時間: {formatted}", formatted=format_time(self.total_time))
+                    self._emit('race_complete', lap_times=list(self.lap_times), total_time=self.total_time,
+                               total_pause_time=self.total_pause_time, pause_count=self.pause_count)
+                    self._emit('state', state='finished')
+                    return
+
+                # 次のラップ開始
+                self.current_lap_number += 1
+                self.current_lap_start = current_time
+                self.log.info('lap', "🔄 LAP{lap} 開始", lap=self.current_lap_number)
+
+                # 注意：last_detection_timeは検出ループで更新
+
+    def record_crossing_pair(self, lap, crossing_time):
+        """同期キャプチャ：通過時刻に最も近い俯瞰・スタートラインの組を保持（通過の確認用、周回0=スタート）"""
+        if self.capture_group is None:
+            return
+        pair = self.capture_group.pair_near(crossing_time, self.max_interpolation_gap)
+        if pair is None:
+            self.log.debug('verification', "📸 LAP{lap} 通過時刻の同期フレームなし", lap=lap)
+            return
+        # レース中ずっと保持するのでコピー（キャプチャの配列は retain 枚先で再利用される）
+        pair = pair._replace(frames={name: captured._replace(frame=captured.frame.copy())
+                                     for name, captured in pair.frames.items()})
+        self.crossing_pairs.append((lap, pair))
+        self.log.debug('verification', "📸 LAP{lap} 通過の同期フレーム: 通過から{offset:+.1f}ms カメラ間{skew:.1f}ms",
+                       lap=lap, offset=(pair.timestamp - crossing_time) * 1000, skew=pair.skew * 1000)
+
+    def detect_cars(self, frame, timestamp):
+        """複数車両モード：1回のMOG2で全車両の通過を追跡"""
+        try:
+            fg_mask, _ = self.compute_foreground(frame, self.detection_learning_rate())
+            prev_timestamp = self.prev_motion_sample[0]
+            if prev_timestamp is not None and timestamp - prev_timestamp > self.max_interpolation_gap:
+                prev_timestamp = None  # フレーム間隔が空きすぎた場合は補間しない
+            self.last_motion_pixels = cv2.countNonZero(fg_mask)
+            self.prev_motion_sample = (timestamp, self.last_motion_pixels)
+
+            origin = self.start_line_tripwire.roi[:2] if self.start_line_tripwire is not None else (0, 0)
+            roi_bgr = self.detection_scale.downscale(self.start_line_roi)  # 前景マスクと同じ解像度
+            crossings = self.car_tracker.update(fg_mask, roi_bgr, origin, timestamp, prev_timestamp,
+                                                self.detection_cooldown, self.detection_scale.linear_factor)
+            for car, crossing_time in crossings:
+                self.process_car_crossing(car, crossing_time)
+        except Exception as e:
+            self.log.error('detection', "❌ 複数車両検出エラー: {error}", error=repr(e))
+
+    def process_car_crossing(self, car, crossing_time):
+        """複数車両モード：車両ごとのラップ計測"""
+        if self.race_paused or self.race_complete:
+            return
+        if self.race_ready and not self.race_active:
+            self.start_race(crossing_time)  # 最初の車両の通過でTOTAL計測開始
+
+        result = car.record_crossing(crossing_time, self.max_laps, self.detection_cooldown)
+        if result is None:
+            return
+        if result == 'start':
+            self.log.info('car', "🏁 CAR{car_id} 計測開始", car_id=car.car_id)
+            self._emit('car_start', car_id=car.car_id, start_time=crossing_time)
+            self.clip_recorder.trigger(crossing_time, f"car{car.car_id}_start")
+            return
+
+        lap_time = car.lap_times[-1]
+        self.log.info('car', "⏱️ CAR{car_id} LAP{lap}: {formatted}", car_id=car.car_id, lap=car.lap_count,
+                      lap_time=lap_time, formatted=format_time(lap_time))
+        self._emit('car_lap', car_id=car.car_id, lap=car.lap_count, lap_time=lap_time, crossing_time=crossing_time)
+        self.clip_recorder.trigger(crossing_time, f"car{car.car_id}_lap{car.lap_count}")
+        if result == 'finish':
+            self.log.info('car', "🏁 CAR{car_id} {laps}周完了！ 総時間: {formatted}", car_id=car.car_id,
+                          laps=self.max_laps, formatted=format_time(crossing_time - car.start_time))
+            self._emit('car_finished', car_id=car.car_id, lap_times=list(car.lap_times),
+                       total_time=crossing_time - car.start_time)
+
+            # 全車両が規定周回を終えたらレース完了
+            if all(c.finished for c in self.car_tracker.cars.values()):
+                self.total_time = crossing_time - self.race_start_time
+                self.race_complete = True
+                self.race_active = False
+                self.current_lap_number = 0
+                results = {c.car_id: list(c.lap_times) for c in self.car_tracker.cars.values()}
+                self.log.info('race', "🏁 全{cars}台完了！ 総時間: {formatted}", cars=len(results),
+                              total_time=self.total_time, formatted=format_time(self.total_time))
+                self._emit('race_complete', cars=results, total_time=self.total_time,
+                           total_pause_time=self.total_pause_time, pause_count=self.pause_count)
+                self._emit('state', state='finished')
+
+    def manual_detection(self):
+        """カメラなしモード用：手動検出シミュレーション（SPACEキー）"""
+        with self.state_lock:
+            if (self.race_ready or self.race_active) and not self.race_paused and not self.race_complete:
+                if not self.has_cameras:
+                    print("🎮 手動検出シミュレーション実行")
+                    self.process_detection()
+
+    def complete_learning(self, gray=None):
+        """背景学習完了処理（一度だけ実行）"""
+        self.log.info('learning', "✅ 背景学習完了！")
+        self.log.info('learning', "🎯 動体検出準備完了 - スタートライン通過で計測開始")
+        # 学習完了後のテスト検出
+        if gray is not None and self.bg_subtractor is not None:
+            test_mask = self.bg_subtractor.apply(gray, learningRate=0)
+            test_pixels = cv2.countNonZero(test_mask)
+            self.log.info('learning', "🧪 学習完了後ベースライン: Motion pixels = {pixels}", pixels=test_pixels)
+        self._learning_completed = True  # 一度だけ表示
+        if self.line_scan is None:
+            # 次回の計測準備用に背景画像を保存（照明条件ごと）
+            self.background_cache.store(self.background_cache_key(), list(self.detection_scale.recent_frames))
+        self._emit('learning_complete')
+
+    def process_line_scan_frame(self, captured):
+        """ラインスキャン方式：ライン上の画素列だけで背景学習・通過検出"""
+        timestamp = captured.timestamp
+        self.line_scan.stage_timer = self.stage_timer
+        learning = (self.race_ready and not self.race_active and self.preparation_start_time is not None and
+                    timestamp - self.preparation_start_time < self.race_learning_duration)
+        crossing_time = self.line_scan.update(captured.frame, timestamp, learning)
+        self.last_motion_pixels = self.line_scan.last_changed
+
+        if learning:
+            learning_time = timestamp - self.preparation_start_time
+            if int(learning_time * 2) != getattr(self, '_last_progress_count', -1):
+                self.log.info('learning', "⏳ ライン背景学習中... {elapsed:.1f}/{duration:.1f}秒",
+                               elapsed=learning_time, duration=self.race_learning_duration)
+                self._last_progress_count = int(learning_time * 2)
+            return
+        if self.race_ready and not self.race_active and not self._learning_completed:
+            self.complete_learning()
+
+        if crossing_time is None or self.race_paused or self.race_complete:
+            return
+        if not (self.race_ready or self.race_active):
+            return
+        if crossing_time - self.last_detection_time < self.detection_cooldown:
+            return
+        self.last_crossing_time = crossing_time
+        self.log.debug('detection', "🔥 ラインスキャン検出: 変化画素 {changed}/{length}",
+                       changed=self.line_scan.last_changed, length=self.line_scan.length)
+        self.process_detection(crossing_time)
+        self.last_detection_time = crossing_time
+        self.line_scan.request_photo_finish(crossing_time, f"lap{self.lap_count}")
+
+    def process_startline_frame(self, captured):
+        """スタートラインの新フレーム1枚分の背景学習・検出処理"""
+        started = capture_clock()
+        if self.line_scan is not None:
+            self.process_line_scan_frame(captured)
+            if self.stage_timer is not None:
+                self.stage_timer('detection', capture_clock() - started)
+            return
+        frame, timestamp = captured.frame, captured.timestamp
+        if self.bg_subtractor is None:
+            return
+
+        learning_time = 0
+        if self.race_ready and not self.race_active and self.preparation_start_time is not None:
+            learning_time = timestamp - self.preparation_start_time
+
+        # 学習完了後かつ、計測準備中またはレース中の場合のみ検出
+        # レース中は learning_time チェックをスキップ
+        detection_ready = False
+        if self.race_active:  # レース中は常に検出可能
+            detection_ready = True
+        elif self.race_ready and not self.race_active:  # 準備中は学習完了後のみ
+            detection_ready = learning_time >= self.race_learning_duration
+
+        if detection_ready and not self.race_paused and not self.race_complete:
+            # 2周目以降の検出状況を詳しく監視
+            if self.race_active and self.current_lap_number >= 2:
+                time_since_last = timestamp - self.last_detection_time
+                self.log.debug('detection', "🔍 [LAP{lap}] 検出試行中 - 最終検出から{elapsed:.1f}s経過",
+                               lap=self.current_lap_number, elapsed=time_since_last)
+
+            if self.car_tracker is not None:
+                self.detect_cars(frame, timestamp)
+            else:
+                mode = self.gated_detection_mode(frame, timestamp)
+                if mode == DetectionGate.SKIP:
+                    return  # 間引いたフレームは処理時間の記録もしない
+                if mode == DetectionGate.FULL and self.detect_motion_v7(frame, timestamp):
+                    self.log.debug('detection', "🔍 [{lap_info}] スタートラインで動き検出 - 処理実行",
+                                   lap_info=f"LAP{self.current_lap_number}" if self.race_active else "READY")
+                    crossing_time = self.last_crossing_time
+                    self.process_detection(crossing_time)
+                    # 検出成功時は必ずlast_detection_timeを更新（キャプチャ時刻基準）
+                    self.last_detection_time = crossing_time
+                    self.log.debug('detection', "⏰ クールダウンタイマー更新: {cooldown}秒待機開始",
+                                   cooldown=self.detection_cooldown)
+
+        # 背景学習進行状況表示と学習処理
+        if self.race_ready and not self.race_active and self.preparation_start_time is not None:
+            if learning_time < self.race_learning_duration:
+                # 学習専用でフレームを背景モデルに追加（検出は行わない）
+                gray = self.detection_input(frame)
+                _ = self.bg_subtractor.apply(gray, learningRate=0.01)
+
+                # デバッグ: 背景学習状況を確認
+                if int(learning_time * 4) != getattr(self, '_debug_count', -1):  # 0.25秒ごと
+                    test_mask = self.bg_subtractor.apply(gray, learningRate=0)  # テスト用検出
+                    test_pixels = cv2.countNonZero(test_mask)
+                    self.log.debug('learning', "🔍 学習中デバッグ: {elapsed:.1f}s - Motion pixels: {pixels}",
+                                   elapsed=learning_time, pixels=test_pixels)
+                    self._debug_count = int(learning_time * 4)
+
+                # 背景学習中の進行状況を定期的に表示（0.5秒ごと）
+                if int(learning_time * 2) != getattr(self, '_last_progress_count', -1):
+                    self.log.info('learning', "⏳ 背景学習中... {elapsed:.1f}/{duration:.1f}秒",
+                                  elapsed=learning_time, duration=self.race_learning_duration)
+                    self._last_progress_count = int(learning_time * 2)
+            elif not self._learning_completed:
+                # 学習時間経過で学習完了（計測開始はしない）
+                self.complete_learning(self.detection_input(frame))
+
+        # 処理時間に応じて検出解像度を調整（目標FPSを維持）
+        elapsed = capture_clock() - started
+        if self.stage_timer is not None:
+            self.stage_timer('detection', elapsed)
+        if self.detection_scale.record(elapsed):
+            self.rebuild_background_model()
+
+    def process_sector_frame(self):
+        """セクター計測：オーバービューの新フレームを1枚処理（全境界を1回の前景マスクで判定）"""
+        timer = self.sector_timer
+        if not timer.enabled or self.capture_overview is None or self.car_tracker is not None:
+            return
+        if not (self.race_ready or self.race_active) or self.race_paused or self.race_complete:
+            return
+        # 表示側も読むので消費せず参照し、処理済みフレームは番号で判定
+        captured = self.capture_overview.peek_latest()
+        if captured is None or captured.frame_id == self._last_sector_frame_id:
+            return
+        self._last_sector_frame_id = captured.frame_id
+        started = capture_clock()
+        crossings = timer.update(captured.frame, captured.timestamp, self.detection_learning_rate())
+        if self.frame_recycled(self.capture_overview, captured):
+            return  # 上書き途中の画像での通過は記録しない
+        if self.race_active and self.current_lap_start is not None:
+            for index, split in timer.record(crossings, self.current_lap_start):
+                self.log.info('sector', "🚩 LAP{lap} S{sector}: {formatted}", lap=self.current_lap_number,
+                              sector=index + 1, split=split, formatted=format_time(split))
+                self._emit('sector', lap=self.current_lap_number, sector=index + 1, split=split)
+        if self.stage_timer is not None:
+            self.stage_timer('sectors', capture_clock() - started)
+
+    # ------------------------------------------------------------------
+    # エンジンループ
+    # ------------------------------------------------------------------
+    def step(self, timeout=0.05):
+        """1ステップ処理：スタートラインの新フレームを待って処理（最大timeout秒）"""
+        captured, is_new = None, False
+        if self.capture_start_line is not None:
+            captured, is_new = self.capture_start_line.wait_for_frame(timeout)
+        else:
+            time.sleep(min(timeout, 0.02))
+
+        with self.state_lock:
+            if self.race_paused:
+                self.update_pause_countdown()
+            if captured is not None:
+                self.current_startline_frame = captured
+                # 同じフレームで背景学習・検出を繰り返さない
+                if is_new:
+                    # 検出前にリングへ：検出したフレーム自体もクリップに入る
+                    self.clip_recorder.push(captured)
+                    self.process_startline_frame(captured)
+                    self.frame_recycled(self.capture_start_line, captured)
+            self.process_sector_frame()
+
+    def frame_recycled(self, capture, captured):
+        """処理中に captured の配列が入力のプールで再利用されたか（処理が retain フレーム以上遅れた）"""
+        if capture.holds(captured):
+            return False
+        self.log.warning('capture', "⚠️ [{camera}] フレーム#{frame_id} の処理中に配列が再利用されました（処理遅延）",
+                         camera=capture.camera_name, frame_id=captured.frame_id)
+        return True
+
+    def _run_loop(self):
+        while self.running:
+            try:
+                self.step()
+            except Exception as e:
+                self.log.error('engine', "❌ エンジンエラー: {error}", error=repr(e))
+
+    def start(self):
+        """エンジンスレッド起動（描画とは独立したカメラレートで検出）"""
+        if self._thread is not None:
+            return
+        self.running = True
+        self._thread = threading.Thread(target=self._run_loop, name="lap-timing-engine", daemon=True)
+        self._thread.start()
+
+    def shutdown(self):
+        """エンジン停止・リソース解放"""
+        self.running = False
+        if self._thread is not None:
+            self._thread.join(1.0)
+            self._thread = None
+        self.stop_capture_workers()
+        self.clip_recorder.close()
+        if self.camera_overview:
+            self.camera_overview.release()
+        if self.camera_start_line:
+            self.camera_start_line.release()
+        self.results.close()
+        self.log.close()
+
+
+def print_event(event):
+    """ヘッドレス実行時のコンソール購読者"""
+    if event['type'] == 'lap':
+        print(f"[EVENT] LAP{event['lap']}: {format_time(event['lap_time'])}")
+    elif event['type'] == 'race_complete':
+        print(f"[EVENT] FINISH TOTAL: {format_time(event['total_time'])}")
+    elif event['type'] == 'state':
+        print(f"[EVENT] STATE: {event['state']}")
+
+
+def main():
+    """ヘッドレス計測（標準入力でコマンド操作）"""
+    engine = LapTimingEngine()
+    engine.subscribe(print_event)
+    live_timing = LiveTimingServer(engine.config.get("live_timing_settings", {}))
+    if live_timing.enabled:
+        live_timing.attach(engine)
+        live_timing.start()
+    engine.init_cameras()
+    engine.start()
+    print("🚀 ヘッドレス計測エンジン開始")
+    print("📋 コマンド: s=計測準備, r=一時停止/再開, q=停止, d=手動検出, exit=終了")
+    try:
+        for line in sys.stdin:
+            command = line.strip().lower()
+            if command == 's':
+                if not engine.race_ready and not engine.race_active:
+                    engine.prepare_race()
+            elif command == 'r':
+                engine.toggle_pause()
+            elif command == 'q':
+                engine.stop_race()
+            elif command == 'd':
+                engine.manual_detection()
+            elif command in ('exit', 'quit'):
+                break
+    except KeyboardInterrupt:
+        print("\n⏹️ システム停止")
+    finally:
+        live_timing.stop()
+        engine.shutdown()
+
+
+if __name__ == "__main__":
+    main()
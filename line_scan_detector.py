@@ -0,0 +1,193 @@
+#!/usr/bin/env python3
+"""
+ラインスキャン（フォトフィニッシュ）検出
+- 毎フレーム、スタートライン周辺の画素列だけを cv2.remap でサンプリング（数千画素/フレーム）
+- ライン上の背景色（指数移動平均）との差が閾値を超えた画素数で通過を判定（1次元の変化検出）
+- 帯の幅に平行な数列を並べ、車両先端が何列目まで来たかからフレーム間の通過時刻を補間
+- MOG2・モルフォロジー・輪郭抽出なし：背景学習も1秒程度で済み、カメラの最大FPSで動作
+- サンプリングした列を時間方向に並べたラインスキャン画像を保持し、通過ごとにPNGで保存
+  （横軸=時刻、縦軸=ライン上の位置：判定に異議がある場合の確認用）
+"""
+
+import os
+import threading
+import time
+
+import cv2
+import numpy as np
+
+from start_line_tripwire import interpolate_crossing_time
+
+
+class LineScanDetector:
+    """スタートライン上の画素列による通過検出"""
+
+    def __init__(self, settings, tripwire, frame_size):
+        self.tripwire = tripwire
+        self.frame_size = frame_size
+        self.columns = max(1, settings.get("columns", 9))  # 帯の幅に並べる平行な列の数（奇数：中央がライン）
+        self.pixel_threshold = settings.get("pixel_threshold", 35)  # 背景色との差（0-255）
+        self.trigger_ratio = settings.get("trigger_ratio", 0.15)  # 列の長さに対する変化画素の割合
+        self.release_ratio = settings.get("release_ratio", 0.05)
+        self.background_alpha = settings.get("background_alpha", 0.02)
+        self.max_occupied_time = settings.get("max_occupied_time", 3.0)  # 停車・照明変化は背景に取り込む
+        self.max_interpolation_gap = settings.get("max_interpolation_gap", 0.2)
+        self.history = settings.get("scan_history", 900)
+        self.photo_dir = settings.get("photo_finish_dir", "photo_finish") if settings.get("save_photo_finish", True) else None
+        self.photo_span = settings.get("photo_finish_span", 1.0)  # 通過前後の保存秒数
+        self.stage_timer = None
+        self._build_maps()
+        self.reset()
+
+    def _line_points(self):
+        """サンプリングするライン（線のトリップワイヤー以外は帯/画面中央の縦線）"""
+        if self.tripwire is not None and self.tripwire.is_line:
+            return [tuple(map(float, p)) for p in self.tripwire.points]
+        if self.tripwire is not None:
+            x0, y0, x1, y1 = self.tripwire.roi
+        else:
+            x0, y0, x1, y1 = 0, 0, self.frame_size[0], self.frame_size[1]
+        center = (x0 + x1 - 1) / 2.0
+        return [(center, float(y0)), (center, float(y1 - 1))]
+
+    def _build_maps(self):
+        (x0, y0), (x1, y1) = self._line_points()
+        length = max(2, int(round(np.hypot(x1 - x0, y1 - y0))) + 1)
+        t = np.linspace(0.0, 1.0, length, dtype=np.float32)
+        # ラインの法線方向へ帯の幅いっぱいに並べた列（中央の列がスタートライン）
+        nx, ny = -(y1 - y0), (x1 - x0)
+        norm = max(1e-6, float(np.hypot(nx, ny)))
+        band_width = self.tripwire.band_width if self.tripwire is not None else 40
+        spacing = band_width / float(self.columns - 1) if self.columns > 1 else 0.0
+        offsets = (np.arange(self.columns, dtype=np.float32) - (self.columns - 1) / 2.0) * spacing
+        self.map_x = (x0 + (x1 - x0) * t)[None, :] + offsets[:, None] * (nx / norm)
+        self.map_y = (y0 + (y1 - y0) * t)[None, :] + offsets[:, None] * (ny / norm)
+        self.map_x = self.map_x.astype(np.float32)
+        self.map_y = self.map_y.astype(np.float32)
+        self.length = length
+        self.center_column = (self.columns - 1) // 2
+        self.trigger_pixels = max(1, int(length * self.trigger_ratio))
+        self.release_pixels = int(length * self.release_ratio)
+
+    def reset(self):
+        """計測準備ごとに背景・スキャン画像を初期化"""
+        self.background = None
+        self.occupied = False
+        self.occupied_since = None
+        self.prev_sample = (None, 0)
+        self.last_changed = 0
+        self.scan = np.zeros((self.history, self.length, 3), dtype=np.uint8)  # 中央の列のみ
+        self.scan_times = np.full(self.history, -np.inf)
+        self.scan_index = 0
+        self._pending_photos = []
+
+    def sample(self, frame):
+        """各列の画素（columns x length x 3, float32）"""
+        if self.tripwire is not None and self.tripwire.fit_frame(frame):
+            self._build_maps()
+            self.reset()
+        if frame.ndim == 2:
+            frame = cv2.cvtColor(frame, cv2.COLOR_GRAY2BGR)
+        pixels = cv2.remap(frame, self.map_x, self.map_y, cv2.INTER_LINEAR, borderMode=cv2.BORDER_REPLICATE)
+        return pixels.astype(np.float32)
+
+    def update(self, frame, timestamp, learning=False):
+        """1フレーム分の処理：通過を検出したら補間した通過時刻を返す"""
+        t0 = time.perf_counter()
+        lines = self.sample(frame)
+
+        # ラインスキャン画像へ追記（リング）
+        self.scan[self.scan_index] = lines[self.center_column]
+        self.scan_times[self.scan_index] = timestamp
+        self.scan_index = (self.scan_index + 1) % self.history
+        self._flush_photos(timestamp)
+
+        if self.background is None:
+            self.background = lines.copy()
+        if learning:
+            cv2.accumulateWeighted(lines, self.background, 0.2)  # 学習中は速く追従
+            self.prev_sample = (None, 0)
+            self._record_stage(t0)
+            return None
+
+        # 列ごとの変化画素数 → 車両がかかっている列
+        changed = np.count_nonzero(np.abs(lines - self.background).max(axis=2) > self.pixel_threshold, axis=1)
+        hit_columns = changed >= self.trigger_pixels
+        hits = int(np.count_nonzero(hit_columns))
+        center_changed = int(changed[self.center_column])
+        self.last_changed = center_changed
+        prev_timestamp, prev_hits = self.prev_sample
+        self.prev_sample = (timestamp, hits)
+
+        crossing_time = None
+        if not self.occupied:
+            if hit_columns[self.center_column]:
+                self.occupied = True
+                self.occupied_since = timestamp
+                if prev_timestamp is not None and timestamp - prev_timestamp <= self.max_interpolation_gap:
+                    # 進入側から中央の列まで（center_column+1列）かかった時刻を補間
+                    crossing_time = interpolate_crossing_time(prev_timestamp, prev_hits, timestamp,
+                                                              hits, self.center_column + 1)
+                else:
+                    crossing_time = timestamp
+        elif center_changed <= self.release_pixels:
+            self.occupied = False
+        elif timestamp - self.occupied_since > self.max_occupied_time:
+            # 長時間変化したまま（停車・照明の急変）：現在の色を背景として取り込む
+            self.background[:] = lines
+            self.occupied = False
+
+        # 車両がかかっていない列だけ背景を更新（日差しの変化などに追従）
+        idle = np.repeat((~hit_columns).astype(np.uint8)[:, None], self.length, axis=1)
+        cv2.accumulateWeighted(lines, self.background, self.background_alpha, mask=idle)
+
+        self._record_stage(t0)
+        return crossing_time
+
+    def _record_stage(self, t0):
+        if self.stage_timer is not None:
+            self.stage_timer('line_scan', time.perf_counter() - t0)
+
+    # ------------------------------------------------------------------
+    # フォトフィニッシュ画像
+    # ------------------------------------------------------------------
+    def request_photo_finish(self, crossing_time, label):
+        """通過後 photo_span 秒分のフレームが揃ったら保存"""
+        if self.photo_dir is not None:
+            self._pending_photos.append((crossing_time, label))
+
+    def photo_finish_image(self, crossing_time, span=None):
+        """通過時刻前後のラインスキャン画像（横軸=時刻、通過位置に赤い縦線）"""
+        span = self.photo_span if span is None else span
+        order = np.roll(np.arange(self.history), -self.scan_index)  # 古い順
+        times = self.scan_times[order]
+        selected = order[(times >= crossing_time - span) & (times <= crossing_time + span)]
+        if len(selected) == 0:
+            return None
+        image = np.ascontiguousarray(self.scan[selected].transpose(1, 0, 2))
+        marker = int(np.searchsorted(self.scan_times[selected], crossing_time))
+        if 0 <= marker < image.shape[1]:
+            image[:, marker] = (0, 0, 255)
+        return image
+
+    def _flush_photos(self, timestamp):
+        remaining = []
+        for crossing_time, label in self._pending_photos:
+            if timestamp < crossing_time + self.photo_span:
+                remaining.append((crossing_time, label))
+                continue
+            image = self.photo_finish_image(crossing_time)
+            if image is not None:
+                path = os.path.join(self.photo_dir, f"{time.strftime('%Y%m%d-%H%M%S')}_{label}.png")
+                # PNG圧縮は検出ループの外で
+                threading.Thread(target=self._write_photo, args=(path, image), daemon=True).start()
+        self._pending_photos = remaining
+
+    @staticmethod
+    def _write_photo(path, image):
+        try:
+            os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+            cv2.imwrite(path, image)
+            print(f"📸 フォトフィニッシュ保存: {path}")
+        except Exception as e:
+            print(f"⚠️ フォトフィニッシュ保存失敗: {e}")
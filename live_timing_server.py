@@ -0,0 +1,558 @@
+#!/usr/bin/env python3
+"""
+ライブタイミング配信（画面共有の代わりに、状態・ラップ・一時停止をイベントとして配信）
+- エンジンイベントの購読者：受け取ったイベントを短いJSONメッセージにして送信キューへ積むだけ（検出ループを待たせない）
+- WebSocket（標準ライブラリのみ）：接続直後に全体スナップショット、その後は差分（seq 連番付き）
+  同じポートの http://<host>:<port>/ でブラウザ用スコアボードを表示
+- UDPマルチキャスト（任意）：差分に加え、途中参加用のスナップショットを定期送信
+- 計時中のラップ・総時間は「送信時点の経過秒」で送る：受信側の時計とずれていても表示が合う
+- 外部サービス不要：送信は1本の配信スレッド（selectors）が担当し、遅いクライアントは切断
+
+確認用クライアント:
+    python live_timing_server.py                    # WebSocket（既定: 127.0.0.1:8765）のメッセージを表示
+    python live_timing_server.py --udp              # マルチキャストを受信して表示
+"""
+
+import argparse
+import base64
+import hashlib
+import json
+import queue
+import selectors
+import socket
+import struct
+import threading
+import time
+from collections import deque
+
+from camera_capture import capture_clock
+
+
+WEBSOCKET_GUID = "258EAFA5-E914-47DA-95CA-C5AB0DC85B11"
+MAX_CLIENT_BACKLOG = 1024 * 1024  # 送信待ちがこれを超えたクライアントは切断
+
+SCOREBOARD_HTML = """<!DOCTYPE html>
+<html><head><meta charset="utf-8"><title>Live Timing</title>
+<style>
+body{background:#0f0f19;color:#fff;font-family:sans-serif;margin:2em}
+#state{font-size:2em;color:#ffff32}#clock{font-size:4em;color:#00ff64}
+td{padding:.2em 1em;font-size:1.5em}.best{color:#ffff32}
+</style></head><body>
+<div id="state">connecting...</div><div id="clock">--:--.---</div>
+<div>TOTAL <span id="total">--:--.---</span> &nbsp; BEST <span id="best">--:--.---</span></div>
+<table id="laps"></table>
+<script>
+let s = {laps: []}, lapRef = null, totalRef = null, seq = 0;
+const fmt = t => t == null ? "--:--.---" :
+  String(Math.floor(t / 60)).padStart(2, "0") + ":" + (t % 60).toFixed(3).padStart(6, "0");
+function refs(m) {
+  const now = performance.now() / 1000;
+  lapRef = m.lap_elapsed == null ? null : [now - m.lap_elapsed, m.running];
+  totalRef = m.total_elapsed == null ? null : [now - m.total_elapsed, m.running];
+}
+function render() {
+  document.getElementById("state").textContent = s.state + (s.lap ? "  LAP" + s.lap : "");
+  document.getElementById("best").textContent = fmt(s.best);
+  document.getElementById("laps").innerHTML = s.laps.slice().reverse().map(([n, t]) =>
+    `<tr class="${t === s.best ? "best" : ""}"><td>LAP${n}</td><td>${fmt(t)}</td></tr>`).join("");
+}
+function tick() {
+  const now = performance.now() / 1000;
+  const value = (ref, held) => ref == null ? null : (ref[1] ? now - ref[0] : held);
+  document.getElementById("clock").textContent = fmt(value(lapRef, s.clock_held));
+  document.getElementById("total").textContent = fmt(s.total != null ? s.total : value(totalRef, s.total_held));
+  requestAnimationFrame(tick);
+}
+function connect() {
+  const ws = new WebSocket("ws://" + location.host + "/ws");
+  ws.onmessage = e => {
+    const m = JSON.parse(e.data);
+    if (m.type !== "snapshot" && m.seq <= seq) return;
+    seq = m.seq;
+    if (m.type === "snapshot") s = m; else Object.assign(s, m.state_fields || {});
+    if (m.type === "lap") { s.laps.push([m.lap, m.lap_time]); s.laps = s.laps.slice(-20); }
+    if ("lap_elapsed" in m) { refs(m); s.clock_held = m.lap_elapsed; s.total_held = m.total_elapsed; }
+    render();
+  };
+  ws.onclose = () => { document.getElementById("state").textContent = "disconnected"; setTimeout(connect, 1000); };
+}
+connect(); tick();
+</script></body></html>
+"""
+
+
+def _encode_frame(payload, opcode=0x1):
+    """サーバー→クライアントのWebSocketフレーム（マスクなし）"""
+    header = bytes([0x80 | opcode])
+    length = len(payload)
+    if length < 126:
+        header += bytes([length])
+    elif length < 65536:
+        header += bytes([126]) + struct.pack('!H', length)
+    else:
+        header += bytes([127]) + struct.pack('!Q', length)
+    return header + payload
+
+
+def _decode_frames(buffer):
+    """受信バッファから完全なフレームを取り出す：([(opcode, payload)], 残り)"""
+    frames = []
+    while len(buffer) >= 2:
+        opcode = buffer[0] & 0x0F
+        masked = buffer[1] & 0x80
+        length = buffer[1] & 0x7F
+        offset = 2
+        if length == 126:
+            if len(buffer) < 4:
+                break
+            length = struct.unpack('!H', buffer[2:4])[0]
+            offset = 4
+        elif length == 127:
+            if len(buffer) < 10:
+                break
+            length = struct.unpack('!Q', buffer[2:10])[0]
+            offset = 10
+        mask = b''
+        if masked:
+            mask = buffer[offset:offset + 4]
+            offset += 4
+        if len(buffer) < offset + length:
+            break
+        payload = bytes(buffer[offset:offset + length])
+        if masked:
+            payload = bytes(b ^ mask[i % 4] for i, b in enumerate(payload))
+        frames.append((opcode, payload))
+        buffer = buffer[offset + length:]
+    return frames, buffer
+
+
+class _Client:
+    """接続中のクライアント（HTTPリクエスト受信中 → WebSocket）"""
+
+    def __init__(self, sock, address):
+        self.sock = sock
+        self.address = address
+        self.inbox = b''
+        self.outbox = bytearray()
+        self.websocket = False
+        self.closing = False  # 送信し終えたら切断
+
+
+class LiveTimingServer:
+    """エンジンイベントを WebSocket / UDPマルチキャストへ配信"""
+
+    def __init__(self, settings=None):
+        settings = settings or {}
+        self.enabled = settings.get("enabled", False)
+        self.host = settings.get("host", "0.0.0.0")
+        self.port = settings.get("port", 8765)
+        self.multicast_group = settings.get("multicast_group")  # None: UDP配信なし
+        self.multicast_port = settings.get("multicast_port", 5007)
+        self.multicast_ttl = settings.get("multicast_ttl", 1)
+        self.snapshot_interval = settings.get("udp_snapshot_interval", 1.0)  # UDPの途中参加用
+        self.snapshot_laps = settings.get("snapshot_laps", 20)
+
+        self._lock = threading.Lock()
+        self._seq = 0
+        self._model = {
+            'state': 'standby', 'lap': 0, 'max_laps': 0, 'laps': deque(maxlen=self.snapshot_laps),
+            'best': None, 'total': None, 'pause_count': 0, 'cars': {},
+        }
+        self._lap_start = None  # 計時中ラップの開始（capture_clock）
+        self._race_start = None
+        self._held = None  # 一時停止中の (ラップ経過, 総経過)
+        self._outgoing = queue.SimpleQueue()
+        self._thread = None
+        self._stopping = False
+        self._wake_r = self._wake_w = None
+        self._listener = None
+        self._udp = None
+        self._clients = {}
+
+    # ------------------------------------------------------------------
+    # イベント → メッセージ（エンジンスレッドから呼ばれる）
+    # ------------------------------------------------------------------
+    def attach(self, engine):
+        """エンジンの現在状態を初期値にして購読"""
+        with engine.state_lock:
+            with self._lock:
+                model = self._model
+                model['state'] = engine.race_state()
+                model['lap'] = engine.current_lap_number
+                model['max_laps'] = engine.max_laps
+                model['pause_count'] = engine.pause_count
+                model['best'] = engine.lap_stats.best
+                first = engine.lap_count - len(engine.lap_times) + 1
+                model['laps'].extend([first + i, t] for i, t in enumerate(engine.lap_times))
+                if engine.race_active:
+                    self._lap_start = engine.current_lap_start
+                    self._race_start = engine.race_start_time
+                    if engine.race_paused and engine.paused_lap_time is not None:
+                        self._held = (engine.paused_lap_time, engine.paused_total_time)
+                if engine.race_complete:
+                    model['total'] = engine.total_time
+            engine.subscribe(self.on_event)
+
+    def _timing_fields(self, now):
+        """計時中の経過秒（送信時点）：受信側は受信時刻から数え始める"""
+        if self._held is not None:
+            return {'lap_elapsed': self._held[0], 'total_elapsed': self._held[1], 'running': False}
+        if self._lap_start is None:
+            return {'lap_elapsed': None, 'total_elapsed': None, 'running': False}
+        return {'lap_elapsed': now - self._lap_start,
+                'total_elapsed': now - self._race_start if self._race_start is not None else None,
+                'running': True}
+
+    def on_event(self, event):
+        """エンジンイベント購読者：状態モデルを更新して差分メッセージを送信キューへ"""
+        if not self.enabled:
+            return
+        kind = event['type']
+        now = capture_clock()
+        with self._lock:
+            model = self._model
+            message = {'type': kind}
+            if kind == 'state':
+                state = event['state']
+                model['state'] = 'active' if state == 'resumed' else state
+                if state in ('ready', 'standby'):
+                    self._lap_start = self._race_start = self._held = None
+                    model['lap'] = 0
+                    if state == 'ready':
+                        model['laps'].clear()
+                        model['best'] = model['total'] = None
+                        model['pause_count'] = 0
+                        model['cars'] = {}
+                elif state == 'paused':
+                    model['pause_count'] = event.get('pause_count', model['pause_count'])
+                    self._held = (event.get('lap_time'), event.get('total_time'))
+                elif state == 'resumed' and self._held is not None:
+                    lap_elapsed, total_elapsed = self._held
+                    if lap_elapsed is not None:
+                        self._lap_start = now - lap_elapsed
+                    if total_elapsed is not None:
+                        self._race_start = now - total_elapsed
+                    self._held = None
+                elif state == 'finished':
+                    self._lap_start = self._held = None
+                if 'lap' in event:
+                    model['lap'] = event['lap']
+                message['state_fields'] = {'state': model['state'], 'lap': model['lap'],
+                                           'pause_count': model['pause_count']}
+                message.update(self._timing_fields(now))
+            elif kind == 'race_start':
+                self._race_start = self._lap_start = event['start_time']
+                self._held = None
+                message.update(self._timing_fields(now))
+            elif kind == 'lap':
+                lap_time = event['lap_time']
+                model['laps'].append([event['lap'], lap_time])
+                if model['best'] is None or lap_time < model['best']:
+                    model['best'] = lap_time
+                self._lap_start = event['crossing_time']
+                message.update(lap=event['lap'], lap_time=lap_time, state_fields={'best': model['best']})
+                if 'splits' in event:
+                    message.update(splits=event['splits'], sectors=event['sectors'])
+                message.update(self._timing_fields(now))
+            elif kind == 'sector':
+                message.update(lap=event['lap'], sector=event['sector'], split=event['split'])
+            elif kind == 'race_complete':
+                model['total'] = event['total_time']
+                self._lap_start = self._race_start = self._held = None
+                message['state_fields'] = {'total': model['total']}
+                message.update(self._timing_fields(now))
+            elif kind in ('car_start', 'car_lap', 'car_finished'):
+                car = model['cars'].setdefault(str(event['car_id']), {'laps': 0, 'last': None, 'best': None,
+                                                                     'finished': False})
+                if kind == 'car_lap':
+                    car['laps'] = event['lap']
+                    car['last'] = event['lap_time']
+                    car['best'] = event['lap_time'] if car['best'] is None else min(car['best'], event['lap_time'])
+                elif kind == 'car_finished':
+                    car['finished'] = True
+                message.update(car_id=event['car_id'], car=dict(car))
+            else:
+                return  # learning_complete など表示に不要なイベント
+            self._seq += 1
+            message['seq'] = self._seq
+            payload = json.dumps(message, separators=(',', ':')).encode('utf-8')
+        self._outgoing.put(payload)
+        if self._wake_w is not None:
+            try:
+                self._wake_w.send(b'\0')
+            except OSError:
+                pass
+
+    def snapshot(self):
+        """途中参加用の全体状態（seq はこの時点までの差分を含む）"""
+        with self._lock:
+            message = {key: (list(value) if isinstance(value, deque) else value)
+                       for key, value in self._model.items()}
+            message.update(self._timing_fields(capture_clock()))
+            message['type'] = 'snapshot'
+            message['seq'] = self._seq
+            return json.dumps(message, separators=(',', ':')).encode('utf-8')
+
+    # ------------------------------------------------------------------
+    # 配信スレッド
+    # ------------------------------------------------------------------
+    def start(self):
+        """待ち受け開始（enabled でなければ何もしない）"""
+        if not self.enabled or self._thread is not None:
+            return
+        try:
+            self._listener = socket.create_server((self.host, self.port), reuse_port=False)
+            self._listener.setblocking(False)
+            if self.multicast_group:
+                self._udp = socket.socket(socket.AF_INET, socket.SOCK_DGRAM, socket.IPPROTO_UDP)
+                self._udp.setsockopt(socket.IPPROTO_IP, socket.IP_MULTICAST_TTL, self.multicast_ttl)
+        except OSError as e:
+            print(f"⚠️ ライブタイミング配信を開始できません ({self.host}:{self.port}): {e}")
+            self.enabled = False
+            return
+        self.port = self._listener.getsockname()[1]  # port=0 の場合は割り当てられた番号
+        self._wake_r, self._wake_w = socket.socketpair()
+        self._wake_r.setblocking(False)
+        self._thread = threading.Thread(target=self._run, name="live-timing", daemon=True)
+        self._thread.start()
+        udp = f" / UDP {self.multicast_group}:{self.multicast_port}" if self._udp else ""
+        print(f"📡 ライブタイミング配信: http://{self.host}:{self.port}/{udp}")
+
+    def _run(self):
+        selector = selectors.DefaultSelector()
+        selector.register(self._listener, selectors.EVENT_READ, 'accept')
+        selector.register(self._wake_r, selectors.EVENT_READ, 'wake')
+        next_udp_snapshot = 0.0
+        while not self._stopping:
+            timeout = max(0.0, next_udp_snapshot - time.monotonic()) if self._udp else None
+            for key, mask in selector.select(timeout):
+                if key.data == 'accept':
+                    self._accept(selector)
+                elif key.data == 'wake':
+                    try:
+                        self._wake_r.recv(4096)
+                    except OSError:
+                        pass
+                else:
+                    client = key.data
+                    if mask & selectors.EVENT_READ:
+                        self._read(selector, client)
+                    if mask & selectors.EVENT_WRITE and client.sock.fileno() != -1:
+                        self._flush(selector, client)
+            self._broadcast_pending(selector)
+            if self._udp and time.monotonic() >= next_udp_snapshot:
+                self._send_udp(self.snapshot())
+                next_udp_snapshot = time.monotonic() + self.snapshot_interval
+        for client in list(self._clients.values()):
+            self._close(selector, client)
+        selector.close()
+
+    def _accept(self, selector):
+        try:
+            sock, address = self._listener.accept()
+        except OSError:
+            return
+        sock.setblocking(False)
+        sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        client = _Client(sock, address)
+        self._clients[sock] = client
+        selector.register(sock, selectors.EVENT_READ, client)
+
+    def _read(self, selector, client):
+        try:
+            data = client.sock.recv(65536)
+        except BlockingIOError:
+            return
+        except OSError:
+            data = b''
+        if not data:
+            self._close(selector, client)
+            return
+        client.inbox += data
+        if not client.websocket:
+            if b'\r\n\r\n' in client.inbox:
+                self._handle_http(selector, client)
+            elif len(client.inbox) > 16384:
+                self._close(selector, client)
+            return
+        frames, client.inbox = _decode_frames(client.inbox)
+        for opcode, payload in frames:
+            if opcode == 0x8:  # close
+                self._queue(selector, client, _encode_frame(payload[:2], 0x8))
+                client.closing = True
+            elif opcode == 0x9:  # ping
+                self._queue(selector, client, _encode_frame(payload, 0xA))
+
+    def _handle_http(self, selector, client):
+        head = client.inbox.split(b'\r\n\r\n', 1)[0].decode('latin-1')
+        lines = head.split('\r\n')
+        parts = lines[0].split()
+        path = parts[1] if len(parts) >= 2 else '/'
+        headers = {}
+        for line in lines[1:]:
+            name, _, value = line.partition(':')
+            headers[name.strip().lower()] = value.strip()
+        client.inbox = b''
+        key = headers.get('sec-websocket-key')
+        if key and 'websocket' in headers.get('upgrade', '').lower():
+            accept = base64.b64encode(hashlib.sha1((key + WEBSOCKET_GUID).encode('ascii')).digest()).decode()
+            response = ("HTTP/1.1 101 Switching Protocols\r\nUpgrade: websocket\r\nConnection: Upgrade\r\n"
+                        f"Sec-WebSocket-Accept: {accept}\r\n\r\n").encode('ascii')
+            # 積まれている差分は既存クライアントへ送ってから、このクライアントにはスナップショット
+            # （その後に差分が積まれても seq で重複を判別できる）
+            self._broadcast_pending(selector)
+            client.websocket = True
+            self._queue(selector, client, response + _encode_frame(self.snapshot()))
+            return
+        if path in ('/', '/index.html'):
+            body = SCOREBOARD_HTML.encode('utf-8')
+            status, content_type = "200 OK", "text/html; charset=utf-8"
+        elif path == '/snapshot':
+            body = self.snapshot()
+            status, content_type = "200 OK", "application/json"
+        else:
+            body = b'not found'
+            status, content_type = "404 Not Found", "text/plain"
+        response = (f"HTTP/1.1 {status}\r\nContent-Type: {content_type}\r\nContent-Length: {len(body)}\r\n"
+                    "Cache-Control: no-store\r\nConnection: close\r\n\r\n").encode('ascii')
+        self._queue(selector, client, response + body)
+        client.closing = True
+
+    def _broadcast_pending(self, selector):
+        while True:
+            try:
+                payload = self._outgoing.get_nowait()
+            except queue.Empty:
+                return
+            frame = _encode_frame(payload)
+            for client in list(self._clients.values()):
+                if client.websocket and not client.closing:
+                    self._queue(selector, client, frame)
+            self._send_udp(payload)
+
+    def _send_udp(self, payload):
+        if self._udp is None:
+            return
+        try:
+            self._udp.sendto(payload, (self.multicast_group, self.multicast_port))
+        except OSError:
+            pass
+
+    def _queue(self, selector, client, data):
+        if len(client.outbox) + len(data) > MAX_CLIENT_BACKLOG:
+            self._close(selector, client)  # 受信が追いつかないクライアント
+            return
+        client.outbox += data
+        self._flush(selector, client)
+
+    def _flush(self, selector, client):
+        if client.sock.fileno() == -1:
+            return
+        try:
+            sent = client.sock.send(client.outbox) if client.outbox else 0
+            del client.outbox[:sent]
+        except BlockingIOError:
+            pass
+        except OSError:
+            self._close(selector, client)
+            return
+        if client.outbox:
+            selector.modify(client.sock, selectors.EVENT_READ | selectors.EVENT_WRITE, client)
+        elif client.closing:
+            self._close(selector, client)
+        else:
+            selector.modify(client.sock, selectors.EVENT_READ, client)
+
+    def _close(self, selector, client):
+        if self._clients.pop(client.sock, None) is None:
+            return
+        try:
+            selector.unregister(client.sock)
+        except (KeyError, ValueError):
+            pass
+        client.sock.close()
+
+    @property
+    def client_count(self):
+        return sum(1 for client in list(self._clients.values()) if client.websocket)
+
+    def stop(self, timeout=1.0):
+        if self._thread is None:
+            return
+        self._stopping = True
+        self._wake_w.send(b'\0')
+        self._thread.join(timeout)
+        self._thread = None
+        for sock in (self._listener, self._udp, self._wake_r, self._wake_w):
+            if sock is not None:
+                sock.close()
+
+
+# ----------------------------------------------------------------------
+# 確認用クライアント
+# ----------------------------------------------------------------------
+def listen_websocket(host, port):
+    """WebSocketで接続し、受信したメッセージを表示"""
+    sock = socket.create_connection((host, port))
+    key = base64.b64encode(hashlib.sha1(str(time.time()).encode()).digest()[:16]).decode()
+    sock.sendall((f"GET /ws HTTP/1.1\r\nHost: {host}:{port}\r\nUpgrade: websocket\r\nConnection: Upgrade\r\n"
+                  f"Sec-WebSocket-Key: {key}\r\nSec-WebSocket-Version: 13\r\n\r\n").encode('ascii'))
+    buffer = b''
+    while b'\r\n\r\n' not in buffer:
+        data = sock.recv(4096)
+        if not data:
+            return
+        buffer += data
+    status, buffer = buffer.split(b'\r\n\r\n', 1)
+    if b' 101 ' not in status.split(b'\r\n')[0]:
+        print(f"⚠️ WebSocket接続失敗: {status.decode('latin-1')}")
+        return
+    while True:
+        frames, buffer = _decode_frames(buffer)
+        for opcode, payload in frames:
+            if opcode == 0x8:
+                return
+            if opcode == 0x1:
+                print(payload.decode('utf-8'))
+        data = sock.recv(65536)
+        if not data:
+            return
+        buffer += data
+
+
+def listen_udp(group, port):
+    """マルチキャストを受信して表示"""
+    sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM, socket.IPPROTO_UDP)
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    sock.bind(('', port))
+    membership = struct.pack('4s4s', socket.inet_aton(group), socket.inet_aton('0.0.0.0'))
+    sock.setsockopt(socket.IPPROTO_IP, socket.IP_ADD_MEMBERSHIP, membership)
+    while True:
+        data, _ = sock.recvfrom(65536)
+        print(data.decode('utf-8'))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="ライブタイミング配信の受信確認")
+    parser.add_argument('--config', default='config.json')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--udp', action='store_true', help="マルチキャストを受信")
+    args = parser.parse_args()
+
+    settings = {}
+    try:
+        with open(args.config, 'r', encoding='utf-8') as f:
+            settings = json.load(f).get("live_timing_settings", {})
+    except (OSError, ValueError):
+        pass
+    try:
+        if args.udp:
+            listen_udp(settings.get("multicast_group") or "239.255.42.99", settings.get("multicast_port", 5007))
+        else:
+            listen_websocket(args.host, settings.get("port", 8765))
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
@@ -5,25 +5,36 @@ Teams共有用シンプル表示タイム計測システム (v12 - 機能拡張
 - 3周分の個別ラップタイム表示 (LAP1/LAP2/LAP3/TOTAL)
 - ローリングスタートルール: Sキー押下後、スタートライン通過で計測開始
 - 3周完了で自動停止・結果表示
+- race_settings.max_laps で周回数を変更（0 = 無制限の練習走行：直近3周のスクロール表示＋逐次統計）
 - 一時停止システム: Rキーでレース一時停止/再開（5秒カウントダウン付き）
 - v12改良点: v11の一時停止機能をベースに追加機能開発用
+- 計測処理は lap_timing_engine.LapTimingEngine（pygame非依存）が担当し、本画面はその購読者
+- pipeline_settings.mode = "process" でカメラごとのプロセス分離（multiprocess_pipeline）
+- 起動時はウィンドウを先に表示し、カメラ検出（camera_probe：並列・前回構成優先）は別スレッドで実行
+- live_timing_settings.enabled でラップ・状態をWebSocket/UDPへ配信（live_timing_server：ブラウザ用スコアボード付き）
+- Pキーでステージ別処理時間（p50/p99）とFPSのオーバーレイ、終了時にCSV/JSONへ書き出し（profiler）
 """
 
 import pygame
 import cv2
-import time
-import numpy as np
-import json
 import threading
-from datetime import datetime
-import os
-import sys
+import time
+from collections import deque
 
-pygame.init()
-pygame.font.init()  # フォント初期化を明示的に実行
+from lap_timing_engine import LapTimingEngine, format_time
+from live_timing_server import LiveTimingServer
+from multiprocess_pipeline import create_engine
+from profiler import StageProfiler
+from preview_renderer import CameraPreview
+from screen_renderer import DirtyRectScreen
 
 class TeamsSimpleLaptimeSystemFixedV12:
-    def __init__(self):
+    LAP_ROWS = 3  # ラップ表示の行数（それより前の周はスクロールアウト）
+
+    def __init__(self, engine=None):
+        # 使うサブシステムだけ初期化（pygame.init() は音声・ジョイスティック等も初期化するため起動が遅い）
+        pygame.display.init()
+        pygame.font.init()  # フォント初期化を明示的に実行
         self.screen_width = 1280
         self.screen_height = 720
         self.screen = pygame.display.set_mode((self.screen_width, self.screen_height))
@@ -46,572 +57,257 @@ class TeamsSimpleLaptimeSystemFixedV12:
             self.font_large = pygame.font.Font(None, 80)
             self.font_medium = pygame.font.Font(None, 48)
             self.font_small = pygame.font.Font(None, 32)
+            self.font_tiny = pygame.font.Font(None, 22)
         except:
             try:
                 self.font_huge = pygame.font.SysFont('arial', 120, bold=True)
                 self.font_large = pygame.font.SysFont('arial', 80, bold=True)
                 self.font_medium = pygame.font.SysFont('arial', 48)
                 self.font_small = pygame.font.SysFont('arial', 32)
+                self.font_tiny = pygame.font.SysFont('arial', 16)
             except:
                 # 最終手段：デフォルトフォント
                 self.font_huge = pygame.font.Font(pygame.font.get_default_font(), 120)
                 self.font_large = pygame.font.Font(pygame.font.get_default_font(), 80)
                 self.font_medium = pygame.font.Font(pygame.font.get_default_font(), 48)
                 self.font_small = pygame.font.Font(pygame.font.get_default_font(), 32)
+                self.font_tiny = pygame.font.Font(pygame.font.get_default_font(), 16)
         
-        self.camera_overview = None
-        self.camera_start_line = None
-        self.bg_subtractor = None
-        
-        # v8: 3周計測システム状態管理
-        self.race_ready = False  # S押し後の計測準備状態
-        self.race_active = False  # 実際の計測開始状態
-        self.lap_count = 0  # 完了したラップ数
-        self.current_lap_number = 0  # 現在計測中のラップ番号
-        self.current_lap_start = None
-        self.race_start_time = None
-        self.total_time = 0.0
-        self.current_lap_time = 0.0  # 現在のラップの進行時間
-        
-        # 3周計測用ラップタイム記録
-        self.lap_times = [0.0, 0.0, 0.0]  # LAP1, LAP2, LAP3
-        self.max_laps = 3  # 3周設定
-        self.race_complete = False  # 3周完了フラグ
+        # 計測エンジン（カメラ・検出・レース状態）：表示はイベント購読者として動作
+        self.engine = engine if engine is not None else LapTimingEngine()
+        self.engine.subscribe(self.on_engine_event)
+        self.recent_events = deque(maxlen=20)  # エンジンスレッドから受け取ったイベント
         
-        # v12: 一時停止/再開システム（v11から継承）
-        self.race_paused = False  # レース一時停止フラグ
-        self.pause_countdown = 0  # 5秒カウントダウン
-        self.pause_start_time = None  # 一時停止開始時刻
-        self.paused_lap_time = None  # 一時停止時のラップ経過時間
-        self.paused_total_time = None  # 一時停止時の総経過時間
-        self.total_pause_time = 0.0  # 総一時停止時間
-        self.pause_count = 0  # 一時停止回数
-        self.pause_count = 0  # 一時停止回数
-        
-        # v7継承: 検出関連
-        self.last_detection_time = 0
-        self.preparation_start_time = None  # 準備開始時刻
-        self.last_motion_pixels = 0
-        self.motion_history = []
-        self.stable_frame_count = 0
-        self.motion_area_ratio = 0.0
         self.running = True
+        self.cameras_ready = False  # カメラ初期化はウィンドウ表示後に別スレッドで実行
+        self._startup_thread = None
         self.clock = pygame.time.Clock()
         self.fps = 60
-        self.current_overview_frame = None
-        self.current_startline_frame = None
-        self.available_cameras = []
         
-        self.load_config()
-        self.frame_lock = threading.Lock()
+        # スタートライン トリップワイヤー（マウスドラッグで設定）
+        self.startline_view_rect = pygame.Rect(430, 80, 375, 280)
+
+        # カメラプレビュー（375x280で統一・バッファ使い回し）
+        preview_fps = self.engine.config.get("display_settings", {}).get("preview_fps", 15)
+        self.overview_view_rect = pygame.Rect(30, 80, 375, 280)
+        self.overview_preview = CameraPreview(self.overview_view_rect, "Overview Camera",
+                                              self.font_small, self.font_medium, self.colors, preview_fps)
+        self.startline_preview = CameraPreview(self.startline_view_rect, "Start Line Camera",
+                                               self.font_small, self.font_medium, self.colors, preview_fps)
+        self._last_overlay_state = None
+        self._last_sector_state = None
+
+        # 差分描画（静的背景＋変化した文字列・領域のみ更新）
+        self.renderer = DirtyRectScreen(self.screen)
+        self.text_cache = self.renderer.text_cache
+        self._car_rows_drawn = 0
+        self._stats_texts = []
+        self._stats_updated = 0.0
+        self.tripwire_drag_start = None
+        self.tripwire_drag_end = None
+
+        # チーム（Tキーで切り替え）とセッション内ベスト
+        self.team_best = self.engine.results.best_total(self.engine.results.team)
+
+        # ステージ別処理時間（Pキーでオーバーレイ表示）
+        profiler_settings = self.engine.config.get("profiler_settings", {})
+        self.profiler = StageProfiler(profiler_settings)
+        if self.profiler.enabled:
+            if self.engine.stage_timer is None:
+                self.engine.stage_timer = self.profiler.record
+            self.overview_preview.stage_timer = self.profiler.record
+            self.startline_preview.stage_timer = self.profiler.record
+            self.renderer.text_cache.stage_timer = self.profiler.record
+        self.show_profile = profiler_settings.get("overlay", False)
+
+        # ライブタイミング配信（画面共有の代わりにブラウザ・他PCへイベント配信）
+        self.live_timing = LiveTimingServer(self.engine.config.get("live_timing_settings", {}))
+        if self.live_timing.enabled:
+            self.live_timing.attach(self.engine)
+            self.live_timing.start()
+        self._profile_surface = None
+        self._profile_updated = 0.0
         
         print(f"[v8 3-LAP SYSTEM] 初期化完了")
         print(f"[v8] LAP1/LAP2/LAP3の3周計測システム")
         print(f"[v8] ローリングスタート対応（Sキー準備→通過開始）")
         print(f"[v8] 救済システム（Rキーで5秒ペナルティ）")
 
-    def load_config(self):
-        try:
-            with open('config.json', 'r') as f:
-                self.config = json.load(f)
-        except FileNotFoundError:
-            # v7継承: 高感度設定
-            self.config = {
-                "camera_settings": {
-                    "overview_camera_index": 0,
-                    "startline_camera_index": 0,  # 修正: 同じカメラを使用
-                    "frame_width": 640,
-                    "frame_height": 480
-                },
-                "detection_settings": {
-                    "motion_pixels_threshold": 300,      # v7高感度設定継承
-                    "min_contour_area": 200,
-                    "motion_area_ratio_min": 0.008,
-                    "motion_area_ratio_max": 0.9,
-                    "stable_frames_required": 2,
-                    "motion_consistency_check": False
-                },
-                "race_settings": {
-                    "max_laps": 3,  # v8: 3周固定
-                    "detection_cooldown": 5.0  # 誤検出防止のため延長
-                }
-            }
-            print("⚠️ config.json not found, using v8 3-lap system with v7 sensitivity settings")
-        
-        # 設定値を変数に展開
-        camera_settings = self.config["camera_settings"]
-        detection_settings = self.config["detection_settings"]
-        race_settings = self.config["race_settings"]
-        
-        self.overview_camera_index = camera_settings["overview_camera_index"]
-        self.startline_camera_index = camera_settings["startline_camera_index"]
-        self.frame_width = camera_settings["frame_width"]
-        self.frame_height = camera_settings["frame_height"]
-        
-        self.motion_pixels_threshold = detection_settings["motion_pixels_threshold"]
-        self.min_contour_area = detection_settings["min_contour_area"]
-        self.motion_area_ratio_min = detection_settings["motion_area_ratio_min"]
-        self.motion_area_ratio_max = detection_settings["motion_area_ratio_max"]
-        self.stable_frames_required = detection_settings["stable_frames_required"]
-        self.motion_consistency_check = detection_settings["motion_consistency_check"]
-        
-        self.max_laps = 3  # v8: 強制的に3周
-        self.detection_cooldown = race_settings["detection_cooldown"]
+    def on_engine_event(self, event):
+        """エンジンイベント受信（エンジンスレッドから呼ばれるので記録のみ）"""
+        self.recent_events.append(event)
+        if event['type'] == 'race_complete' and event.get('total_time'):
+            if self.team_best is None or event['total_time'] < self.team_best:
+                self.team_best = event['total_time']
 
-    def init_cameras(self):
-        """カメラ初期化（ラズパイ対応・カメラなしモード対応・自動検出）"""
-        try:
-            print("📷 カメラを初期化中...")
-            
-            # 利用可能なカメラインデックスを自動検出
-            available_cameras = []
-            for i in range(4):  # 0-3まで試行
-                cap = cv2.VideoCapture(i)
-                if cap.isOpened():
-                    available_cameras.append(i)
-                    print(f"🔍 カメラインデックス {i} が利用可能")
-                cap.release()
-            
-            if not available_cameras:
-                print("⚠️ 利用可能なカメラが見つかりません")
-                self.camera_overview = None
-                self.camera_start_line = None
-            elif len(available_cameras) == 1:
-                # 1台のカメラのみ：両方の用途で共用
-                index = available_cameras[0]
-                print(f"📷 1台のカメラ（インデックス {index}）を両方の用途で使用")
-                self.camera_overview = cv2.VideoCapture(index)
-                self.camera_start_line = None  # 同じカメラは共用せず、1つだけ使用
-            else:
-                # 2台以上のカメラ：それぞれに割り当て
-                print(f"📷 {len(available_cameras)}台のカメラを検出：{available_cameras}")
-                self.camera_overview = cv2.VideoCapture(available_cameras[0])
-                self.camera_start_line = cv2.VideoCapture(available_cameras[1])
-            
-            camera_available = False
-            
-            if self.camera_overview and self.camera_overview.isOpened():
-                print(f"✅ Overview camera (index {available_cameras[0] if available_cameras else 'N/A'}) opened successfully")
-                camera_available = True
-                # カメラ設定
-                self.camera_overview.set(cv2.CAP_PROP_FRAME_WIDTH, self.frame_width)
-                self.camera_overview.set(cv2.CAP_PROP_FRAME_HEIGHT, self.frame_height)
-            else:
-                print(f"⚠️ Overview camera could not be opened")
-                self.camera_overview = None
-            
-            if self.camera_start_line and self.camera_start_line.isOpened():
-                print(f"✅ Start line camera (index {available_cameras[1] if len(available_cameras) > 1 else 'N/A'}) opened successfully")
-                camera_available = True
-                # カメラ設定
-                self.camera_start_line.set(cv2.CAP_PROP_FRAME_WIDTH, self.frame_width)
-                self.camera_start_line.set(cv2.CAP_PROP_FRAME_HEIGHT, self.frame_height)
-            else:
-                print(f"⚠️ Start line camera could not be opened")
-                self.camera_start_line = None
-            
-            # 背景差分初期化（より安定した設定）
-            self.bg_subtractor = cv2.createBackgroundSubtractorMOG2(
-                history=500, varThreshold=16, detectShadows=True
-            )
-            
-            if camera_available:
-                print("✅ カメラ初期化完了（一部カメラ利用可能）")
+    def draw_camera_view(self, preview, captured, force=False, capture=None):
+        """カメラ映像を描画（縮小はpreview_fpsに間引き、パネル・タイトルはキャッシュ）"""
+        if preview.draw(self.screen, captured, force, capture):
+            self.renderer.mark(preview.panel_rect)
+            return True
+        return False
+
+    def tripwire_overlay_state(self):
+        """オーバーレイの表示内容（変化した時だけスタートライン映像を描き直す）"""
+        tripwire = self.engine.start_line_tripwire
+        wire = (tuple(tripwire.points), tripwire.band_width) if tripwire is not None else None
+        return wire, self.tripwire_drag_start, self.tripwire_drag_end
+
+    def draw_tripwire_overlay(self):
+        """スタートライン映像上にトリップワイヤーとドラッグ中の線を描画"""
+        rect = self.startline_view_rect
+        tripwire = self.engine.start_line_tripwire
+        if tripwire is not None:
+            points = tripwire.display_points(rect.x, rect.y, rect.width, rect.height)
+            if tripwire.is_line:
+                band = max(1, int(tripwire.band_width * rect.width / tripwire.frame_size[0]))
+                pygame.draw.line(self.screen, self.colors['text_yellow'], points[0], points[1], band)
+                pygame.draw.line(self.screen, self.colors['text_red'], points[0], points[1], 2)
             else:
-                print("⚠️ カメラなしモードで起動（デモモード）")
-                print("🎮 キーボードでテスト: Spaceキーで手動検出シミュレーション")
-            
-            return True  # カメラなしでも続行
-            
-        except Exception as e:
-            print(f"⚠️ カメラ初期化警告: {e}")
-            print("📺 カメラなしモードで続行します")
-            self.camera_overview = None
-            self.camera_start_line = None
-            self.bg_subtractor = cv2.createBackgroundSubtractorMOG2(
-                history=500, varThreshold=16, detectShadows=True
-            )
-            return True  # カメラなしでも続行
-
-    def prepare_race(self):
-        """計測準備状態へ移行（Sキー押下時）"""
-        self.race_ready = True
-        self.race_active = False
-        self.lap_count = 0
-        self.current_lap_number = 0
-        self.current_lap_start = None
-        self.race_start_time = None
-        self.total_time = 0.0
-        self.current_lap_time = 0.0
-        self.lap_times = [0.0, 0.0, 0.0]
-        self.race_complete = False
-        self.race_paused = False
-        self.pause_countdown = 0
-        self.total_pause_time = 0.0
-        self.pause_count = 0
-        
-        # 重要：クールダウンタイマーをリセットして、背景学習時間を確保
-        self.last_detection_time = time.time()
-        self.preparation_start_time = time.time()  # 準備開始時刻を記録
-        self._learning_completed = False  # 学習完了フラグをリセット
-        
-        # 背景減算器を新しく初期化（前回の学習をクリア）
-        print("🔄 背景減算器を新規初期化中...")
-        self.bg_subtractor = cv2.createBackgroundSubtractorMOG2(
-            history=1000,        # より長い履歴で安定した学習
-            varThreshold=25,     # より高い闾値でノイズ耐性向上
-            detectShadows=True
-        )
-        print("✅ 背景減算器初期化完了")
-        
-        print("🏁 計測準備完了！ローリングスタートモード")
-        print("📋 待機中：スタートライン通過でTOTAL TIME計測開始")
-        print("🔄 3周完了で自動的に計測終了・結果表示")
-        print("⏳ 背景学習中...5秒お待ちください（重要）")
-
-    def start_race(self):
-        """レース開始（スタートライン通過時）"""
-        if self.race_ready and not self.race_active:
-            self.race_active = True
-            self.race_ready = False  # 重要：準備状態を解除してレース状態に移行
-            self.race_start_time = time.time()
-            self.current_lap_start = self.race_start_time
-            self.current_lap_number = 1  # LAP1開始
-            self.last_detection_time = self.race_start_time  # 初回検出時間をリセット
-            print(f"🏁 計測開始！LAP{self.current_lap_number} スタート - TOTAL TIMEカウント開始")
-
-    def stop_race(self):
-        """v8: レース停止"""
-        self.race_ready = False
-        self.race_active = False
-        self.race_complete = False
-        self.race_paused = False
-        self.pause_countdown = 0
-        print("⏹️ 計測停止")
-
-    def toggle_pause(self):
-        """v12: レース一時停止/再開トグル - LAP・TOTALカウント制御"""
-        if not self.race_active:
-            return  # レース中でない場合は何もしない
+                pygame.draw.polygon(self.screen, self.colors['text_yellow'], points, 2)
         
-        if not self.race_paused:
-            # 1回目Rキー：LAP・TOTALの時間計測（カウントアップ）を停止
-            self.race_paused = True
-            self.pause_start_time = time.time()
-            self.pause_count += 1  # 一時停止回数をインクリメント
-            
-            # 現在のラップ時間と総時間を保存（計測停止）
-            if self.current_lap_start:
-                self.paused_lap_time = time.time() - self.current_lap_start
-            if self.race_start_time:
-                self.paused_total_time = time.time() - self.race_start_time
-            
-            print("⏸️ LAP・TOTAL時間計測停止")
-            print("🔄 次のRキーでLAP・TOTAL計測再開 + 5秒カウントダウン表示")
-        else:
-            # 2回目Rキー：カウントダウン表示開始と同時にLAP・TOTAL計測を再開
-            current_time = time.time()
-            
-            # 一時停止時間を計算して累積
-            pause_duration = current_time - self.pause_start_time
-            self.total_pause_time += pause_duration
-            
-            # ラップ時間と総時間を即座再計算（一時停止分を除外して復元）
-            if self.paused_lap_time is not None:
-                self.current_lap_start = current_time - self.paused_lap_time
-            if self.paused_total_time is not None:
-                self.race_start_time = current_time - self.paused_total_time
-            
-            # 5秒カウントダウン表示を開始（カウントアップは即座再開）
-            self.pause_countdown = 5.0
-            self.pause_start_time = current_time  # カウントダウン開始時刻
-            
-            print("▶️ LAP・TOTAL計測再開！5秒カウントダウン表示開始")
-            print("⏳ カウントアップとカウントダウンを同時実行中")
-            print(f"📊 総一時停止時間: {self.total_pause_time:.1f}秒（計測から除外）")
-            
-            # 一時変数をクリア
-            self.paused_lap_time = None
-            self.paused_total_time = None
-
-    def update_pause_countdown(self):
-        """v12: 一時停止カウントダウン更新 - 表示用カウントダウンのみ管理"""
-        if self.race_paused and self.pause_countdown > 0:
-            current_time = time.time()
-            elapsed = current_time - self.pause_start_time
-            remaining = 5.0 - elapsed
-            
-            if remaining <= 0:
-                # カウントダウン表示完了（カウントアップは既に再開済み）
-                self.race_paused = False
-                self.pause_countdown = 0
-                
-                print("✅ 5秒カウントダウン表示完了！LAP・TOTAL計測継続中")
-                self.paused_total_time = None
-            else:
-                self.pause_countdown = remaining
+        if self.tripwire_drag_start is not None and self.tripwire_drag_end is not None:
+            pygame.draw.line(self.screen, self.colors['text_green'], self.tripwire_drag_start, self.tripwire_drag_end, 2)
 
-    def detect_motion_v7(self, frame):
-        """v7継承: 高感度動き検出"""
-        try:
-            current_time = time.time()
-            
-            # クールダウン期間チェック（背景学習中はスキップ）
-            if not (self.race_ready and not self.race_active and self.preparation_start_time and 
-                    (current_time - self.preparation_start_time) < 5.0):  # 5秒学習期間
-                time_since_last = current_time - self.last_detection_time
-                if time_since_last < self.detection_cooldown:
-                    # 2周目以降のデバッグ情報を追加
-                    if self.race_active and time_since_last < self.detection_cooldown:
-                        print(f"⏱️ クールダウン中: {time_since_last:.1f}s / {self.detection_cooldown}s (LAP{self.current_lap_number})")
-                    return False
-            
-            # 背景学習レート調整：準備中は高速学習、レース中は低速更新で誤検出防止
-            if self.race_ready and not self.race_active:
-                learning_rate = 0.01  # 準備中：高速学習
-            elif self.race_active:
-                learning_rate = 0.001  # レース中：微更新で誤検出防止
-            else:
-                learning_rate = 0.005  # その他：中程度更新
-            
-            gray = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY)
-            fg_mask = self.bg_subtractor.apply(gray, learningRate=learning_rate)
-            
-            # ノイズ除去
-            kernel = np.ones((3,3), np.uint8)
-            fg_mask = cv2.morphologyEx(fg_mask, cv2.MORPH_CLOSE, kernel)
-            fg_mask = cv2.morphologyEx(fg_mask, cv2.MORPH_OPEN, kernel)
-            
-            # 輪郭検出
-            contours, _ = cv2.findContours(fg_mask, cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_SIMPLE)
-            
-            # v7高感度検出条件
-            motion_pixels = cv2.countNonZero(fg_mask)
-            max_contour_area = max([cv2.contourArea(c) for c in contours]) if contours else 0
-            
-            frame_area = gray.shape[0] * gray.shape[1]
-            motion_ratio = motion_pixels / frame_area
-            
-            # v7高感度検出条件（安定版）
-            motion_detected = False
-            
-            # 基本的な動き検出条件
-            basic_motion = motion_pixels > self.motion_pixels_threshold and max_contour_area > self.min_contour_area
-            
-            # 面積比率チェック
-            area_ratio_ok = self.motion_area_ratio_min <= motion_ratio <= self.motion_area_ratio_max
-            
-            # 輪郭数チェック
-            contour_count_ok = len(contours) >= 1
-            
-            # 検出条件：基本動き + 面積比率 + 輪郭数（レース中はより厳しく）
-            if self.race_active:
-                # レース中：より厳しい条件（AND条件）
-                if basic_motion and area_ratio_ok and contour_count_ok and len(contours) >= 2:
-                    motion_detected = True
-                    conditions_met = 4
-            else:
-                # 準備中：従来の条件（OR条件）
-                if basic_motion and (area_ratio_ok or contour_count_ok):
-                    motion_detected = True
-                    conditions_met = 2 + (1 if area_ratio_ok else 0) + (1 if contour_count_ok else 0)
-            
-            # デバッグ情報更新
-            self.last_motion_pixels = motion_pixels
-            self.motion_area_ratio = motion_ratio
-            
-            if motion_detected:
-                lap_info = f"LAP{self.current_lap_number}" if self.race_active else "READY"
-                print(f"🔥 [{lap_info}] Motion detected! Conditions: {conditions_met}/4")
-                print(f"   - Motion pixels: {motion_pixels} (threshold: {self.motion_pixels_threshold})")
-                print(f"   - Max contour: {max_contour_area} (threshold: {self.min_contour_area})")
-                print(f"   - Motion ratio: {motion_ratio:.4f}")
-                print(f"   - Time since last detection: {current_time - self.last_detection_time:.2f}s")
-                print(f"   - Learning rate: {learning_rate}")
-                return True
-            else:
-                # 2周目以降で検出失敗時の詳細情報
-                if self.race_active and self.current_lap_number >= 2:
-                    print(f"❌ [LAP{self.current_lap_number}] 検出失敗 - Motion:{motion_pixels}, Area:{max_contour_area:.0f}, Ratio:{motion_ratio:.4f}")
-                # デバッグ: 動きが検出されない理由を表示
-                elif motion_pixels > 100:  # 最小限の動きがある場合のみ表示
-                    print(f"📊 [DEBUG] No motion: pixels={motion_pixels}/{self.motion_pixels_threshold}, "
-                          f"contour={max_contour_area}/{self.min_contour_area}, ratio={motion_ratio:.4f}")
-            
-            return False
-            
-        except Exception as e:
-            print(f"❌ 動き検出エラー: {e}")
-            return False
+    def sector_overlay_state(self):
+        """セクター表示の内容（境界・スプリットが変わった時だけオーバービュー映像を描き直す）"""
+        timer = self.engine.sector_timer
+        if not timer.enabled:
+            return None
+        previous = tuple(self.engine.lap_splits[-1]) if self.engine.lap_splits else ()
+        return tuple(tuple(line.points) for line in timer.lines), tuple(timer.splits), previous
 
-    def process_detection(self):
-        """検出処理とラップ計測（4回検出システム）"""
-        current_time = time.time()
-        
-        # 一時停止中は検出処理をスキップ
-        if self.race_paused:
-            return
-        
-        # 1回目：計測準備中にスタートライン通過で計測開始
-        if self.race_ready and not self.race_active:
-            # 背景学習時間を十分に確保（準備開始から5秒待機）
-            if self.preparation_start_time and (current_time - self.preparation_start_time) < 5.0:
-                learning_time = current_time - self.preparation_start_time
-                print(f"⏳ 背景学習中... {learning_time:.1f}/5.0秒")
-                return  # 背景学習中は検出しない
-            elif not getattr(self, '_learning_completed', False):
-                print("✅ 背景学習完了！")
-                print("🎯 動体検出準備完了 - スタートライン通過で計測開始")
-                print("-" * 50)
-                # 学習完了後のテスト検出
-                if hasattr(self, 'start_line_roi') and self.start_line_roi is not None and self.bg_subtractor is not None:
-                    gray = cv2.cvtColor(self.start_line_roi, cv2.COLOR_BGR2GRAY) if len(self.start_line_roi.shape) == 3 else self.start_line_roi
-                    test_mask = self.bg_subtractor.apply(gray, learningRate=0)
-                    test_pixels = cv2.countNonZero(test_mask)
-                    print(f"🧪 学習完了後ベースライン: Motion pixels = {test_pixels}")
-                self._learning_completed = True  # 一度だけ表示
-            
-            print("🏁 レース計測開始 - スタートライン通過を検出")
-            self.start_race()
+    def draw_sector_overlay(self):
+        """オーバービュー映像上にセクター境界とスプリットを描画（今のラップ＝緑、前のラップ＝白）"""
+        timer = self.engine.sector_timer
+        if not timer.enabled:
             return
-        
-        # 2回目～4回目：レース中のラップ計測
-        if self.race_active and not self.race_complete:
-            current_time = time.time()
-            
-            # 現在のラップ時間を記録してラップ完了
-            if self.current_lap_start is not None:
-                lap_time = current_time - self.current_lap_start
-                
-                # ラップ完了処理
-                if self.current_lap_number <= 3:
-                    self.lap_times[self.current_lap_number - 1] = lap_time
-                    self.lap_count += 1
-                    print(f"⏱️ LAP{self.current_lap_number}: {self.format_time(lap_time)} 完了")
-                
-                # 3周完了チェック
-                if self.current_lap_number >= 3:
-                    # 4回目の検出 = 3周完了
-                    self.total_time = current_time - self.race_start_time
-                    self.race_complete = True
-                    self.race_active = False
-                    self.current_lap_number = 0  # 計測終了
-                    
-                    print(f"🏁 3周完了！ 総時間: {self.format_time(self.total_time)}")
-                    print("=== 最終結果 ===")
-                    for i in range(3):
-                        print(f"LAP{i+1}: {self.format_time(self.lap_times[i])}")
-                    print(f"TOTAL: {self.format_time(self.total_time)}")
-                    if self.total_pause_time > 0:
-                        print(f"一時停止: {self.total_pause_time:.1f}秒（計測から除外）")
-                        print(f"純計測時間: {self.format_time(self.total_time)}")
-                    return
-                
-                # 次のラップ開始
-                self.current_lap_number += 1
-                self.current_lap_start = current_time
-                print(f"🔄 LAP{self.current_lap_number} 開始")
-                
-                # 注意：last_detection_timeはメインループで更新
-
-    def format_time(self, seconds):
-        """時間フォーマット - MM:SS.sss形式"""
-        minutes = int(seconds // 60)
-        secs = seconds % 60
-        return f"{minutes:02d}:{secs:06.3f}"
-
-    def draw_camera_view(self, frame, x, y, width, height, title):
-        """カメラ映像を描画"""
-        if frame is not None:
-            # 左右反転を削除（正常な向きで表示）
-            frame_rgb = cv2.cvtColor(frame, cv2.COLOR_BGR2RGB)
-            frame_resized = cv2.resize(frame_rgb, (width, height))
-            frame_surface = pygame.surfarray.make_surface(frame_resized.swapaxes(0, 1))
-            
-            # 背景パネル
-            panel_rect = pygame.Rect(x-10, y-40, width+20, height+60)
-            pygame.draw.rect(self.screen, self.colors['panel_bg'], panel_rect)
-            pygame.draw.rect(self.screen, self.colors['border'], panel_rect, 2)
-            
-            # タイトル
-            title_surface = self.font_small.render(title, True, self.colors['text_white'])
-            title_rect = title_surface.get_rect(centerx=x + width//2, y=y-35)
-            self.screen.blit(title_surface, title_rect)
-            
-            # カメラ映像
-            self.screen.blit(frame_surface, (x, y))
-            
-            return frame
-        else:
-            # カメラが利用できない場合
-            panel_rect = pygame.Rect(x-10, y-40, width+20, height+60)
-            pygame.draw.rect(self.screen, self.colors['panel_bg'], panel_rect)
-            pygame.draw.rect(self.screen, self.colors['border'], panel_rect, 2)
-            
-            title_surface = self.font_small.render(title, True, self.colors['text_white'])
-            title_rect = title_surface.get_rect(centerx=x + width//2, y=y-35)
-            self.screen.blit(title_surface, title_rect)
-            
-            no_camera_text = self.font_medium.render("Camera N/A", True, self.colors['text_red'])
-            text_rect = no_camera_text.get_rect(center=(x + width//2, y + height//2))
-            self.screen.blit(no_camera_text, text_rect)
-            
-            return None
+        rect = self.overview_view_rect
+        previous = self.engine.lap_splits[-1] if self.engine.lap_splits else []
+        for index, line in enumerate(timer.lines):
+            points = line.display_points(rect.x, rect.y, rect.width, rect.height)
+            if line.is_line:
+                pygame.draw.line(self.screen, self.colors['text_yellow'], points[0], points[1], 2)
+            else:
+                pygame.draw.polygon(self.screen, self.colors['text_yellow'], points, 2)
+            label = f"S{index + 1}"
+            color = self.colors['text_white']
+            if index < len(timer.splits) and timer.splits[index] is not None:
+                label += f" {format_time(timer.splits[index])}"
+                color = self.colors['text_green']
+            elif index < len(previous) and previous[index] is not None:
+                label += f" {format_time(previous[index])}"
+            x, y = min(points)
+            self.screen.blit(self.text_cache.render(self.font_tiny, label, color),
+                             (min(x + 4, rect.right - 90), max(y + 2, rect.top)))
 
-    def draw_lap_info(self):
-        """v8: ラップ情報表示"""
+    def view_to_frame_point(self, pos):
+        """プレビュー上の座標をスタートライン映像のフレーム座標へ変換"""
+        rect = self.startline_view_rect
+        frame_w, frame_h = self.engine.frame_width, self.engine.frame_height
+        if self.engine.current_startline_frame is not None:
+            frame_h, frame_w = self.engine.current_startline_frame.frame.shape[:2]
+        x = min(max(pos[0], rect.left), rect.right - 1) - rect.x
+        y = min(max(pos[1], rect.top), rect.bottom - 1) - rect.y
+        return (int(x * frame_w / rect.width), int(y * frame_h / rect.height))
+
+    def handle_tripwire_mouse(self, event):
+        """マウス操作：ドラッグでトリップワイヤー設定、右クリックで解除"""
+        if event.type == pygame.MOUSEBUTTONDOWN:
+            if not self.startline_view_rect.collidepoint(event.pos):
+                return
+            if event.button == 1:
+                self.tripwire_drag_start = event.pos
+                self.tripwire_drag_end = event.pos
+            elif event.button == 3:
+                self.engine.set_start_line_tripwire(None)
+        elif event.type == pygame.MOUSEMOTION and self.tripwire_drag_start is not None:
+            # プレビュー外にはみ出さない（差分描画で消し残りが出ないように）
+            rect = self.startline_view_rect
+            self.tripwire_drag_end = (min(max(event.pos[0], rect.left), rect.right - 1),
+                                      min(max(event.pos[1], rect.top), rect.bottom - 1))
+        elif event.type == pygame.MOUSEBUTTONUP and event.button == 1 and self.tripwire_drag_start is not None:
+            start, end = self.tripwire_drag_start, event.pos
+            self.tripwire_drag_start = None
+            self.tripwire_drag_end = None
+            if abs(end[0] - start[0]) + abs(end[1] - start[1]) < 5:
+                return  # クリックのみ（ドラッグ量不足）は無視
+            self.engine.set_start_line_tripwire([self.view_to_frame_point(start), self.view_to_frame_point(end)])
+
+    def draw_lap_panel(self, surface):
+        """ラップ情報パネルの静的部分（背景Surfaceへ1回だけ描画）"""
         info_x = 850
         info_y = 50
         
         # 背景パネル（縦長に拡張）
-        panel_rect = pygame.Rect(info_x-20, info_y-20, 400, 350)
-        pygame.draw.rect(self.screen, self.colors['panel_bg'], panel_rect)
-        pygame.draw.rect(self.screen, self.colors['border'], panel_rect, 3)
+        panel_rect = pygame.Rect(info_x-20, info_y-20, 400, 370)
+        pygame.draw.rect(surface, self.colors['panel_bg'], panel_rect)
+        pygame.draw.rect(surface, self.colors['border'], panel_rect, 3)
         
         # タイトル
-        title = self.font_large.render("3-LAP INFO", True, self.colors['text_white'])
-        self.screen.blit(title, (info_x, info_y))
+        if self.engine.car_tracker is not None:
+            title = self.font_large.render("CARS", True, self.colors['text_white'])
+            header = self.font_small.render("CAR  LAP   LAST        BEST        CURRENT", True, self.colors['text_yellow'])
+            surface.blit(header, (info_x, info_y + 60))
+        elif self.engine.max_laps:
+            title = self.font_large.render(f"{self.engine.max_laps}-LAP INFO", True, self.colors['text_white'])
+        else:
+            title = self.font_large.render("PRACTICE", True, self.colors['text_white'])
+        surface.blit(title, (info_x, info_y))
+
+    def draw_lap_info(self):
+        """v8: ラップ情報表示（変化した行だけ描き直す）"""
+        engine = self.engine
+        renderer = self.renderer
+        info_x = 850
+        info_y = 50
         
         # レース状態（右上のSTATUSと統一）
-        if self.race_complete:
+        if engine.race_complete:
             status_text = "Finished"
             status_color = self.colors['text_yellow']
-        elif self.race_paused:
-            if self.pause_countdown > 0:
-                status_text = f"Resuming ({self.pause_countdown:.1f}s)"
+        elif engine.race_paused:
+            if engine.pause_countdown > 0:
+                status_text = f"Resuming ({engine.pause_countdown:.1f}s)"
             else:
                 status_text = "Paused"
             status_color = self.colors['text_red']
-        elif self.race_active:
-            status_text = f"Qualifying Lap (LAP{self.current_lap_number})"
+        elif engine.race_active:
+            status_text = f"{self.lap_mode_name()} Lap (LAP{engine.current_lap_number})"
             status_color = self.colors['text_green']
-        elif self.race_ready:
+        elif engine.race_ready:
             status_text = "Ready for Start"
             status_color = self.colors['text_yellow']
         else:
             status_text = "Standby (S=Prepare)"
             status_color = self.colors['text_red']
         
-        status = self.font_medium.render(f"Status: {status_text}", True, status_color)
-        self.screen.blit(status, (info_x, info_y + 60))
+        renderer.text('lap_status', self.font_medium, f"Status: {status_text}", status_color, (info_x, info_y + 60))
         
-        # 3周分のラップタイム表示（改良版）
+        # ラップタイム表示：直近の LAP_ROWS 周だけのスクロール窓（進行中のラップが最下行）
         y_offset = 100
-        for i in range(3):
-            lap_number = i + 1
-            
-            if self.lap_times[i] > 0:  # 完了済みラップ（ホールド表示）
-                lap_text = f"LAP{lap_number}: {self.format_time(self.lap_times[i])}"
+        completed = engine.lap_count
+        last_shown = engine.current_lap_number if engine.race_active else completed
+        first_shown = max(1, last_shown - self.LAP_ROWS + 1)
+        for i in range(self.LAP_ROWS):
+            lap_number = first_shown + i
+            
+            if engine.max_laps and lap_number > engine.max_laps:
+                renderer.clear(f'lap{i}')
+                continue
+            if lap_number <= completed and completed - lap_number < len(engine.lap_times):  # 完了済みラップ（ホールド表示）
+                lap_time = engine.lap_times[lap_number - completed - 1]
+                lap_text = f"LAP{lap_number}: {format_time(lap_time)}"
                 color = self.colors['text_green']
-            elif self.current_lap_number == lap_number:  # 現在進行中のラップ
-                if self.race_active and self.current_lap_start:
-                    if self.race_paused and self.pause_countdown <= 0 and self.paused_lap_time is not None:
+            elif engine.current_lap_number == lap_number:  # 現在進行中のラップ
+                if engine.race_active and engine.current_lap_start:
+                    if engine.race_paused and engine.pause_countdown <= 0 and engine.paused_lap_time is not None:
                         # 一時停止中（カウントダウン前）：保存された時間を表示
-                        current_lap_time = self.paused_lap_time
+                        current_lap_time = engine.paused_lap_time
                     else:
                         # 通常時またはカウントダウン中：リアルタイム計算
-                        current_lap_time = time.time() - self.current_lap_start
-                    lap_text = f"LAP{lap_number}: {self.format_time(current_lap_time)}"
+                        current_lap_time = time.perf_counter() - engine.current_lap_start
+                    lap_text = f"LAP{lap_number}: {format_time(current_lap_time)}"
                     color = self.colors['text_yellow']
                 else:
                     lap_text = f"LAP{lap_number}: 00:00.000"
@@ -620,55 +316,117 @@ class TeamsSimpleLaptimeSystemFixedV12:
                 lap_text = f"LAP{lap_number}: 00:00.000"
                 color = self.colors['text_white']
             
-            lap_surface = self.font_medium.render(lap_text, True, color)
-            self.screen.blit(lap_surface, (info_x, info_y + y_offset + i * 40))
+            renderer.text(f'lap{i}', self.font_medium, lap_text, color, (info_x, info_y + y_offset + i * 40))
         
         # 総時間表示（一時停止対応版）
-        if self.race_complete and self.total_time > 0:  # レース完了後は固定表示
-            total_text = f"TOTAL: {self.format_time(self.total_time)}"
+        if engine.race_complete and engine.total_time > 0:  # レース完了後は固定表示
+            total_text = f"TOTAL: {format_time(engine.total_time)}"
             total_color = self.colors['text_yellow']
-        elif self.race_active and self.race_start_time:  # レース中は動的表示
-            if self.race_paused and self.pause_countdown <= 0 and self.paused_total_time is not None:
+        elif engine.race_active and engine.race_start_time:  # レース中は動的表示
+            if engine.race_paused and engine.pause_countdown <= 0 and engine.paused_total_time is not None:
                 # 一時停止中（カウントダウン前）：保存された時間を表示
-                total = self.paused_total_time
+                total = engine.paused_total_time
             else:
                 # 通常時またはカウントダウン中：リアルタイム計算
-                total = time.time() - self.race_start_time
-            total_text = f"TOTAL: {self.format_time(total)}"
+                total = time.perf_counter() - engine.race_start_time
+            total_text = f"TOTAL: {format_time(total)}"
             total_color = self.colors['text_white']
         else:  # 準備状態または未開始（S押下時も含む）
             total_text = "TOTAL: 00:00.000"
             total_color = self.colors['text_white']
-        total_surface = self.font_medium.render(total_text, True, total_color)
-        self.screen.blit(total_surface, (info_x, info_y + y_offset + 120))
+        renderer.text('total', self.font_medium, total_text, total_color, (info_x, info_y + y_offset + 120))
         
         # 一時停止回数表示
-        if self.pause_count > 0:
-            pause_text = f"Pause Count: {self.pause_count}"
-            pause_surface = self.font_small.render(pause_text, True, self.colors['text_yellow'])
-            self.screen.blit(pause_surface, (info_x, info_y + y_offset + 160))
+        if engine.pause_count > 0:
+            pause_text = f"Pause Count: {engine.pause_count}"
+            renderer.text('pause_count', self.font_small, pause_text, self.colors['text_yellow'],
+                          (info_x, info_y + y_offset + 160))
+        else:
+            renderer.clear('pause_count')
         
         # 一時停止状態の追加表示
-        if self.race_paused:
-            if self.pause_countdown > 0:
-                pause_status = f"⏳ Resuming in {self.pause_countdown:.1f}s"
+        if engine.race_paused:
+            if engine.pause_countdown > 0:
+                pause_status = f"⏳ Resuming in {engine.pause_countdown:.1f}s"
             else:
                 pause_status = "⏸️ LAP/TOTAL Count STOPPED"
-            pause_status_surface = self.font_small.render(pause_status, True, self.colors['text_red'])
-            self.screen.blit(pause_status_surface, (info_x, info_y + y_offset + 180))
+            renderer.text('pause_status', self.font_small, pause_status, self.colors['text_red'],
+                          (info_x, info_y + y_offset + 180))
+        else:
+            renderer.clear('pause_status')
+        
+        # 逐次統計（ベスト・平均・ばらつき・直近の安定度）
+        stats = engine.lap_stats
+        if stats.count > 0:
+            best_text = (f"BEST {format_time(stats.best)} (LAP{stats.best_lap})   "
+                         f"AVG {format_time(stats.mean)}  SD {stats.stddev:.3f}s")
+            renderer.text('lap_stats_best', self.font_tiny, best_text, self.colors['text_white'],
+                          (info_x, info_y + y_offset + 205))
+        else:
+            renderer.clear('lap_stats_best')
+        if stats.consistency is not None:
+            recent_text = (f"LAST{len(stats.recent)} {format_time(stats.recent_mean)} "
+                           f"± {stats.recent_stddev:.3f}s   CONSISTENCY {stats.consistency:.1f}%")
+            renderer.text('lap_stats_recent', self.font_tiny, recent_text, self.colors['text_white'],
+                          (info_x, info_y + y_offset + 223))
+        else:
+            renderer.clear('lap_stats_recent')
+
+    def lap_mode_name(self):
+        return "Qualifying" if self.engine.max_laps else "Practice"
+
+    def draw_car_table(self):
+        """複数車両モード：車両別ラップ表（パネル・見出しは背景に描画済み）"""
+        engine = self.engine
+        renderer = self.renderer
+        info_x = 850
+        info_y = 50
+
+        cars = sorted(engine.car_tracker.cars.values(), key=lambda c: c.car_id)[:10]
+        for i, car in enumerate(cars):
+            last_lap = format_time(car.lap_times[-1]) if car.lap_times else "--:--.---"
+            best_lap = format_time(car.best_lap) if car.lap_times else "--:--.---"
+            if car.finished:
+                current = "FINISH"
+                color = self.colors['text_yellow']
+            elif car.current_lap_start is not None and engine.race_active and not engine.race_paused:
+                current = format_time(time.perf_counter() - car.current_lap_start)
+                color = self.colors['text_green']
+            else:
+                current = "--:--.---"
+                color = self.colors['text_white']
+            row = f"#{car.car_id:<3} {car.lap_count:<4} {last_lap}  {best_lap}  {current}"
+            swatch = tuple(int(v) for v in car.color[::-1])  # BGR→RGB
+            swatch_rect = pygame.Rect(info_x - 12, info_y + 88 + i * 26, 8, 18)
+            pygame.draw.rect(self.screen, swatch, swatch_rect)
+            renderer.mark(swatch_rect)
+            renderer.text(f'car_row{i}', self.font_small, row, color, (info_x, info_y + 85 + i * 26))
+
+        # リセット等で減った行を消す
+        for i in range(len(cars), self._car_rows_drawn):
+            renderer.clear(f'car_row{i}')
+            renderer.restore(pygame.Rect(info_x - 12, info_y + 88 + i * 26, 8, 18))
+        self._car_rows_drawn = len(cars)
+
+        if not cars:
+            renderer.text('car_waiting', self.font_small, "Waiting for cars...", self.colors['text_white'],
+                          (info_x, info_y + 85))
+        else:
+            renderer.clear('car_waiting')
 
-    def draw_controls(self):
-        """操作方法表示"""
-        controls_y = 550
+    def draw_controls(self, surface):
+        """操作方法表示（固定文言なので背景Surfaceへ1回だけ描画）"""
+        controls_y = 490
         controls = [
             "S: Race Prepare (Rolling Start)",
             "R: LAP/TOTAL Time Count Control",
             "   1st R: Stop Count | 2nd R: Resume + 5s Display",
-            "Q: Race Stop", 
-            "ESC: Exit",
+            "Q: Race Stop | T: Switch Team",
+            "ESC: Exit | P: Profiler Overlay",
             "SPACE: Manual Detection (No Camera Mode)",
+            "Drag on Start Line: Set Tripwire | Right Click: Clear",
             "Start Line Pass = Start Race",
-            "3 Laps = Auto Complete",
+            f"{self.engine.max_laps} Laps = Auto Complete" if self.engine.max_laps else "Practice: Q = End Session",
             "v13: Optimized Pause/Resume System (v12 base)"
         ]
         
@@ -680,57 +438,167 @@ class TeamsSimpleLaptimeSystemFixedV12:
             else:
                 color = self.colors['text_red']
             control_surface = self.font_small.render(control, True, color)
-            self.screen.blit(control_surface, (20, controls_y + i * 25))
+            surface.blit(control_surface, (20, controls_y + i * 23))
+
+    def build_background(self):
+        """静的な背景（塗りつぶし・ラップパネル・操作説明）を作成"""
+        background = pygame.Surface(self.screen.get_size())
+        background.fill(self.colors['background'])
+        self.draw_lap_panel(background)
+        self.draw_controls(background)
+        self.renderer.set_background(background)
 
     def draw_status_info(self):
         """システム状態表示（簡潔版）"""
+        engine = self.engine
         status_y = 400
         
         # レース状態のみ表示
-        if self.race_complete:
+        if not self.cameras_ready:
+            status_text = "Starting Cameras..."
+            status_color = self.colors['text_yellow']
+        elif engine.race_complete:
             status_text = "Finished"
             status_color = self.colors['text_yellow']
-        elif self.race_active:
-            status_text = f"Qualifying Lap (LAP{self.current_lap_number})"
+        elif engine.race_active:
+            status_text = f"{self.lap_mode_name()} Lap (LAP{engine.current_lap_number})"
             status_color = self.colors['text_green']
-        elif self.race_ready:
+        elif engine.race_ready:
             status_text = "Ready for Start"
             status_color = self.colors['text_yellow']
         else:
             status_text = "Standby"
             status_color = self.colors['text_red']
         
-        status_surface = self.font_medium.render(f"Status: {status_text}", True, status_color)
-        self.screen.blit(status_surface, (450, status_y))
+        self.renderer.text('status', self.font_medium, f"Status: {status_text}", status_color, (450, status_y))
+        
+        # キャプチャ統計（取りこぼし・再利用フレーム）：1秒ごとに更新
+        now = time.perf_counter()
+        if now - self._stats_updated >= 1.0:
+            self._stats_updated = now
+            self._stats_texts = []
+            for worker in (engine.capture_overview, engine.capture_start_line):
+                if worker is None:
+                    self._stats_texts.append(None)
+                    continue
+                stats = worker.get_stats()
+                self._stats_texts.append(f"{stats['camera']}: {stats['fps']:.1f}fps "
+                                         f"drop {stats['dropped']} stale {stats['stale']}")
+        for i, stats_text in enumerate(self._stats_texts):
+            if stats_text is None:
+                self.renderer.clear(f'stats{i}')
+            else:
+                self.renderer.text(f'stats{i}', self.font_small, stats_text, self.colors['text_white'],
+                                   (450, status_y + 50 + i * 25))
+
+    def draw_team_info(self):
+        """計測中のチームとセッション内ベスト"""
+        results = self.engine.results
+        best = format_time(self.team_best) if self.team_best is not None else "--:--.---"
+        self.renderer.text('team', self.font_small, f"TEAM: {results.team}   BEST: {best}",
+                           self.colors['text_yellow'], (450, 505))
+
+    def switch_team(self):
+        """次のチームへ切り替え（レース中は不可）"""
+        results = self.engine.results
+        teams = results.teams
+        index = teams.index(results.team) + 1 if results.team in teams else 0
+        team = teams[index % len(teams)]
+        if self.engine.set_team(team):
+            self.team_best = results.best_total(team)
+
+    def render_profile_overlay(self):
+        """ステージ別 p50/p99 とFPSの表"""
+        profiler = self.profiler
+        rows = [("stage", "p50 ms", "p99 ms", self.colors['text_yellow'])]
+        for stage, s in profiler.report().items():
+            rows.append((stage, f"{s['p50_ms']:.2f}", f"{s['p99_ms']:.2f}", self.colors['text_white']))
+        line_height = self.font_tiny.get_linesize()
+        clip_recorder = self.engine.clip_recorder
+        extra_lines = 1 if clip_recorder.enabled else 0
+        surface = pygame.Surface((300, 10 + line_height * (len(rows) + 1 + extra_lines)))
+        surface.fill((0, 0, 0))
+        pygame.draw.rect(surface, self.colors['border'], surface.get_rect(), 1)
+        fps_text = f"UI {profiler.fps('ui_frame'):.1f} fps   DETECT {profiler.fps('detection'):.1f} fps"
+        surface.blit(self.text_cache.render(self.font_tiny, fps_text, self.colors['text_green']), (8, 5))
+        for i, (stage, p50, p99, color) in enumerate(rows, 1):
+            y = 5 + i * line_height
+            surface.blit(self.text_cache.render(self.font_tiny, stage, color), (8, y))
+            for text, right in ((p50, 225), (p99, 290)):  # 数値は右揃え
+                text_surface = self.text_cache.render(self.font_tiny, text, color)
+                surface.blit(text_surface, text_surface.get_rect(topright=(right, y)))
+        if clip_recorder.enabled:
+            # クリップ書き出しのバックログ（headroom が 0 に近いとリングで上書きされる）
+            clips = clip_recorder.stats()
+            color = self.colors['text_red'] if clips['overrun_frames'] else self.colors['text_white']
+            clip_text = (f"CLIPS {clips['saved']} saved  backlog {clips['pending_clips']} "
+                         f"({clips['pending_frames']}f)  room {clips['ring_headroom']}f")
+            surface.blit(self.text_cache.render(self.font_tiny, clip_text, color),
+                         (8, 5 + (len(rows) + 1) * line_height))
+        return surface
+
+    def draw_profile_overlay(self):
+        """プロファイラのオーバーレイ（0.5秒ごとに作り直し、毎フレーム最前面へ）"""
+        now = time.perf_counter()
+        if self._profile_surface is None or now - self._profile_updated >= 0.5:
+            self._profile_updated = now
+            self._profile_surface = self.render_profile_overlay()
+        rect = self._profile_surface.get_rect(topleft=(20, 70))
+        self.screen.blit(self._profile_surface, rect)
+        self.renderer.mark(rect)
+
+    def toggle_profile_overlay(self):
+        self.show_profile = not self.show_profile
+        self._profile_surface = None
+        if not self.show_profile:
+            self.renderer.invalidate()  # オーバーレイの下にあった表示を描き直す
 
     def handle_events(self):
         """イベント処理"""
+        engine = self.engine
         for event in pygame.event.get():
             if event.type == pygame.QUIT:
                 self.running = False
+            elif event.type in (pygame.VIDEOEXPOSE, getattr(pygame, 'WINDOWEXPOSED', pygame.VIDEOEXPOSE)):
+                self.renderer.invalidate()  # ウィンドウが隠れた後などは全面再描画
+            elif event.type in (pygame.MOUSEBUTTONDOWN, pygame.MOUSEMOTION, pygame.MOUSEBUTTONUP):
+                self.handle_tripwire_mouse(event)
             elif event.type == pygame.KEYDOWN:
                 if event.key == pygame.K_ESCAPE:
                     self.running = False
                 elif event.key == pygame.K_s:
-                    if not self.race_ready and not self.race_active:
-                        self.prepare_race()
+                    if self.cameras_ready and not engine.race_ready and not engine.race_active:
+                        engine.prepare_race()
                 elif event.key == pygame.K_r:
-                    if self.race_active:
-                        self.toggle_pause()
+                    if engine.race_active:
+                        engine.toggle_pause()
                 elif event.key == pygame.K_q:
-                    self.stop_race()
+                    engine.stop_race()
+                elif event.key == pygame.K_t:
+                    self.switch_team()
+                elif event.key == pygame.K_p:
+                    self.toggle_profile_overlay()
                 elif event.key == pygame.K_SPACE:
                     # カメラなしモード用：手動検出シミュレーション
-                    if (self.race_ready or self.race_active) and not self.race_paused and not self.race_complete:
-                        if self.camera_overview is None and self.camera_start_line is None:
-                            print("🎮 手動検出シミュレーション実行")
-                            self.process_detection()
+                    engine.manual_detection()
 
-    def run(self):
-        """メインループ"""
-        if not self.init_cameras():
+    def start_engine(self):
+        """カメラ初期化・エンジン起動（別スレッド：検出待ちの間もウィンドウは操作可能）"""
+        engine = self.engine
+        if not engine.init_cameras():
             print("❌ カメラの初期化に失敗しました")
+            self.running = False
             return
+        engine.start()
+        self.cameras_ready = True
+        if not engine.has_cameras:
+            print("🎮 カメラなしモード: Spaceキーで手動検出テスト")
+
+    def run(self):
+        """メインループ（描画専用：検出はエンジンスレッドがカメラレートで実行）"""
+        engine = self.engine
+        self._startup_thread = threading.Thread(target=self.start_engine, name="engine-startup", daemon=True)
+        self._startup_thread.start()
         
         print("🚀 v10 3周計測システム開始")
         print("📋 操作: S=計測準備, R=救済申請, Q=停止, ESC=終了")
@@ -738,113 +606,80 @@ class TeamsSimpleLaptimeSystemFixedV12:
         print("⏸️ LAP/TOTALカウント一時停止機能: Rキーで一時停止/再開（5秒カウントダウン）")
         print("🏁 3周完了で自動停止")
         print("⭐ v10改良点: 5秒背景学習＋検出分離＋MOG2最適化")
-        if self.camera_overview is None and self.camera_start_line is None:
-            print("🎮 カメラなしモード: Spaceキーで手動検出テスト")
+        
+        self.build_background()
         
         try:
+            record = self.profiler.record
             while self.running:
+                frame_start = time.perf_counter()
                 self.handle_events()
+                t_events = time.perf_counter()
                 
-                # 画面クリア
-                self.screen.fill(self.colors['background'])
+                # 背景（パネル・操作説明）は全面再描画が必要な時だけ
+                self.renderer.begin_frame()
+                full_redraw = self.renderer.full_redraw
                 
-                # カメラフレーム取得
-                frame_ov = None
-                frame_sl = None
+                # カメラフレーム取得（キャプチャスレッドの最新フレームを参照するだけ）
+                captured_sl = None
+                # 同期キャプチャでは同じ瞬間の組を並べて表示（組がまだなければ各カメラの最新）
+                # 表示だけのためのデコードはプレビュー更新時刻に達した時に次の1フレームだけ要求
+                synced = None
+                if engine.capture_group is not None:
+                    if self.overview_preview.due() or self.startline_preview.due():
+                        engine.capture_group.demand()
+                    synced = engine.capture_group.latest_pair()
                 
-                if self.camera_overview and self.camera_overview.isOpened():
-                    ret, frame_ov = self.camera_overview.read()
-                    if not ret:
-                        frame_ov = None
+                if synced is not None:
+                    engine.current_overview_frame = synced.frames['overview']
+                    captured_sl = synced.frames['start_line']
+                else:
+                    if engine.capture_overview is not None:
+                        engine.current_overview_frame, _ = engine.capture_overview.read_latest()
+                    
+                    if engine.capture_start_line is not None:
+                        # スタートライン映像はエンジンが消費するので表示側は参照のみ
+                        captured_sl = engine.capture_start_line.peek_latest()
                 
-                if self.camera_start_line and self.camera_start_line.isOpened():
-                    ret, frame_sl = self.camera_start_line.read()
-                    if not ret:
-                        frame_sl = None
+                t_read = time.perf_counter()
                 
                 # カメラ映像描画（375x280で統一）
-                processed_ov = self.draw_camera_view(frame_ov, 30, 80, 375, 280, "Overview Camera")
-                processed_sl = self.draw_camera_view(frame_sl, 430, 80, 375, 280, "Start Line Camera")
-                
-                # 一時停止カウントダウン更新
-                if self.race_paused:
-                    self.update_pause_countdown()
-                
-                # 動き検出（背景学習完了後のみ実行）
-                if processed_sl is not None and self.bg_subtractor is not None:
-                    # 背景学習の進行状況を計算
-                    learning_time = 0
-                    if self.race_ready and not self.race_active and self.preparation_start_time:
-                        learning_time = time.time() - self.preparation_start_time
-                    
-                    # 学習完了後かつ、計測準備中またはレース中で、救済モードでない場合のみ検出
-                    # レース中は learning_time チェックをスキップ
-                    detection_ready = False
-                    if self.race_active:  # レース中は常に検出可能
-                        detection_ready = True
-                    elif self.race_ready and not self.race_active:  # 準備中は学習完了後のみ
-                        detection_ready = learning_time >= 5.0
-                    
-                    if detection_ready and not self.race_paused and not self.race_complete:
-                        # 2周目以降の検出状況を詳しく監視
-                        if self.race_active and self.current_lap_number >= 2:
-                            time_since_last = time.time() - self.last_detection_time
-                            print(f"🔍 [LAP{self.current_lap_number}] 検出試行中 - 最終検出から{time_since_last:.1f}s経過")
-                        
-                        if self.detect_motion_v7(processed_sl):
-                            lap_info = f"LAP{self.current_lap_number}" if self.race_active else "READY"
-                            print(f"🔍 [{lap_info}] スタートラインで動き検出 - 処理実行")
-                            self.process_detection()
-                            # 検出成功時は必ずlast_detection_timeを更新
-                            self.last_detection_time = time.time()
-                            print(f"⏰ クールダウンタイマー更新: {self.detection_cooldown}秒待機開始")
-                
-                # 背景学習進行状況表示と学習処理
-                if self.race_ready and not self.race_active and self.preparation_start_time:
-                    current_time = time.time()
-                    learning_time = current_time - self.preparation_start_time
-                    
-                    # 背景学習期間中は背景減算器に継続的にフレームを学習させる（5秒に延長）
-                    if processed_sl is not None and self.bg_subtractor is not None and learning_time < 5.0:
-                        # 学習専用でフレームを背景モデルに追加（検出は行わない）
-                        gray = cv2.cvtColor(processed_sl, cv2.COLOR_BGR2GRAY) if len(processed_sl.shape) == 3 else processed_sl
-                        
-                        # より慎重な学習レート（0.01に下げる）
-                        _ = self.bg_subtractor.apply(gray, learningRate=0.01)
-                        
-                        # デバッグ: 背景学習状況を確認
-                        if int(learning_time * 4) != getattr(self, '_debug_count', -1):  # 0.25秒ごと
-                            test_mask = self.bg_subtractor.apply(gray, learningRate=0)  # テスト用検出
-                            test_pixels = cv2.countNonZero(test_mask)
-                            print(f"🔍 学習中デバッグ: {learning_time:.1f}s - Motion pixels: {test_pixels}")
-                            self._debug_count = int(learning_time * 4)
-                    
-                    if learning_time < 5.0:
-                        # 背景学習中の進行状況を定期的に表示（0.5秒ごと）
-                        if int(learning_time * 2) != getattr(self, '_last_progress_count', -1):
-                            print(f"⏳ 背景学習中... {learning_time:.1f}/5.0秒")
-                            self._last_progress_count = int(learning_time * 2)
-                    else:
-                        # 5秒経過したら学習完了（計測開始はしない）
-                        if not getattr(self, '_learning_completed', False):
-                            print("✅ 背景学習完了！")
-                            print("🎯 動体検出準備完了 - スタートライン通過で計測開始")
-                            print("-" * 50)
-                            # 学習完了後のテスト検出
-                            if processed_sl is not None and self.bg_subtractor is not None:
-                                gray = cv2.cvtColor(processed_sl, cv2.COLOR_BGR2GRAY) if len(processed_sl.shape) == 3 else processed_sl
-                                test_mask = self.bg_subtractor.apply(gray, learningRate=0)
-                                test_pixels = cv2.countNonZero(test_mask)
-                                print(f"🧪 学習完了後ベースライン: Motion pixels = {test_pixels}")
-                            self._learning_completed = True  # 一度だけ表示
+                sector_state = self.sector_overlay_state()
+                if self.draw_camera_view(self.overview_preview, engine.current_overview_frame,
+                                         full_redraw or sector_state != self._last_sector_state,
+                                         engine.capture_overview):
+                    self.draw_sector_overlay()
+                    self._last_sector_state = sector_state
+                t_overview = time.perf_counter()
+                overlay_state = self.tripwire_overlay_state()
+                if self.draw_camera_view(self.startline_preview, captured_sl,
+                                         full_redraw or overlay_state != self._last_overlay_state,
+                                         engine.capture_start_line):
+                    self.draw_tripwire_overlay()
+                    self._last_overlay_state = overlay_state
+                t_startline = time.perf_counter()
                 
                 # UI描画
-                self.draw_lap_info()
-                self.draw_controls()
+                if self.engine.car_tracker is not None:
+                    self.draw_car_table()
+                else:
+                    self.draw_lap_info()
                 self.draw_status_info()
+                self.draw_team_info()
+                if self.show_profile:
+                    self.draw_profile_overlay()
+                t_text = time.perf_counter()
                 
-                # 画面更新
-                pygame.display.flip()
+                # 画面更新（変化した領域のみ）
+                self.renderer.end_frame()
+                t_update = time.perf_counter()
+                record('ui_events', t_events - frame_start)
+                record('ui_camera_read', t_read - t_events)
+                record('draw_overview', t_overview - t_read)
+                record('draw_startline', t_startline - t_overview)
+                record('ui_text', t_text - t_startline)
+                record('display_update', t_update - t_text)
+                record('ui_frame', t_update - frame_start)
                 self.clock.tick(30)
                 
         except KeyboardInterrupt:
@@ -856,15 +691,17 @@ class TeamsSimpleLaptimeSystemFixedV12:
 
     def cleanup(self):
         """リソース解放"""
-        if self.camera_overview:
-            self.camera_overview.release()
-        if self.camera_start_line:
-            self.camera_start_line.release()
+        self.profiler.export()
+        if self._startup_thread is not None:
+            self._startup_thread.join(5.0)  # カメラ初期化中に終了した場合は開き終わるのを待って解放
+        self.live_timing.stop()
+        self.engine.shutdown()
         cv2.destroyAllWindows()
         pygame.quit()
 
 def main():
-    system = TeamsSimpleLaptimeSystemFixedV12()
+    # pipeline_settings.mode = "process" ならカメラごとに別プロセスで検出
+    system = TeamsSimpleLaptimeSystemFixedV12(create_engine())
     system.run()
 
 if __name__ == "__main__":
@@ -0,0 +1,425 @@
+#!/usr/bin/env python3
+"""
+複数トラック同時計測（1台のPCで複数のカメラペアを計測）
+- トラックごとに独立した LapTimingEngine（カメラ・検出器・レース状態・設定）
+- 設定は config.json の track_settings.tracks：各トラックの欄は共通設定への上書き（セクション単位でマージ）
+- 検出はトラック数分のスレッドではなく固定数のワーカープールで実行：
+  スタートラインカメラの新フレーム通知（on_frame）でトラックを実行待ちキューへ積み、
+  空いたワーカーが1ステップ処理（同じトラックを2つのワーカーが同時に処理しない）
+- 全トラックを1画面にタイル表示（数字キーで操作対象のトラックを選択）
+
+起動:
+    python multi_track.py               # 一覧表示
+    python multi_track.py --headless    # 表示なし：標準入力 "<トラック番号> <s|r|q|d>"、exit=終了
+"""
+
+import argparse
+import copy
+import json
+import math
+import os
+import queue
+import sys
+import threading
+import time
+
+from camera_probe import CameraProbe, release_unused
+from lap_timing_engine import LapTimingEngine, format_time
+
+
+def track_config(base, track, number):
+    """共通設定にトラックの上書きをマージした設定"""
+    config = copy.deepcopy(base)
+    config.pop("track_settings", None)
+    for key, value in track.items():
+        if key == "name":
+            continue
+        if isinstance(value, dict) and isinstance(config.get(key), dict):
+            config[key] = dict(config[key], **value)
+        else:
+            config[key] = copy.deepcopy(value)
+    name = track.get("name") or f"TRACK {number + 1}"
+    # ログファイルはトラックごと（同じファイルへ複数の書き込みスレッドから書かない）
+    if "file" not in track.get("log_settings", {}):
+        log_settings = config.setdefault("log_settings", {})
+        if log_settings.get("file"):
+            root, ext = os.path.splitext(log_settings["file"])
+            log_settings["file"] = f"{root}_track{number + 1}{ext}"
+    # 結果はトラック別のセッションとして記録（同じDBでランキングを分ける）
+    if "session" not in track.get("results_settings", {}):
+        results_settings = config.setdefault("results_settings", {})
+        results_settings["session"] = f"{results_settings.get('session') or time.strftime('%Y-%m-%d')} {name}"
+    return name, config
+
+
+class TrackEngine(LapTimingEngine):
+    """1トラック分のエンジン（設定はトラック欄の上書き込みで受け取る）"""
+
+    def __init__(self, name, number, config, config_path='config.json'):
+        self.name = name
+        self.number = number  # track_settings.tracks 内の位置
+        super().__init__(config_path, config)
+
+    def save_config(self):
+        """トリップワイヤーをこのトラックの欄へ保存（共通設定・他トラックは変更しない）"""
+        try:
+            with open(self.config_path, 'r', encoding='utf-8') as f:
+                root = json.load(f)
+            track = root["track_settings"]["tracks"][self.number]
+            track["start_line_settings"] = dict(track.get("start_line_settings", {}),
+                                                **self.config["start_line_settings"])
+            with open(self.config_path, 'w', encoding='utf-8') as f:
+                json.dump(root, f, indent=2, ensure_ascii=False)
+            print(f"💾 {self.name} のトリップワイヤーを保存しました")
+        except (OSError, ValueError, KeyError, IndexError) as e:
+            print(f"⚠️ {self.name} の設定保存失敗: {e}")
+
+
+class _TrackSlot:
+    """スケジューラ上のトラック（実行待ち・実行中の状態）"""
+
+    def __init__(self, engine):
+        self.engine = engine
+        self.scheduled = False  # キューにある・実行中
+        self.pending = False  # 実行中に新フレームが届いた：終わったら再投入
+
+
+class TrackScheduler:
+    """トラックの検出ステップを固定数のワーカーへ割り当てる"""
+
+    def __init__(self, engines, workers=0, tick_interval=0.05):
+        self.slots = [_TrackSlot(engine) for engine in engines]
+        self.workers = workers or max(1, min(len(engines), os.cpu_count() or 1))
+        self.tick_interval = tick_interval  # カメラなしトラックの状態更新間隔（一時停止カウントダウン等）
+        self._ready = queue.SimpleQueue()
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._threads = []
+
+    def start(self):
+        for slot in self.slots:
+            slot.engine.running = True
+            if slot.engine.capture_start_line is not None:
+                slot.engine.capture_start_line.on_frame = lambda slot=slot: self.schedule(slot)
+        for i in range(self.workers):
+            thread = threading.Thread(target=self._work, name=f"track-worker-{i}", daemon=True)
+            thread.start()
+            self._threads.append(thread)
+        ticker = threading.Thread(target=self._tick, name="track-ticker", daemon=True)
+        ticker.start()
+        self._threads.append(ticker)
+        print(f"🧵 {len(self.slots)}トラックを{self.workers}ワーカーで処理")
+
+    def schedule(self, slot):
+        """トラックを実行待ちへ（実行中なら終了後にもう一度）"""
+        with self._lock:
+            if slot.scheduled:
+                slot.pending = True
+                return
+            slot.scheduled = True
+        self._ready.put(slot)
+
+    def _work(self):
+        while True:
+            slot = self._ready.get()
+            if slot is None:
+                break
+            engine = slot.engine
+            try:
+                engine.step(timeout=0)
+            except Exception as e:
+                engine.log.error('engine', "❌ エンジンエラー: {error}", error=repr(e))
+            with self._lock:
+                requeue = slot.pending
+                slot.pending = False
+                slot.scheduled = requeue
+            if requeue:
+                self._ready.put(slot)
+
+    def _tick(self):
+        while not self._stop.wait(self.tick_interval):
+            for slot in self.slots:
+                if slot.engine.capture_start_line is None:
+                    self.schedule(slot)
+
+    def stop(self):
+        self._stop.set()
+        for slot in self.slots:
+            slot.engine.running = False
+            if slot.engine.capture_start_line is not None:
+                slot.engine.capture_start_line.on_frame = None
+        for _ in range(self.workers):
+            self._ready.put(None)
+        for thread in self._threads:
+            thread.join(1.0)
+        self._threads = []
+
+
+class MultiTrackSystem:
+    """全トラックのエンジン・カメラ・スケジューラ"""
+
+    def __init__(self, config_path='config.json'):
+        self.config_path = config_path
+        with open(config_path, 'r', encoding='utf-8') as f:
+            self.config = json.load(f)
+        settings = self.config.get("track_settings", {})
+        self.engines = []
+        for number, track in enumerate(settings.get("tracks") or []):
+            name, config = track_config(self.config, track, number)
+            self.engines.append(TrackEngine(name, number, config, config_path))
+        self.scheduler = TrackScheduler(self.engines, settings.get("workers", 0),
+                                        settings.get("tick_interval", 0.05))
+
+    def init_cameras(self):
+        """全トラックのカメラを1回の並列検出で開き、設定どおりに割り当て"""
+        wanted = []
+        for engine in self.engines:
+            wanted.extend(i for i in (engine.overview_camera_index, engine.startline_camera_index)
+                          if i is not None)
+        probe_settings = dict(self.config.get("camera_settings", {}))
+        if wanted:
+            probe_settings["probe_max_index"] = max(probe_settings.get("probe_max_index", 4), max(wanted) + 1)
+        captures = CameraProbe(probe_settings).probe()
+        claimed = set()
+        for engine in self.engines:
+            handles = []
+            for index in (engine.overview_camera_index, engine.startline_camera_index):
+                if index is None or index not in captures:
+                    handles.append(None)
+                elif index in claimed:
+                    print(f"⚠️ {engine.name}: カメラ {index} は他のトラックで使用中")
+                    handles.append(None)
+                else:
+                    claimed.add(index)
+                    handles.append(captures[index])
+            print(f"📷 {engine.name}: overview={engine.overview_camera_index} "
+                  f"start_line={engine.startline_camera_index}")
+            engine.attach_cameras(handles[0], handles[1],
+                                  engine.overview_camera_index, engine.startline_camera_index)
+        release_unused(captures, *claimed)
+
+    def start(self):
+        self.scheduler.start()
+
+    def shutdown(self):
+        self.scheduler.stop()
+        for engine in self.engines:
+            engine.shutdown()
+
+
+class MultiTrackDisplay:
+    """全トラックのタイル表示"""
+
+    HEADER_HEIGHT = 40
+
+    def __init__(self, system):
+        import pygame
+        from preview_renderer import CameraPreview
+        from screen_renderer import DirtyRectScreen
+
+        self.pygame = pygame
+        self.system = system
+        pygame.display.init()
+        pygame.font.init()
+        self.screen = pygame.display.set_mode((1280, 720))
+        pygame.display.set_caption("🏁 Lap Timer - Multi Track")
+        self.colors = {
+            'background': (15, 15, 25),
+            'text_white': (255, 255, 255),
+            'text_green': (0, 255, 100),
+            'text_yellow': (255, 255, 50),
+            'text_red': (255, 80, 80),
+            'panel_bg': (40, 40, 60),
+            'border': (80, 80, 100)
+        }
+        self.font_medium = pygame.font.Font(None, 40)
+        self.font_small = pygame.font.Font(None, 28)
+        self.renderer = DirtyRectScreen(self.screen)
+        self.selected = 0
+        self.running = True
+        self.clock = pygame.time.Clock()
+
+        # タイル配置（4トラックまで2列、それ以上は3列）
+        count = max(1, len(system.engines))
+        self.columns = 1 if count == 1 else (2 if count <= 4 else 3)
+        rows = math.ceil(count / self.columns)
+        width, height = self.screen.get_size()
+        self.tile_size = (width // self.columns, (height - self.HEADER_HEIGHT) // rows)
+        self.tiles = []
+        self.previews = []
+        for i, engine in enumerate(system.engines):
+            x = (i % self.columns) * self.tile_size[0]
+            y = self.HEADER_HEIGHT + (i // self.columns) * self.tile_size[1]
+            tile = pygame.Rect(x, y, *self.tile_size)
+            preview_w = min(tile.width // 2 - 30, int((tile.height - 70) * 4 / 3))
+            preview_rect = (tile.x + 20, tile.y + 45, preview_w, preview_w * 3 // 4)
+            preview_fps = engine.config.get("display_settings", {}).get("preview_fps", 15)
+            self.tiles.append(tile)
+            self.previews.append(CameraPreview(preview_rect, f"{i + 1}: {engine.name}", self.font_small,
+                                               self.font_small, self.colors, preview_fps))
+        self.build_background()
+
+    def build_background(self):
+        pygame = self.pygame
+        background = pygame.Surface(self.screen.get_size())
+        background.fill(self.colors['background'])
+        help_text = "1-9: Select Track | S: Prepare | R: Pause/Resume | Q: Stop | SPACE: Manual | ESC: Exit"
+        background.blit(self.font_small.render(help_text, True, self.colors['text_white']), (20, 10))
+        for tile in self.tiles:
+            pygame.draw.rect(background, self.colors['border'], tile.inflate(-6, -6), 2)
+        self.renderer.set_background(background)
+
+    def handle_events(self):
+        pygame = self.pygame
+        engines = self.system.engines
+        for event in pygame.event.get():
+            if event.type == pygame.QUIT:
+                self.running = False
+            elif event.type == pygame.KEYDOWN:
+                if event.key == pygame.K_ESCAPE:
+                    self.running = False
+                elif pygame.K_1 <= event.key <= pygame.K_9 and event.key - pygame.K_1 < len(engines):
+                    self.selected = event.key - pygame.K_1
+                elif not engines:
+                    continue
+                elif event.key == pygame.K_s:
+                    engine = engines[self.selected]
+                    if not engine.race_ready and not engine.race_active:
+                        engine.prepare_race()
+                elif event.key == pygame.K_r:
+                    engines[self.selected].toggle_pause()
+                elif event.key == pygame.K_q:
+                    engines[self.selected].stop_race()
+                elif event.key == pygame.K_SPACE:
+                    engines[self.selected].manual_detection()
+
+    def track_lines(self, engine):
+        """タイル右側の表示行 [(文字列, 色)]"""
+        colors = self.colors
+        if engine.race_complete:
+            status = ("Finished", colors['text_yellow'])
+        elif engine.race_paused:
+            status = ("Paused", colors['text_red'])
+        elif engine.race_active:
+            status = (f"LAP{engine.current_lap_number}", colors['text_green'])
+        elif engine.race_ready:
+            status = ("Ready", colors['text_yellow'])
+        else:
+            status = ("Standby", colors['text_red'])
+        lines = [status]
+        if engine.race_active and engine.current_lap_start is not None:
+            if engine.race_paused and engine.paused_lap_time is not None:
+                current = engine.paused_lap_time
+            else:
+                current = time.perf_counter() - engine.current_lap_start
+            lines.append((f"NOW  {format_time(current)}", colors['text_yellow']))
+        else:
+            lines.append(("NOW  --:--.---", colors['text_white']))
+        stats = engine.lap_stats
+        last = format_time(stats.last) if stats.last is not None else "--:--.---"
+        best = format_time(stats.best) if stats.best is not None else "--:--.---"
+        lines.append((f"LAST {last}", colors['text_green']))
+        lines.append((f"BEST {best}", colors['text_green']))
+        laps = f"{engine.lap_count}/{engine.max_laps}" if engine.max_laps else str(engine.lap_count)
+        lines.append((f"LAPS {laps}", colors['text_white']))
+        if engine.race_complete:
+            lines.append((f"TOTAL {format_time(engine.total_time)}", colors['text_yellow']))
+        else:
+            lines.append(("", colors['text_white']))
+        return lines
+
+    def run(self):
+        pygame = self.pygame
+        renderer = self.renderer
+        try:
+            while self.running:
+                self.handle_events()
+                renderer.begin_frame()
+                full_redraw = renderer.full_redraw
+                for i, (engine, tile, preview) in enumerate(zip(self.system.engines, self.tiles, self.previews)):
+                    captured = None
+                    if engine.capture_start_line is not None:
+                        if preview.due():
+                            engine.capture_start_line.demand()  # 同期キャプチャ：表示用に次の1フレームをデコード
+                        captured = engine.capture_start_line.peek_latest()
+                    if preview.draw(self.screen, captured, full_redraw, engine.capture_start_line):
+                        renderer.mark(preview.panel_rect)
+                    text_x = preview.panel_rect.right + 15
+                    for row, (text, color) in enumerate(self.track_lines(engine)):
+                        if text:
+                            renderer.text(f'track{i}_{row}', self.font_medium, text, color,
+                                          (text_x, tile.y + 45 + row * 36))
+                        else:
+                            renderer.clear(f'track{i}_{row}')
+                    if i == self.selected:
+                        renderer.text(f'track{i}_selected', self.font_small, "SELECTED",
+                                      self.colors['text_yellow'], (text_x, tile.y + 15))
+                    else:
+                        renderer.clear(f'track{i}_selected')
+                renderer.end_frame()
+                self.clock.tick(30)
+        except KeyboardInterrupt:
+            print("\n⏹️ システム停止")
+        finally:
+            pygame.quit()
+
+
+def run_headless(system):
+    """標準入力でトラックを操作（"1 s" = トラック1の計測準備）"""
+    def printer(engine):
+        def on_event(event):
+            if event['type'] == 'lap':
+                print(f"[{engine.name}] LAP{event['lap']}: {format_time(event['lap_time'])}")
+            elif event['type'] == 'race_complete':
+                print(f"[{engine.name}] FINISH TOTAL: {format_time(event['total_time'])}")
+        return on_event
+
+    for engine in system.engines:
+        engine.subscribe(printer(engine))
+    print("📋 コマンド: <トラック番号> <s=計測準備|r=一時停止/再開|q=停止|d=手動検出>, exit=終了")
+    try:
+        for line in sys.stdin:
+            parts = line.strip().lower().split()
+            if parts and parts[0] in ('exit', 'quit'):
+                break
+            if len(parts) != 2 or not parts[0].isdigit() or not 1 <= int(parts[0]) <= len(system.engines):
+                continue
+            engine = system.engines[int(parts[0]) - 1]
+            command = parts[1]
+            if command == 's':
+                if not engine.race_ready and not engine.race_active:
+                    engine.prepare_race()
+            elif command == 'r':
+                engine.toggle_pause()
+            elif command == 'q':
+                engine.stop_race()
+            elif command == 'd':
+                engine.manual_detection()
+    except KeyboardInterrupt:
+        print("\n⏹️ システム停止")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="複数トラック同時計測")
+    parser.add_argument('--config', default='config.json')
+    parser.add_argument('--headless', action='store_true', help="表示なし（標準入力で操作）")
+    args = parser.parse_args()
+
+    system = MultiTrackSystem(args.config)
+    if not system.engines:
+        print("⚠️ track_settings.tracks にトラックが設定されていません")
+        return
+    display = None if args.headless else MultiTrackDisplay(system)  # ウィンドウを先に表示
+    system.init_cameras()
+    system.start()
+    try:
+        if display is None:
+            run_headless(system)
+        else:
+            display.run()
+    finally:
+        system.shutdown()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,524 @@
+#!/usr/bin/env python3
+"""
+プロセス分離パイプライン（pipeline_settings.mode = "process"）
+- カメラ1台につき1プロセス：キャプチャ（とスタートラインの検出）を別コアで実行
+- フレームは multiprocessing.shared_memory のリングバッファで受け渡し（pickleなし）
+  キャプチャは retrieve() で共有メモリのスロットへ直接デコードし、読み出し側はスロットから1回だけコピー
+- ラップ等のイベントと状態スナップショットは軽量キューで親プロセスへ返す
+- 親プロセス側の ProcessPipelineEngine は LapTimingEngine と同じ属性・操作を提供（UIは変更不要）
+
+時刻はすべて perf_counter（システム全体で共通の単調クロック）なので、
+子プロセスが記録したラップ開始時刻を親プロセスの表示でそのまま使える。
+"""
+
+import json
+import multiprocessing as mp
+import queue
+import threading
+import time
+from collections import deque
+
+import cv2
+import numpy as np
+
+from camera_capture import CapturedFrame, capture_clock
+from camera_probe import assign_cameras
+from car_tracker import TrackedCar
+from frame_sources import open_source, source_identity
+from lap_stats import LapStats
+from lap_timing_engine import LapTimingEngine
+from start_line_tripwire import StartLineTripwire
+
+# 子プロセスから親へ同期するレース状態
+SNAPSHOT_FIELDS = (
+    'race_ready', 'race_active', 'race_complete', 'race_paused', 'pause_countdown',
+    'paused_lap_time', 'paused_total_time', 'current_lap_number', 'current_lap_start',
+    'lap_count', 'lap_times', 'total_time', 'race_start_time', 'pause_count',
+    'total_pause_time', 'last_motion_pixels',
+)
+
+
+class SharedFrameRing:
+    """共有メモリ上のフレームリング（書き込み1プロセス・読み出し複数プロセス）
+
+    スロットごとにシーケンス番号を持つseqlock方式：
+    書き込み中は奇数、完了で偶数。読み出し側はスロットをコピーし、
+    コピーの前後で番号が変わっていなければ有効（コピー中に上書きされたものは捨てて読み直す）。
+    共有メモリのビューを直接返すと、検出・表示で使っている間に書き込み側が同じスロットを上書きできてしまう。
+    """
+
+    def __init__(self, name=None, shape=(480, 640, 3), slots=4, create=False):
+        self.shape = tuple(shape)
+        self.slots = slots
+        frame_bytes = int(np.prod(self.shape))
+        # header: [最新frame_id, 取得フレーム数, 取得失敗数, 予備...]
+        meta_bytes = 64 + 8 * (slots + 1) + 16 * slots
+        self._frames_offset = (meta_bytes + 63) // 64 * 64
+        size = self._frames_offset + frame_bytes * slots
+
+        from multiprocessing import shared_memory
+        self.shm = shared_memory.SharedMemory(name=name, create=create, size=size if create else 0)
+        self.name = self.shm.name
+        self.owner = create
+
+        buf = self.shm.buf
+        self.header = np.ndarray((8,), dtype=np.int64, buffer=buf, offset=0)
+        self.times = np.ndarray((slots + 1,), dtype=np.float64, buffer=buf, offset=64)  # [0]=開始時刻
+        self.seqs = np.ndarray((slots,), dtype=np.int64, buffer=buf, offset=64 + 8 * (slots + 1))
+        self.ids = np.ndarray((slots,), dtype=np.int64, buffer=buf, offset=64 + 8 * (slots + 1) + 8 * slots)
+        self.frames = np.ndarray((slots,) + self.shape, dtype=np.uint8, buffer=buf, offset=self._frames_offset)
+        if create:
+            self.header[:] = 0
+            self.times[:] = 0.0
+            self.seqs[:] = 0
+            self.ids[:] = 0
+
+        # 読み出し側の統計（プロセスごと）
+        self._last_read_id = 0
+        self.dropped_frames = 0
+        self.stale_frames = 0
+        self.camera_name = name or self.name
+
+    # --- 書き込み側（キャプチャプロセス） ---------------------------------
+    def begin_write(self):
+        """次のスロットを書き込み中にして (スロット番号, 書き込み先ビュー) を返す"""
+        frame_id = int(self.header[0]) + 1
+        slot = (frame_id - 1) % self.slots
+        self.seqs[slot] += 1  # 奇数：書き込み中
+        return slot, self.frames[slot]
+
+    def commit(self, slot, timestamp):
+        """書き込み完了：最新フレームとして公開"""
+        frame_id = int(self.header[0]) + 1
+        self.times[slot + 1] = timestamp
+        self.ids[slot] = frame_id
+        self.seqs[slot] += 1  # 偶数：完了
+        self.header[1] += 1
+        self.header[0] = frame_id
+
+    def abort_write(self, slot):
+        """取得失敗：スロットを未公開のまま戻す"""
+        self.seqs[slot] += 1
+        self.header[2] += 1
+
+    def mark_started(self):
+        self.times[0] = capture_clock()
+
+    # --- 読み出し側（CameraCaptureWorker と同じインターフェース） ----------
+    def _snapshot(self):
+        for _ in range(3):
+            frame_id = int(self.header[0])
+            if frame_id == 0:
+                return None
+            slot = (frame_id - 1) % self.slots
+            seq = int(self.seqs[slot])
+            if seq & 1:
+                continue  # 書き込み中
+            timestamp = float(self.times[slot + 1])
+            frame = self.frames[slot].copy()
+            if int(self.ids[slot]) == frame_id and int(self.seqs[slot]) == seq:
+                return CapturedFrame(frame, timestamp, frame_id)
+        return None
+
+    def read_latest(self):
+        """最新フレームを取得（ブロックしない）：(CapturedFrame または None, 新しいフレームかどうか)"""
+        latest = self._snapshot()
+        if latest is None:
+            return None, False
+        if latest.frame_id == self._last_read_id:
+            self.stale_frames += 1
+            return latest, False
+        self.dropped_frames += max(0, latest.frame_id - self._last_read_id - 1)
+        self._last_read_id = latest.frame_id
+        return latest, True
+
+    def wait_for_frame(self, timeout=0.05):
+        """未読フレームが届くまで最大timeout秒待って取得（プロセス間なのでポーリング）"""
+        deadline = capture_clock() + timeout
+        while int(self.header[0]) == self._last_read_id and capture_clock() < deadline:
+            time.sleep(0.001)
+        return self.read_latest()
+
+    def peek_latest(self):
+        """最新フレームを参照のみ（統計を変えない）"""
+        return self._snapshot()
+
+    def holds(self, captured):
+        """読み出したフレームはスナップショット（コピー）なので再利用されない"""
+        return True
+
+    def get_stats(self):
+        started_at = float(self.times[0])
+        elapsed = capture_clock() - started_at if started_at else 0.0
+        frames = int(self.header[1])
+        return {
+            'camera': self.camera_name,
+            'frames': frames,
+            'dropped': self.dropped_frames,
+            'stale': self.stale_frames,
+            'read_failures': int(self.header[2]),
+            'fps': frames / elapsed if elapsed > 0 else 0.0,
+        }
+
+    def stop(self, timeout=1.0):
+        """読み出し側の停止（共有メモリの解放は close() で行う）"""
+
+    def close(self):
+        # ビューを先に破棄しないと共有メモリを閉じられない
+        self.header = self.times = self.seqs = self.ids = self.frames = None
+        try:
+            self.shm.close()
+        except BufferError:
+            pass  # まだビューが残っている：マッピングはプロセス終了時に解放
+        if self.owner:
+            try:
+                self.shm.unlink()
+            except FileNotFoundError:
+                pass
+
+
+class SharedMemoryCaptureWorker(threading.Thread):
+    """キャプチャプロセス内のスレッド：共有メモリのスロットへ直接デコード"""
+
+    def __init__(self, capture, ring, name):
+        super().__init__(name=f"capture-{name}", daemon=True)
+        self.capture = capture
+        self.ring = ring
+        self.camera_name = name
+        self.ring.camera_name = name
+        self._stop_event = threading.Event()
+
+    def run(self):
+        self.ring.mark_started()
+        frame_h, frame_w = self.ring.shape[:2]
+        while not self._stop_event.is_set():
+            ret = self.capture.grab()
+            timestamp = capture_clock()
+            slot, target = self.ring.begin_write()
+            frame = None
+            if ret:
+                ret, frame = self.capture.retrieve(target)
+            if not ret or frame is None:
+                self.ring.abort_write(slot)
+                self._stop_event.wait(0.01)
+                continue
+            if frame is not target:
+                # カメラが設定と異なるサイズを返した場合のみスロットへ縮尺コピー
+                cv2.resize(frame, (frame_w, frame_h), dst=target)
+            self.ring.commit(slot, timestamp)
+
+    # エンジンから CameraCaptureWorker と同じように使えるよう委譲
+    def read_latest(self):
+        return self.ring.read_latest()
+
+    def wait_for_frame(self, timeout=0.05):
+        return self.ring.wait_for_frame(timeout)
+
+    def peek_latest(self):
+        return self.ring.peek_latest()
+
+    def holds(self, captured):
+        return self.ring.holds(captured)
+
+    def get_stats(self):
+        return self.ring.get_stats()
+
+    def stop(self, timeout=1.0):
+        self._stop_event.set()
+        if self.is_alive():
+            self.join(timeout)
+
+
+def _open_camera(source, frame_width, frame_height):
+    """デバイス番号または入力の指定（frame_sources.open_source）を開く"""
+    capture = open_source(source, {'frame_width': frame_width, 'frame_height': frame_height})
+    if capture is None:
+        return None
+    capture.set(cv2.CAP_PROP_FRAME_WIDTH, frame_width)
+    capture.set(cv2.CAP_PROP_FRAME_HEIGHT, frame_height)
+    return capture
+
+
+def engine_snapshot(engine):
+    """親プロセスへ送るレース状態（pickle可能な値のみ）"""
+    snapshot = {'type': 'snapshot'}
+    for field in SNAPSHOT_FIELDS:
+        value = getattr(engine, field)
+        snapshot[field] = list(value) if isinstance(value, (list, deque)) else value
+    snapshot['lap_stats'] = engine.lap_stats.to_dict()
+    tripwire = engine.start_line_tripwire
+    snapshot['tripwire'] = tripwire.to_config() if tripwire is not None else None
+    snapshot['tripwire_frame_size'] = tripwire.frame_size if tripwire is not None else None
+    snapshot['cars'] = None
+    if engine.car_tracker is not None:
+        snapshot['cars'] = [{
+            'car_id': car.car_id, 'color': car.color.tolist(), 'area': car.area,
+            'lap_count': car.lap_count, 'lap_times': list(car.lap_times),
+            'current_lap_start': car.current_lap_start, 'start_time': car.start_time,
+            'finished': car.finished, 'stats': car.stats.to_dict(),
+        } for car in engine.car_tracker.cars.values()]
+    return snapshot
+
+
+def overview_process(camera_index, frame_size, ring_name, shape, slots, stop_event):
+    """全体カメラ用プロセス：キャプチャのみ"""
+    ring = SharedFrameRing(ring_name, shape, slots)
+    capture = _open_camera(camera_index, *frame_size)
+    if capture is None:
+        ring.close()
+        return
+    worker = SharedMemoryCaptureWorker(capture, ring, "overview")
+    worker.start()
+    try:
+        stop_event.wait()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        worker.stop()
+        capture.release()
+        ring.close()
+
+
+def start_line_process(camera_index, config_path, ring_name, shape, slots,
+                       event_queue, command_queue, stop_event, snapshot_interval):
+    """スタートラインカメラ用プロセス：キャプチャ＋背景学習・検出・レース状態管理"""
+    engine = LapTimingEngine(config_path)
+    ring = None
+    if camera_index is not None:
+        ring = SharedFrameRing(ring_name, shape, slots)
+        engine.camera_start_line = _open_camera(camera_index, engine.frame_width, engine.frame_height)
+        engine.startline_source_identity = source_identity(engine.camera_start_line, camera_index)
+        if engine.camera_start_line is not None:
+            engine.capture_start_line = SharedMemoryCaptureWorker(engine.camera_start_line, ring, "start_line")
+            engine.capture_start_line.start()
+    engine.bg_subtractor = cv2.createBackgroundSubtractorMOG2(
+        history=500, varThreshold=16, detectShadows=True
+    )
+
+    def forward(event):
+        event_queue.put(event)
+        event_queue.put(engine_snapshot(engine))
+
+    engine.subscribe(forward)
+    commands = {
+        'prepare': lambda: engine.prepare_race() if not engine.race_ready and not engine.race_active else None,
+        'pause': engine.toggle_pause,
+        'stop': engine.stop_race,
+        'manual': engine.manual_detection,
+        'tripwire': engine.set_start_line_tripwire,
+        'team': engine.set_team,
+    }
+
+    event_queue.put(engine_snapshot(engine))
+    last_snapshot = capture_clock()
+    try:
+        while not stop_event.is_set():
+            engine.step()
+            while True:
+                try:
+                    command, args = command_queue.get_nowait()
+                except queue.Empty:
+                    break
+                if command in commands:
+                    commands[command](*args)
+            # 一時停止カウントダウン等の表示用に定期送信
+            now = capture_clock()
+            if now - last_snapshot >= snapshot_interval:
+                event_queue.put(engine_snapshot(engine))
+                last_snapshot = now
+    except KeyboardInterrupt:
+        pass
+    finally:
+        engine.shutdown()
+        if ring is not None:
+            ring.close()
+
+
+class _CarTableMirror:
+    """親プロセス側の車両一覧（draw_car_table 用）"""
+
+    def __init__(self):
+        self.cars = {}
+
+
+class ProcessPipelineEngine(LapTimingEngine):
+    """親プロセス側のエンジン：状態は子プロセスのスナップショットを反映し、操作はコマンド送信"""
+
+    def __init__(self, config_path='config.json'):
+        super().__init__(config_path)
+        # イベントは検出プロセス側のログに記録される（同じファイルへ2プロセスで書かない）
+        self.unsubscribe(self.log.event)
+        # 走行結果の書き込み・クリップ保存も検出プロセス側（親の ResultsStore はチーム表示・集計の読み取り専用）
+        self.unsubscribe(self.results.on_event)
+        self.results.enabled = False
+        self.clip_recorder.enabled = False  # 親にはフレームが流れない（統計は常に0なので表示しない）
+        settings = self.config.get("pipeline_settings", {})
+        self.ring_slots = max(3, settings.get("ring_slots", 4))
+        self.snapshot_interval = settings.get("snapshot_interval", 0.1)
+        self._context = mp.get_context('spawn')  # Windows/Linuxで同じ挙動
+        self._event_queue = self._context.Queue()
+        self._command_queue = self._context.Queue()
+        self._stop_event = self._context.Event()
+        self._processes = []
+        self._rings = []
+        if self.car_tracker is not None:
+            self.car_tracker = _CarTableMirror()
+
+    @property
+    def has_cameras(self):
+        return self.capture_overview is not None or self.capture_start_line is not None
+
+    def _create_ring(self, role):
+        shape = (self.frame_height, self.frame_width, 3)
+        ring = SharedFrameRing(None, shape, self.ring_slots, create=True)
+        ring.camera_name = role
+        self._rings.append(ring)
+        return ring
+
+    def init_cameras(self):
+        """カメラを割り当ててカメラごとのプロセスを起動（割り当てはスレッドモードと同じ）"""
+        print("📷 カメラを初期化中（プロセス分離モード）...")
+        # ハンドルは各プロセスで開き直す（プロセス間で共有できない）
+        if self.overview_source is not None or self.startline_source is not None:
+            overview_index, start_line_index = self.overview_source, self.startline_source
+        else:
+            overview_index, start_line_index = assign_cameras(
+                self.probe_camera_indices(), self.overview_camera_index, self.startline_camera_index)
+
+        if overview_index is not None:
+            self.capture_overview = self._create_ring("overview")
+            process = self._context.Process(
+                target=overview_process, name="capture-overview",
+                args=(overview_index, (self.frame_width, self.frame_height), self.capture_overview.name,
+                      self.capture_overview.shape, self.ring_slots, self._stop_event),
+                daemon=True)
+            process.start()
+            self._processes.append(process)
+
+        # スタートラインのプロセスはカメラなしでも起動（手動検出・状態管理を担当）
+        ring_name, shape = None, (self.frame_height, self.frame_width, 3)
+        if start_line_index is not None:
+            self.capture_start_line = self._create_ring("start_line")
+            ring_name = self.capture_start_line.name
+        process = self._context.Process(
+            target=start_line_process, name="detect-start-line",
+            args=(start_line_index, self.config_path, ring_name, shape, self.ring_slots,
+                  self._event_queue, self._command_queue, self._stop_event, self.snapshot_interval),
+            daemon=True)
+        process.start()
+        self._processes.append(process)
+
+        print(f"✅ {len(self._processes)}プロセス起動（overview: {overview_index}, start_line: {start_line_index}）")
+        if not self.has_cameras:
+            print("⚠️ カメラなしモードで起動（デモモード）")
+        return True
+
+    def _send(self, command, *args):
+        self._command_queue.put((command, args))
+
+    def _apply_snapshot(self, snapshot):
+        with self.state_lock:
+            for field in SNAPSHOT_FIELDS:
+                setattr(self, field, snapshot[field])
+            self.lap_stats = LapStats.from_dict(snapshot['lap_stats'])
+            tripwire = snapshot['tripwire']
+            current = self.start_line_tripwire.to_config() if self.start_line_tripwire is not None else None
+            if tripwire != current:
+                self.start_line_tripwire = StartLineTripwire.from_config(
+                    tripwire, snapshot['tripwire_frame_size'] or (self.frame_width, self.frame_height))
+            if snapshot['cars'] is not None:
+                mirror = _CarTableMirror()
+                for data in snapshot['cars']:
+                    car = TrackedCar(data['car_id'], data['color'], data['area'])
+                    for key in ('lap_count', 'lap_times', 'current_lap_start', 'start_time', 'finished'):
+                        setattr(car, key, data[key])
+                    car.stats = LapStats.from_dict(data['stats'])
+                    mirror.cars[car.car_id] = car
+                self.car_tracker = mirror
+
+    def _run_loop(self):
+        """子プロセスからのイベント受信（購読者へはエンジンスレッドと同様に通知）"""
+        while self.running:
+            try:
+                event = self._event_queue.get(timeout=0.1)
+            except queue.Empty:
+                continue
+            except (EOFError, OSError):
+                break
+            if event['type'] == 'snapshot':
+                self._apply_snapshot(event)
+                continue
+            for callback in list(self._subscribers):
+                try:
+                    callback(event)
+                except Exception as e:
+                    print(f"⚠️ イベント購読者エラー ({event['type']}): {e}")
+
+    # 操作はすべて検出プロセスへ送る（状態はスナップショットで戻ってくる）
+    def prepare_race(self, now=None):
+        self._send('prepare')
+
+    def toggle_pause(self):
+        self._send('pause')
+
+    def stop_race(self):
+        self._send('stop')
+
+    def manual_detection(self):
+        self._send('manual')
+
+    def set_start_line_tripwire(self, points):
+        if self.race_active:
+            print("⚠️ レース中はトリップワイヤーを変更できません")
+            return
+        self._send('tripwire', [list(p) for p in points] if points else None)
+
+    def set_team(self, team):
+        if self.race_active:
+            print("⚠️ レース中はチームを変更できません")
+            return False
+        self.results.team = team  # 表示用
+        self._send('team', team)
+        return True
+
+    def shutdown(self):
+        """子プロセス停止・共有メモリ解放"""
+        self._stop_event.set()
+        for process in self._processes:
+            process.join(2.0)
+            if process.is_alive():
+                print(f"⚠️ {process.name} が応答しないため強制終了")
+                process.terminate()
+                process.join(1.0)
+        self._processes = []
+        self.running = False
+        if self._thread is not None:
+            self._thread.join(1.0)
+            self._thread = None
+        self.current_overview_frame = None
+        self.current_startline_frame = None
+        for ring in self._rings:
+            stats = ring.get_stats()
+            print(f"📊 [{stats['camera']}] frames={stats['frames']} dropped={stats['dropped']} "
+                  f"stale={stats['stale']} read_failures={stats['read_failures']}")
+            ring.close()
+        self._rings = []
+        self.capture_overview = None
+        self.capture_start_line = None
+        self.current_overview_frame = None
+        self.current_startline_frame = None
+        self.results.close()
+        self.clip_recorder.close()
+        self.log.close()
+
+
+def create_engine(config_path='config.json'):
+    """pipeline_settings.mode に応じたエンジンを作成（"thread" / "process"）"""
+    try:
+        with open(config_path, 'r', encoding='utf-8') as f:
+            mode = json.load(f).get("pipeline_settings", {}).get("mode", "thread")
+    except (OSError, ValueError):
+        mode = "thread"
+    if mode == "process":
+        return ProcessPipelineEngine(config_path)
+    return LapTimingEngine(config_path)
@@ -0,0 +1,106 @@
+#!/usr/bin/env python3
+"""
+カメラプレビュー描画
+- 表示サイズのBGRバッファを1つだけ確保し、cv2.resize(dst=...) で直接書き込む
+- pygame.image.frombuffer でバッファを共有するSurfaceを作成（毎フレームのSurface生成・色変換なし）
+- パネル・枠・タイトルは初回に描いたSurfaceを使い回す
+- プレビュー更新は preview_fps に間引き（検出はカメラレートのまま）
+"""
+
+import cv2
+import numpy as np
+import pygame
+
+from camera_capture import capture_clock
+
+
+class CameraPreview:
+    """カメラ1台分のプレビュー領域"""
+
+    def __init__(self, rect, title, font_title, font_message, colors, preview_fps=15):
+        self.rect = pygame.Rect(rect)
+        self.title = title
+        self.min_interval = 1.0 / preview_fps if preview_fps > 0 else 0.0
+        self.last_frame_id = None
+        self.last_update = 0.0
+        self._showing_unavailable = False
+        self.stage_timer = None  # 計測用フック: stage_timer(ステージ名, 秒)
+
+        # 表示サイズのバッファとそれを共有するSurface
+        width, height = self.rect.size
+        self.buffer = np.zeros((height, width, 3), dtype=np.uint8)
+        try:
+            self.surface = pygame.image.frombuffer(self.buffer, (width, height), 'BGR')
+            self._rgb_work = None
+        except ValueError:
+            # 'BGR' 非対応のpygame：縮小用の作業バッファから色変換して書き込む
+            self.surface = pygame.image.frombuffer(self.buffer, (width, height), 'RGB')
+            self._rgb_work = np.zeros_like(self.buffer)
+
+        self.chrome = self._render_chrome(font_title, colors)
+        self.unavailable = self.chrome.copy()
+        message = font_message.render("Camera N/A", True, colors['text_red'])
+        self.unavailable.blit(message, message.get_rect(center=(10 + width // 2, 40 + height // 2)))
+
+    def _render_chrome(self, font_title, colors):
+        """背景パネル・枠・タイトル（静的部分）"""
+        width, height = self.rect.size
+        chrome = pygame.Surface((width + 20, height + 60))
+        chrome.fill(colors['panel_bg'])
+        pygame.draw.rect(chrome, colors['border'], chrome.get_rect(), 2)
+        title_surface = font_title.render(self.title, True, colors['text_white'])
+        chrome.blit(title_surface, title_surface.get_rect(centerx=10 + width // 2, y=5))
+        return chrome
+
+    @property
+    def panel_rect(self):
+        return pygame.Rect(self.rect.x - 10, self.rect.y - 40, self.rect.width + 20, self.rect.height + 60)
+
+    def due(self):
+        """次のプレビュー更新時刻に達したか（同期キャプチャへのデコード要求の判定）"""
+        return capture_clock() - self.last_update >= self.min_interval
+
+    def update(self, captured, capture=None):
+        """新しいフレームで、前回更新から min_interval 経過していればバッファへ縮小書き込み
+
+        capture: フレームの読み出し元（配列が入力のプールで再利用済みなら書き込まず次のフレームを待つ）
+        """
+        if captured is None or captured.frame_id == self.last_frame_id:
+            return False
+        now = capture_clock()
+        if now - self.last_update < self.min_interval:
+            return False
+        if capture is not None and not capture.holds(captured):
+            return False
+        if self._rgb_work is None:
+            cv2.resize(captured.frame, self.rect.size, dst=self.buffer)
+        else:
+            cv2.resize(captured.frame, self.rect.size, dst=self._rgb_work)
+            cv2.cvtColor(self._rgb_work, cv2.COLOR_BGR2RGB, dst=self.buffer)
+        if self.stage_timer is not None:
+            self.stage_timer('preview_resize', capture_clock() - now)
+        self.last_frame_id = captured.frame_id
+        self.last_update = now
+        return True
+
+    def draw(self, screen, captured, force=False, capture=None):
+        """プレビュー描画（captured: CapturedFrame または None、capture: その読み出し元）
+
+        表示内容が変わった時（または force）だけ描画し、描画したかどうかを返す
+        """
+        if captured is None:
+            if self._showing_unavailable and not force:
+                return False
+            screen.blit(self.unavailable, self.panel_rect)
+            self._showing_unavailable = True
+            return True
+        updated = self.update(captured, capture)
+        if not (updated or force or self._showing_unavailable):
+            return False
+        t0 = capture_clock()
+        screen.blit(self.chrome, self.panel_rect)
+        screen.blit(self.surface, self.rect)
+        if self.stage_timer is not None:
+            self.stage_timer('preview_blit', capture_clock() - t0)
+        self._showing_unavailable = False
+        return True
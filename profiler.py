@@ -0,0 +1,168 @@
+#!/usr/bin/env python3
+"""
+処理ステージ別プロファイラ
+- record(ステージ名, 秒) を各ステージの計測点から呼ぶ（LapTimingEngine.stage_timer と同じ形）
+- ステージごとに固定長のリング（直近 window 件）へ所要時間と記録時刻を保存：p50/p99・実効FPSは直近の値から
+- 起動からの全件は対数ビンのヒストグラムへ積算（メモリ一定、ビン幅約5%の精度で分位点を推定）
+- 終了時に CSV / JSON へ書き出し（マシン情報付き：PC間の比較用）
+"""
+
+import csv
+import json
+import math
+import os
+import platform
+import time
+
+import cv2
+import numpy as np
+
+
+# 対数ビン：10µs～10s を約5%刻み
+_HIST_MIN = 1e-5
+_HIST_RATIO = 1.05
+_HIST_BINS = int(math.log(1e6) / math.log(_HIST_RATIO)) + 2
+_LOG_RATIO = math.log(_HIST_RATIO)
+
+RATE_WINDOW = 2.0  # 実効レートを数える直近の秒数
+
+
+class _StageSamples:
+    """1ステージ分の直近サンプル＋全期間ヒストグラム"""
+
+    def __init__(self, window):
+        self.durations = np.zeros(window, dtype=np.float64)
+        self.times = np.zeros(window, dtype=np.float64)
+        self.index = 0
+        self.count = 0  # 全期間の件数
+        self.total = 0.0
+        self.max = 0.0
+        self.histogram = np.zeros(_HIST_BINS, dtype=np.int64)
+
+    def add(self, seconds, now):
+        i = self.index
+        self.durations[i] = seconds
+        self.times[i] = now
+        self.index = (i + 1) % len(self.durations)
+        self.count += 1
+        self.total += seconds
+        if seconds > self.max:
+            self.max = seconds
+        if seconds <= _HIST_MIN:
+            b = 0
+        else:
+            b = min(_HIST_BINS - 1, int(math.log(seconds / _HIST_MIN) / _LOG_RATIO) + 1)
+        self.histogram[b] += 1
+
+    def recent(self):
+        n = min(self.count, len(self.durations))
+        return self.durations[:n], self.times[:n]
+
+    def histogram_percentile(self, q):
+        """全期間の分位点（ビンの上端で近似）"""
+        if self.count == 0:
+            return 0.0
+        cumulative = np.cumsum(self.histogram)
+        b = int(np.searchsorted(cumulative, self.count * q / 100.0))
+        return min(self.max, _HIST_MIN * (_HIST_RATIO ** b))
+
+
+class StageProfiler:
+    """ステージ別処理時間の記録・集計"""
+
+    def __init__(self, settings=None):
+        settings = settings or {}
+        self.enabled = settings.get("enabled", True)
+        self.window = max(10, settings.get("window", 600))
+        self.export_csv = settings.get("export_csv", "logs/profile.csv")
+        self.export_json = settings.get("export_json", "logs/profile.json")
+        self.stages = {}  # 記録順を保持（表示順）
+        self.started_at = time.perf_counter()
+
+    def record(self, stage, seconds):
+        if not self.enabled:
+            return
+        samples = self.stages.get(stage)
+        if samples is None:
+            samples = self.stages.setdefault(stage, _StageSamples(self.window))
+        samples.add(seconds, time.perf_counter())
+
+    def summary(self, stage):
+        """直近 window 件の統計（ms）と実効レート（回/秒）"""
+        samples = self.stages[stage]
+        durations, times = samples.recent()
+        data = durations * 1000.0
+        now = time.perf_counter()
+        return {
+            'count': samples.count,
+            'mean_ms': float(data.mean()) if len(data) else 0.0,
+            'p50_ms': float(np.percentile(data, 50)) if len(data) else 0.0,
+            'p99_ms': float(np.percentile(data, 99)) if len(data) else 0.0,
+            'max_ms': float(data.max()) if len(data) else 0.0,
+            'rate': int(np.count_nonzero(times >= now - RATE_WINDOW)) / RATE_WINDOW,
+        }
+
+    def totals(self, stage):
+        """起動からの全件の統計（ms、分位点はヒストグラム近似）"""
+        samples = self.stages[stage]
+        return {
+            'count': samples.count,
+            'mean_ms': samples.total / samples.count * 1000.0 if samples.count else 0.0,
+            'p50_ms': samples.histogram_percentile(50) * 1000.0,
+            'p99_ms': samples.histogram_percentile(99) * 1000.0,
+            'max_ms': samples.max * 1000.0,
+        }
+
+    def fps(self, stage):
+        """ステージの実行レート（例: 'ui_frame' = 画面FPS、'detection' = 検出FPS）"""
+        if stage not in self.stages:
+            return 0.0
+        return self.summary(stage)['rate']
+
+    def report(self):
+        return {stage: self.summary(stage) for stage in list(self.stages)}
+
+    def export(self):
+        """CSV / JSON へ書き出し（パスが None の形式は出力しない）"""
+        stages = list(self.stages)
+        if not stages:
+            return
+        machine = {
+            'platform': platform.platform(),
+            'processor': platform.processor() or platform.machine(),
+            'cpu_count': os.cpu_count(),
+            'python': platform.python_version(),
+            'opencv': cv2.__version__,
+            'opencv_threads': cv2.getNumThreads(),
+        }
+        rows = []
+        for stage in stages:
+            row = {'stage': stage}
+            row.update(self.totals(stage))
+            recent = self.summary(stage)
+            row['recent_p50_ms'] = recent['p50_ms']
+            row['recent_p99_ms'] = recent['p99_ms']
+            row['rate'] = recent['rate']
+            rows.append(row)
+        try:
+            if self.export_csv:
+                os.makedirs(os.path.dirname(self.export_csv) or '.', exist_ok=True)
+                with open(self.export_csv, 'w', newline='', encoding='utf-8') as f:
+                    writer = csv.DictWriter(f, fieldnames=list(rows[0]))
+                    writer.writeheader()
+                    writer.writerows(rows)
+            if self.export_json:
+                os.makedirs(os.path.dirname(self.export_json) or '.', exist_ok=True)
+                data = {
+                    'machine': machine,
+                    'recorded_at': time.strftime('%Y-%m-%d %H:%M:%S'),
+                    'elapsed_s': time.perf_counter() - self.started_at,
+                    'stages': rows,
+                    'histogram': {'min_s': _HIST_MIN, 'ratio': _HIST_RATIO,
+                                  'counts': {s: self.stages[s].histogram.tolist() for s in stages}},
+                }
+                with open(self.export_json, 'w', encoding='utf-8') as f:
+                    json.dump(data, f, indent=2, ensure_ascii=False)
+            print(f"📊 プロファイルを保存しました: {self.export_csv or ''} {self.export_json or ''}".rstrip())
+        except OSError as e:
+            print(f"⚠️ プロファイル保存失敗: {e}")
@@ -0,0 +1,258 @@
+#!/usr/bin/env python3
+"""
+オフライン再生・検出ベンチマーク
+- 録画済みスタートライン映像を LapTimingEngine の検出処理へCPUの限界速度で流し込む
+- 正解通過時刻（アノテーション）と照合し、見逃し・誤検出・ラップごとのタイム誤差を集計
+- 処理速度（frames/sec）とステージ別レイテンシ（平均/p50/p99）を出力
+
+使い方:
+    python replay_benchmark.py clip1.mp4 clip2.mp4 --annotations crossings.json
+    python replay_benchmark.py clip1.mp4 --config config.json --json report.json
+
+アノテーションファイル（動画ファイル名 → 映像先頭からの通過時刻[秒]のリスト）:
+    {"clip1.mp4": [12.345, 17.402, 22.518, 27.601]}
+"""
+
+import argparse
+import contextlib
+import json
+import os
+import queue
+import shutil
+import sys
+import tempfile
+import threading
+import time
+
+import cv2
+import numpy as np
+
+from background_cache import BackgroundCache
+from camera_capture import CapturedFrame
+from event_log import EventLog
+from lap_timing_engine import LapTimingEngine, format_time
+from profiler import StageProfiler
+
+
+def read_frames(path, out_queue, stats):
+    """デコード用スレッド：検出と並行して先読み（CapturedFrame.timestamp は映像内時刻）"""
+    cap = cv2.VideoCapture(path)
+    fps = cap.get(cv2.CAP_PROP_FPS) or 30.0
+    frame_id = 0
+    try:
+        while True:
+            t0 = time.perf_counter()
+            ret, frame = cap.read()
+            if not ret:
+                break
+            stats.record('decode', time.perf_counter() - t0)
+            frame_id += 1
+            position_ms = cap.get(cv2.CAP_PROP_POS_MSEC)
+            timestamp = position_ms / 1000.0 if position_ms > 0 else (frame_id - 1) / fps
+            out_queue.put(CapturedFrame(frame, timestamp, frame_id))
+    finally:
+        cap.release()
+        out_queue.put(None)
+
+
+def match_crossings(detected, truth, tolerance):
+    """検出時刻と正解時刻の対応付け（近い順に1対1で割り当て）"""
+    pairs = sorted(
+        ((abs(d - t), di, ti) for di, d in enumerate(detected) for ti, t in enumerate(truth)
+         if abs(d - t) <= tolerance)
+    )
+    used_d, used_t, matches = set(), set(), {}
+    for _, di, ti in pairs:
+        if di in used_d or ti in used_t:
+            continue
+        used_d.add(di)
+        used_t.add(ti)
+        matches[ti] = di
+    return matches
+
+
+def quiet_engine(engine, verbose=False):
+    """再生用の設定：ログファイル・走行結果DBへ書かず、検出の詳細表示は verbose 時のみ"""
+    engine.unsubscribe(engine.log.event)
+    engine.log = EventLog({'file': None, 'console_level': 'debug' if verbose else 'off'})
+    # 再生した通過を実際の走行として記録しない（ランキングに混ざる）
+    engine.unsubscribe(engine.results.on_event)
+    engine.results.enabled = False
+
+
+def replay_frames(engine, frames, stats=None):
+    """CapturedFrame の列を検出処理へ流す → (検出した通過時刻, 検出有効区間, フレーム数, 最終時刻)
+
+    計測準備（S押下相当）は映像先頭と、規定周回完了ごとに自動で行う
+    """
+    detected = []  # 検出した通過時刻（映像内時刻）
+    armed = []  # 検出が有効だった区間 [(開始, 終了)]
+    state = {'armed_at': None}
+
+    def on_event(event):
+        if event['type'] == 'learning_complete':
+            state['armed_at'] = engine.current_startline_frame.timestamp
+        elif event['type'] == 'race_start':
+            detected.append(event['start_time'])
+        elif event['type'] == 'lap':
+            detected.append(event['crossing_time'])
+
+    engine.subscribe(on_event)
+    frame_count = 0
+    last_timestamp = 0.0
+    for captured in frames:
+        frame_count += 1
+        last_timestamp = captured.timestamp
+        engine.current_startline_frame = captured
+
+        if not engine.race_ready and not engine.race_active:
+            if state['armed_at'] is not None:
+                armed.append((state['armed_at'], captured.timestamp))
+                state['armed_at'] = None
+            engine.prepare_race(now=captured.timestamp)
+
+        t0 = time.perf_counter()
+        engine.process_startline_frame(captured)
+        if stats is not None:
+            stats.record('frame_total', time.perf_counter() - t0)
+    engine.unsubscribe(on_event)
+    if state['armed_at'] is not None:
+        armed.append((state['armed_at'], last_timestamp))
+    return detected, armed, frame_count, last_timestamp
+
+
+def evaluate_crossings(detected, armed, crossings, tolerance):
+    """検出結果と正解の照合：見逃し・誤検出・通過時刻誤差・ラップタイム誤差"""
+    # 検出有効区間内の正解だけを評価対象にする（背景学習中の通過は評価しない）
+    # (正解リストでの番号, 時刻, 検出有効区間の番号)
+    evaluated = []
+    for number, t in enumerate(crossings):
+        interval = next((k for k, (a, b) in enumerate(armed) if a <= t <= b), None)
+        if interval is not None:
+            evaluated.append((number, t, interval))
+    truth = [t for _, t, _ in evaluated]
+    matches = match_crossings(detected, truth, tolerance)
+    errors = [detected[matches[i]] - truth[i] for i in sorted(matches)]
+
+    # ラップタイム誤差：正解リストで隣り合い、同じ検出有効区間（同じ計測）にある2通過がどちらも検出できた場合のみ
+    # （間の通過が学習中・再準備で評価対象外なら、2周分をまたぐ区間をラップとして扱わない）
+    lap_errors = []
+    for i in range(1, len(truth)):
+        previous, current = evaluated[i - 1], evaluated[i]
+        if current[0] != previous[0] + 1 or current[2] != previous[2]:
+            continue
+        if i in matches and (i - 1) in matches:
+            detected_lap = detected[matches[i]] - detected[matches[i - 1]]
+            true_lap = truth[i] - truth[i - 1]
+            lap_errors.append({'crossings': [previous[0] + 1, current[0] + 1], 'true_lap': true_lap,
+                               'detected_lap': detected_lap, 'error_ms': (detected_lap - true_lap) * 1000.0})
+
+    return {
+        'detected': detected,
+        'evaluated_crossings': len(truth),
+        'ignored_crossings': len(crossings) - len(truth),
+        'missed': len(truth) - len(matches),
+        'false': len(detected) - len(matches),
+        'crossing_errors_ms': [e * 1000.0 for e in errors],
+        'laps': lap_errors,
+    }
+
+
+def iter_queue(frames):
+    while True:
+        captured = frames.get()
+        if captured is None:
+            return
+        yield captured
+
+
+def replay_clip(path, config_path, crossings, tolerance, verbose=False):
+    """1本の映像を再生して検出・照合"""
+    engine = LapTimingEngine(config_path)
+    # 全フレーム分を保持して正確な分位点を出す（ファイル出力はしない）
+    stats = StageProfiler({'window': 200000, 'export_csv': None, 'export_json': None})
+    engine.stage_timer = stats.record
+    quiet_engine(engine, verbose)
+    # 背景画像の保存先は映像ごとの一時ディレクトリ（最初の計測は学習から、以降はウォームスタート）
+    cache_dir = tempfile.mkdtemp(prefix="replay_background_")
+    engine.background_cache = BackgroundCache(dict(engine.config.get("background_cache_settings", {}),
+                                                   directory=cache_dir))
+
+    frames = queue.Queue(maxsize=64)
+    reader = threading.Thread(target=read_frames, args=(path, frames, stats), daemon=True)
+    reader.start()
+
+    log_target = sys.stdout if verbose else open(os.devnull, 'w')
+    started = time.perf_counter()
+    with contextlib.redirect_stdout(log_target):
+        detected, armed, frame_count, _ = replay_frames(engine, iter_queue(frames), stats)
+    elapsed = time.perf_counter() - started
+    engine.log.close()
+    shutil.rmtree(cache_dir, ignore_errors=True)
+    if not verbose:
+        log_target.close()
+
+    result = {
+        'video': path,
+        'frames': frame_count,
+        'elapsed_s': elapsed,
+        'fps': frame_count / elapsed if elapsed > 0 else 0.0,
+        'stages': stats.report(),
+    }
+    result.update(evaluate_crossings(detected, armed, crossings, tolerance))
+    return result
+
+
+def print_report(result):
+    print(f"\n🎬 {result['video']}")
+    print(f"   frames: {result['frames']}  elapsed: {result['elapsed_s']:.2f}s  "
+          f"throughput: {result['fps']:.1f} fps")
+    for stage, s in sorted(result['stages'].items()):
+        print(f"   {stage:<12} mean {s['mean_ms']:7.3f}ms  p50 {s['p50_ms']:7.3f}ms  p99 {s['p99_ms']:7.3f}ms")
+    if result['evaluated_crossings'] or result['ignored_crossings']:
+        print(f"   crossings: evaluated {result['evaluated_crossings']} "
+              f"(ignored during learning {result['ignored_crossings']})  "
+              f"missed {result['missed']}  false {result['false']}")
+        print("   laps: only adjacent annotated crossings within the same armed run")
+        for i, lap in enumerate(result['laps'], 1):
+            first, second = lap['crossings']
+            print(f"   lap {i} (crossing {first}->{second}): true {format_time(lap['true_lap'])}  "
+                  f"detected {format_time(lap['detected_lap'])}  "
+                  f"error {lap['error_ms']:+.1f}ms")
+        if result['laps']:
+            abs_errors = [abs(lap['error_ms']) for lap in result['laps']]
+            print(f"   lap error: mean |{np.mean(abs_errors):.1f}|ms  max |{max(abs_errors):.1f}|ms")
+    else:
+        print(f"   detected crossings: {[round(t, 3) for t in result['detected']]}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="録画映像による検出ベンチマーク")
+    parser.add_argument('videos', nargs='+', help="スタートライン映像ファイル")
+    parser.add_argument('--annotations', help="正解通過時刻のJSONファイル")
+    parser.add_argument('--config', default='config.json', help="検出設定（config.json）")
+    parser.add_argument('--tolerance', type=float, default=0.5, help="正解と見なす時刻差[秒]")
+    parser.add_argument('--json', dest='json_path', help="結果をJSONで保存")
+    parser.add_argument('--verbose', action='store_true', help="エンジンのログを表示")
+    args = parser.parse_args()
+
+    annotations = {}
+    if args.annotations:
+        with open(args.annotations, 'r', encoding='utf-8') as f:
+            annotations = json.load(f)
+
+    results = []
+    for video in args.videos:
+        crossings = annotations.get(os.path.basename(video), annotations.get(video, []))
+        result = replay_clip(video, args.config, sorted(crossings), args.tolerance, args.verbose)
+        print_report(result)
+        results.append(result)
+
+    if args.json_path:
+        with open(args.json_path, 'w', encoding='utf-8') as f:
+            json.dump(results, f, indent=2, ensure_ascii=False)
+        print(f"\n💾 {args.json_path} に保存しました")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,253 @@
+#!/usr/bin/env python3
+"""
+レース結果の永続化（SQLite）
+- エンジンイベント（race_start / lap / race_complete、複数車両モードは car_*）を購読して記録
+- 書き込みは専用スレッド：購読コールバックはキューへ積むだけで検出ループを待たせない
+- WALモード：書き込み中でも表示・集計側から同時に読める
+- 走行ごとに runs 1行、ラップごとに laps 1行を追加（完走時だけその走行の runs 行の結果欄を UPDATE で埋める）
+- チーム・セッション・タイムの索引で、シーズン分（数千走行）でもランキング・ベストラップ検索が速い
+
+集計（コマンドライン）:
+    python results_store.py                       # 今日のセッションのランキングとベストラップ
+    python results_store.py --session 2026-10-16 --team "TEAM A"
+"""
+
+import argparse
+import json
+import os
+import queue
+import sqlite3
+import threading
+import time
+
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS runs (
+    id INTEGER PRIMARY KEY,
+    session TEXT NOT NULL,
+    team TEXT NOT NULL,
+    car_id INTEGER,
+    started_at REAL NOT NULL,
+    finished_at REAL,
+    total_time REAL,
+    pause_time REAL NOT NULL DEFAULT 0,
+    pause_count INTEGER NOT NULL DEFAULT 0,
+    lap_count INTEGER NOT NULL DEFAULT 0,
+    completed INTEGER NOT NULL DEFAULT 0
+);
+CREATE TABLE IF NOT EXISTS laps (
+    run_id INTEGER NOT NULL REFERENCES runs(id),
+    lap INTEGER NOT NULL,
+    lap_time REAL NOT NULL,
+    session TEXT NOT NULL,
+    team TEXT NOT NULL,
+    recorded_at REAL NOT NULL,
+    PRIMARY KEY (run_id, lap)
+);
+CREATE INDEX IF NOT EXISTS idx_runs_session_total ON runs(session, completed, total_time);
+CREATE INDEX IF NOT EXISTS idx_runs_team_total ON runs(team, completed, total_time);
+CREATE INDEX IF NOT EXISTS idx_laps_session_time ON laps(session, lap_time);
+CREATE INDEX IF NOT EXISTS idx_laps_team_time ON laps(team, lap_time);
+"""
+
+
+class ResultsStore:
+    """走行結果のSQLite保存（非同期書き込み）"""
+
+    def __init__(self, settings=None):
+        settings = settings or {}
+        self.enabled = settings.get("enabled", True)
+        self.path = settings.get("database", "data/results.db")
+        self.session = settings.get("session") or time.strftime('%Y-%m-%d')
+        self.teams = list(settings.get("teams") or ["TEAM A"])
+        self.team = self.teams[0]
+        self._queue = queue.Queue()
+        self._thread = None
+        self._start_lock = threading.Lock()
+        self._open_runs = {}  # 走行キー（None=単独モード / car_id）→ 書き込みスレッド側の run id 参照用トークン
+        self._next_token = 0
+
+    # ------------------------------------------------------------------
+    # 記録（エンジンスレッドから呼ばれる：キューへ積むだけ）
+    # ------------------------------------------------------------------
+    def on_event(self, event):
+        """エンジンイベント購読者"""
+        kind = event['type']
+        if kind == 'race_start':
+            self._begin_run(None)
+        elif kind == 'lap':
+            self._put('lap', self._open_runs.get(None), event['lap'], event['lap_time'])
+        elif kind == 'race_complete' and 'lap_times' in event:
+            token = self._open_runs.pop(None, None)
+            self._put('finish', token, event['total_time'], event.get('total_pause_time', 0.0),
+                      event.get('pause_count', 0), len(event['lap_times']))
+        elif kind == 'car_start':
+            self._begin_run(event['car_id'])
+        elif kind == 'car_lap':
+            self._put('lap', self._open_runs.get(event['car_id']), event['lap'], event['lap_time'])
+        elif kind == 'car_finished':
+            token = self._open_runs.pop(event['car_id'], None)
+            self._put('finish', token, event['total_time'], 0.0, 0, len(event['lap_times']))
+        elif kind == 'state' and event.get('state') in ('standby', 'ready'):
+            self._open_runs.clear()  # 停止・再準備：未完走の走行はそのまま（completed=0）
+
+    def _begin_run(self, car_id):
+        self._next_token += 1
+        self._open_runs[car_id] = self._next_token
+        self._put('start', self._next_token, self.session, self.team, car_id)
+
+    def _put(self, op, token, *args):
+        if not self.enabled or token is None:
+            return
+        self._queue.put((op, token, time.time()) + args)
+        if self._thread is None:
+            self._start_writer()
+
+    # ------------------------------------------------------------------
+    # 書き込みスレッド
+    # ------------------------------------------------------------------
+    def _start_writer(self):
+        with self._start_lock:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name="results-writer", daemon=True)
+                self._thread.start()
+
+    def connect(self):
+        """DB接続（スキーマ作成・WAL設定込み）"""
+        os.makedirs(os.path.dirname(self.path) or '.', exist_ok=True)
+        conn = sqlite3.connect(self.path, timeout=5.0)
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        conn.executescript(SCHEMA)
+        return conn
+
+    def _run(self):
+        try:
+            conn = self.connect()
+        except sqlite3.Error as e:
+            print(f"⚠️ 結果DBを開けません ({self.path}): {e}")
+            self.enabled = False
+            return
+        run_ids = {}  # トークン → runs.id
+        stop = False
+        while not stop:
+            batch = [self._queue.get()]
+            while True:
+                try:
+                    batch.append(self._queue.get_nowait())
+                except queue.Empty:
+                    break
+            try:
+                with conn:  # まとめて1トランザクション
+                    for item in batch:
+                        if item is None:
+                            stop = True
+                            continue
+                        self._apply(conn, run_ids, item)
+            except sqlite3.Error as e:
+                print(f"⚠️ 結果の保存に失敗しました: {e}")
+        conn.close()
+
+    @staticmethod
+    def _apply(conn, run_ids, item):
+        op, token, recorded_at = item[:3]
+        if op == 'start':
+            session, team, car_id = item[3:]
+            cursor = conn.execute(
+                "INSERT INTO runs (session, team, car_id, started_at) VALUES (?, ?, ?, ?)",
+                (session, team, car_id, recorded_at))
+            run_ids[token] = (cursor.lastrowid, session, team)
+        elif op == 'lap' and token in run_ids:
+            run_id, session, team = run_ids[token]
+            lap, lap_time = item[3:]
+            conn.execute(
+                "INSERT OR IGNORE INTO laps (run_id, lap, lap_time, session, team, recorded_at) "
+                "VALUES (?, ?, ?, ?, ?, ?)", (run_id, lap, lap_time, session, team, recorded_at))
+        elif op == 'finish' and token in run_ids:
+            run_id = run_ids.pop(token)[0]
+            total_time, pause_time, pause_count, lap_count = item[3:]
+            conn.execute(
+                "UPDATE runs SET finished_at = ?, total_time = ?, pause_time = ?, pause_count = ?, "
+                "lap_count = ?, completed = 1 WHERE id = ?",
+                (recorded_at, total_time, pause_time, pause_count, lap_count, run_id))
+
+    def close(self, timeout=5.0):
+        """未書き込み分を保存して停止"""
+        if self._thread is not None:
+            self._queue.put(None)
+            self._thread.join(timeout)
+            self._thread = None
+
+    # ------------------------------------------------------------------
+    # 集計（呼び出し側スレッドで読み取り専用接続を使う）
+    # ------------------------------------------------------------------
+    def _query(self, sql, params):
+        if not os.path.exists(self.path):
+            return []
+        conn = sqlite3.connect(self.path, timeout=5.0)
+        try:
+            return conn.execute(sql, params).fetchall()
+        except sqlite3.OperationalError:
+            return []  # スキーマ作成前
+        finally:
+            conn.close()
+
+    def leaderboard(self, session=None, limit=10):
+        """チームごとのベスト総時間（完走のみ）：[(team, best_total, runs)]"""
+        return self._query(
+            "SELECT team, MIN(total_time), COUNT(*) FROM runs WHERE session = ? AND completed = 1 "
+            "GROUP BY team ORDER BY MIN(total_time) LIMIT ?",
+            (session or self.session, limit))
+
+    def best_laps(self, session=None, team=None, limit=10):
+        """ベストラップ一覧：[(team, lap, lap_time, recorded_at)]"""
+        if team is not None:
+            return self._query(
+                "SELECT team, lap, lap_time, recorded_at FROM laps WHERE team = ? ORDER BY lap_time LIMIT ?",
+                (team, limit))
+        return self._query(
+            "SELECT team, lap, lap_time, recorded_at FROM laps WHERE session = ? ORDER BY lap_time LIMIT ?",
+            (session or self.session, limit))
+
+    def best_total(self, team, session=None):
+        """チームのセッション内ベスト総時間（記録なしは None）"""
+        rows = self._query(
+            "SELECT MIN(total_time) FROM runs WHERE team = ? AND session = ? AND completed = 1",
+            (team, session or self.session))
+        return rows[0][0] if rows else None
+
+
+def main():
+    from lap_timing_engine import format_time
+
+    parser = argparse.ArgumentParser(description="保存済みレース結果の集計")
+    parser.add_argument('--database', default=None, help="結果DB（既定: config.json の results_settings.database）")
+    parser.add_argument('--config', default='config.json')
+    parser.add_argument('--session', default=None, help="セッション名（既定: 今日の日付）")
+    parser.add_argument('--team', default=None, help="このチームのベストラップを表示")
+    parser.add_argument('--limit', type=int, default=10)
+    args = parser.parse_args()
+
+    settings = {}
+    try:
+        with open(args.config, 'r', encoding='utf-8') as f:
+            settings = json.load(f).get("results_settings", {})
+    except (OSError, ValueError):
+        pass
+    if args.database:
+        settings = dict(settings, database=args.database)
+    if args.session:
+        settings = dict(settings, session=args.session)
+    store = ResultsStore(settings)
+
+    print(f"🏆 ランキング（セッション {store.session}）")
+    for rank, (team, best, runs) in enumerate(store.leaderboard(limit=args.limit), 1):
+        print(f"   {rank:>2}. {team:<16} {format_time(best)}  ({runs}走行)")
+    print("⏱️ ベストラップ" + (f"（{args.team}）" if args.team else ""))
+    for team, lap, lap_time, recorded_at in store.best_laps(team=args.team, limit=args.limit):
+        stamp = time.strftime('%m-%d %H:%M', time.localtime(recorded_at))
+        print(f"   {team:<16} LAP{lap}  {format_time(lap_time)}  {stamp}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,103 @@
+#!/usr/bin/env python3
+"""
+画面描画の差分更新
+- TextCache: font.render() の結果を (フォント, 文字列, 色) ごとに再利用
+- DirtyRectScreen: 静的な背景（パネル・タイトル・操作説明）を1枚のSurfaceに描いておき、
+  変化した文字列・領域だけを書き換えて pygame.display.update(rects) で転送
+  （毎フレームの fill() + flip() による1280x720全面の再描画をやめる）
+"""
+
+from collections import OrderedDict
+
+import time
+
+import pygame
+
+
+class TextCache:
+    """描画済み文字列Surfaceのキャッシュ（LRU）"""
+
+    def __init__(self, max_entries=256):
+        self.max_entries = max_entries
+        self._surfaces = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.stage_timer = None  # 計測用フック: stage_timer(ステージ名, 秒)
+
+    def render(self, font, text, color):
+        key = (font, text, tuple(color))
+        surface = self._surfaces.get(key)
+        if surface is not None:
+            self._surfaces.move_to_end(key)
+            self.hits += 1
+            return surface
+        self.misses += 1
+        t0 = time.perf_counter()
+        surface = font.render(text, True, color)
+        if self.stage_timer is not None:
+            self.stage_timer('font_render', time.perf_counter() - t0)
+        self._surfaces[key] = surface
+        if len(self._surfaces) > self.max_entries:
+            self._surfaces.popitem(last=False)  # 計時中の数字など使い捨ての文字列から追い出す
+        return surface
+
+
+class DirtyRectScreen:
+    """静的背景＋変化した領域だけ更新する画面"""
+
+    def __init__(self, screen, text_cache=None):
+        self.screen = screen
+        self.text_cache = text_cache if text_cache is not None else TextCache()
+        self.background = None
+        self.full_redraw = True
+        self._slots = {}  # キー → (font, text, color, rect)
+        self._dirty = []
+
+    def set_background(self, background):
+        self.background = background
+        self.invalidate()
+
+    def invalidate(self):
+        """次のフレームで全面再描画（ウィンドウ復帰時など）"""
+        self.full_redraw = True
+        self._slots.clear()
+
+    def begin_frame(self):
+        if self.full_redraw:
+            self.screen.blit(self.background, (0, 0))
+
+    def restore(self, rect):
+        """領域を背景に戻して更新対象にする"""
+        rect = pygame.Rect(rect)
+        self.screen.blit(self.background, rect, rect)
+        self._dirty.append(rect)
+
+    def mark(self, rect):
+        self._dirty.append(pygame.Rect(rect))
+
+    def text(self, key, font, text, color, pos):
+        """キーごとの文字列表示：前回と同じなら何もしない"""
+        slot = self._slots.get(key)
+        if slot is not None and slot[0] is font and slot[1] == text and slot[2] == color:
+            return
+        if slot is not None:
+            self.restore(slot[3])
+        surface = self.text_cache.render(font, text, color)
+        rect = surface.get_rect(topleft=pos)
+        self.screen.blit(surface, rect)
+        self._dirty.append(rect)
+        self._slots[key] = (font, text, color, rect)
+
+    def clear(self, key):
+        """表示中の文字列を消す"""
+        slot = self._slots.pop(key, None)
+        if slot is not None:
+            self.restore(slot[3])
+
+    def end_frame(self):
+        if self.full_redraw:
+            pygame.display.flip()
+            self.full_redraw = False
+        elif self._dirty:
+            pygame.display.update(self._dirty)
+        self._dirty = []
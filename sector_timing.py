@@ -0,0 +1,138 @@
+#!/usr/bin/env python3
+"""
+オーバービューカメラによるセクター計測
+- sector_settings.lines でセクター境界を指定（2点=線・3点以上=多角形、オーバービュー映像の座標）
+- 全境界の帯を1枚のラベルマップ（画素値 = 境界番号）に描き、全帯を囲む矩形だけを切り出して MOG2 を1回適用
+- 前景画素のラベルを np.bincount で数えるだけで全境界の動き量が1パスで得られる（境界を増やしても追加コストはほぼない）
+- 境界ごとに動き量の立ち上がりで通過を判定し、スタートラインと同じフレーム間補間で通過時刻を求める
+- ラップ内で順番どおりに通過した境界だけをスプリットとして採用（ピット・逆方向の動きで順序が崩れない）
+- セクター計測はオーバービューカメラがある単一車両モードのみ（プロセス分離モードの検出プロセスは対象外）
+"""
+
+import cv2
+import numpy as np
+
+from start_line_tripwire import StartLineTripwire, interpolate_crossing_time
+
+
+class SectorTimer:
+    """複数のセクター境界を1枚の前景マスクで同時に判定"""
+
+    def __init__(self, settings, frame_size=(640, 480)):
+        settings = settings or {}
+        band_width = settings.get("band_width", 30)
+        self.lines = [StartLineTripwire(points, band_width, frame_size)
+                      for points in settings.get("lines", []) if points and len(points) >= 2]
+        self.enabled = settings.get("enabled", False) and bool(self.lines)
+        self.threshold_ratio = settings.get("threshold_ratio", 0.15)  # 帯面積に対する通過判定の前景割合
+        self.cooldown = settings.get("cooldown", 1.0)  # 同じ境界の再検出を無視する秒数
+        self.scale_level = max(0, int(settings.get("scale_level", 1)))  # 判定前の pyrDown 回数
+        self.max_interpolation_gap = 0.2  # これ以上離れたフレーム間では補間しない（秒）
+        self.frame_size = tuple(frame_size)
+        if self.lines:
+            self._build()
+        self.reset()
+
+    @property
+    def count(self):
+        return len(self.lines)
+
+    def _build(self):
+        """全境界の帯を囲む矩形とラベルマップ（判定解像度）を作成"""
+        x0 = min(line.roi[0] for line in self.lines)
+        y0 = min(line.roi[1] for line in self.lines)
+        x1 = max(line.roi[2] for line in self.lines)
+        y1 = max(line.roi[3] for line in self.lines)
+        self.roi = (x0, y0, x1, y1)
+        labels = np.zeros((y1 - y0, x1 - x0), dtype=np.uint8)
+        for number, line in enumerate(self.lines, 1):
+            lx0, ly0, lx1, ly1 = line.roi
+            region = labels[ly0 - y0:ly1 - y0, lx0 - x0:lx1 - x0]
+            region[line.mask > 0] = number  # 重なる部分は後の境界を優先
+        for _ in range(self.scale_level):
+            height, width = labels.shape
+            labels = cv2.resize(labels, ((width + 1) // 2, (height + 1) // 2), interpolation=cv2.INTER_NEAREST)
+        self.labels = labels
+        areas = np.bincount(labels.ravel(), minlength=self.count + 1)[1:]
+        self.thresholds = np.maximum(1, areas * self.threshold_ratio)
+
+    def fit_frame(self, frame):
+        """実際のフレームサイズが設定と異なる場合は境界をスケーリングして再構築"""
+        if not any([line.fit_frame(frame) for line in self.lines]):
+            return False
+        self.frame_size = (frame.shape[1], frame.shape[0])
+        self._build()
+        self.reset()
+        return True
+
+    def reset(self):
+        """背景モデルと通過判定の状態を初期化（計測準備ごと）"""
+        self.bg_subtractor = cv2.createBackgroundSubtractorMOG2(history=500, varThreshold=16, detectShadows=False)
+        self.prev_timestamp = None
+        self.prev_counts = np.zeros(self.count)
+        self.above = np.zeros(self.count, dtype=bool)
+        self.last_crossing = np.full(self.count, -np.inf)
+        self.start_lap()
+
+    def update(self, frame, timestamp, learning_rate):
+        """1フレーム分の判定：この間に通過した [(境界番号(0始まり), 通過時刻)]"""
+        self.fit_frame(frame)
+        x0, y0, x1, y1 = self.roi
+        gray = cv2.cvtColor(frame[y0:y1, x0:x1], cv2.COLOR_BGR2GRAY)
+        for _ in range(self.scale_level):
+            gray = cv2.pyrDown(gray)
+        fg_mask = self.bg_subtractor.apply(gray, learningRate=learning_rate)
+
+        # 前景画素のラベルを数えるだけで全境界の動き量（ラベル0 = 帯の外）
+        counts = np.bincount(self.labels[fg_mask == 255], minlength=self.count + 1)[1:]
+        above = counts >= self.thresholds
+        crossings = []
+        interpolate = (self.prev_timestamp is not None and
+                       timestamp - self.prev_timestamp <= self.max_interpolation_gap)
+        for index in np.flatnonzero(above & ~self.above):
+            if timestamp - self.last_crossing[index] < self.cooldown:
+                continue
+            crossing_time = timestamp
+            if interpolate:
+                crossing_time = interpolate_crossing_time(self.prev_timestamp, self.prev_counts[index], timestamp,
+                                                          counts[index], self.thresholds[index])
+            self.last_crossing[index] = crossing_time
+            crossings.append((int(index), float(crossing_time)))
+
+        self.above = above
+        self.prev_counts = counts
+        self.prev_timestamp = timestamp
+        return sorted(crossings, key=lambda crossing: crossing[1])
+
+    def start_lap(self):
+        self.next_line = 0  # 今のラップで次に通過すべき境界
+        self.splits = []  # 今のラップのスプリット（ラップ開始からの秒）
+
+    def record(self, crossings, lap_start):
+        """順番どおりの境界通過をスプリットとして記録 → [(境界番号, スプリット秒)]
+
+        手前の境界を見逃した場合はその境界を None として先へ進む（戻る方向の通過は無視）
+        """
+        recorded = []
+        for index, crossing_time in crossings:
+            if index < self.next_line or crossing_time <= lap_start:
+                continue
+            split = crossing_time - lap_start
+            self.splits.extend([None] * (index - self.next_line))
+            self.splits.append(split)
+            self.next_line = index + 1
+            recorded.append((index, split))
+        return recorded
+
+    def finish_lap(self):
+        """ラップ完了：このラップのスプリット（通過できなかった境界は None）"""
+        splits = self.splits + [None] * (self.count - len(self.splits))
+        self.start_lap()
+        return splits
+
+
+def sector_times(splits, lap_time):
+    """スプリットとラップタイムからセクタータイム（境界 n 個 → n+1 区間、不明な区間は None）"""
+    boundaries = [0.0] + list(splits) + [lap_time]
+    return [end - start if start is not None and end is not None else None
+            for start, end in zip(boundaries, boundaries[1:])]
@@ -0,0 +1,110 @@
+#!/usr/bin/env python3
+"""
+スタートライン仮想トリップワイヤー
+- config.json の start_line_settings で線（2点）または多角形（3点以上）を指定
+- 検出処理はトリップワイヤー周辺の帯状領域（バウンディング矩形）だけを切り出して実行
+- 帯の外側（ピットレーン等）の動きは前景マスクから除外
+- 帯内の動き量の立ち上がりからフレーム間の通過時刻を補間
+"""
+
+import cv2
+import numpy as np
+
+
+def interpolate_crossing_time(prev_timestamp, prev_signal, timestamp, signal, threshold):
+    """通過時刻のフレーム間補間
+
+    直前フレーム（閾値未満）と検出フレーム（閾値以上）の動き量を線形補間し、
+    閾値を横切った時刻を返す。結果は [prev_timestamp, timestamp] に収める。
+    """
+    if prev_timestamp is None or timestamp <= prev_timestamp:
+        return timestamp
+    if prev_signal >= threshold:
+        return prev_timestamp
+    if signal <= prev_signal:
+        return timestamp
+    ratio = (threshold - prev_signal) / float(signal - prev_signal)
+    ratio = min(max(ratio, 0.0), 1.0)
+    return prev_timestamp + ratio * (timestamp - prev_timestamp)
+
+
+class StartLineTripwire:
+    """スタートライン検出用の帯状ROI"""
+
+    def __init__(self, points, band_width=40, frame_size=(640, 480)):
+        if len(points) < 2:
+            raise ValueError("トリップワイヤーには2点以上が必要です")
+        self.points = [(int(x), int(y)) for x, y in points]
+        self.band_width = max(1, int(band_width))
+        self.frame_size = (int(frame_size[0]), int(frame_size[1]))
+        self._build()
+
+    @classmethod
+    def from_config(cls, settings, frame_size):
+        """start_line_settings から生成（未設定ならNone = 全画面検出）"""
+        points = settings.get("tripwire") if settings else None
+        if not points or len(points) < 2:
+            return None
+        return cls(points, settings.get("band_width", 40), frame_size)
+
+    def to_config(self):
+        return {"tripwire": [list(p) for p in self.points], "band_width": self.band_width}
+
+    @property
+    def is_line(self):
+        return len(self.points) == 2
+
+    def _build(self):
+        """帯のバウンディング矩形とマスクを作成"""
+        frame_w, frame_h = self.frame_size
+        pts = np.array(self.points, dtype=np.int32)
+        half = self.band_width // 2 if self.is_line else 0
+
+        x0 = int(np.clip(pts[:, 0].min() - half, 0, frame_w - 1))
+        y0 = int(np.clip(pts[:, 1].min() - half, 0, frame_h - 1))
+        x1 = int(np.clip(pts[:, 0].max() + half + 1, x0 + 1, frame_w))
+        y1 = int(np.clip(pts[:, 1].max() + half + 1, y0 + 1, frame_h))
+        self.roi = (x0, y0, x1, y1)
+
+        self.mask = np.zeros((y1 - y0, x1 - x0), dtype=np.uint8)
+        local = pts - np.array([x0, y0], dtype=np.int32)
+        if self.is_line:
+            cv2.line(self.mask, tuple(int(v) for v in local[0]), tuple(int(v) for v in local[1]),
+                     255, thickness=self.band_width)
+        else:
+            cv2.fillPoly(self.mask, [local], 255)
+
+        # 矩形が帯そのもの（水平・垂直の線）ならマスク処理は不要
+        self.mask_area = max(1, cv2.countNonZero(self.mask))
+        self.needs_mask = self.mask_area < self.mask.size
+        # 全画面基準の閾値を帯の面積に合わせて縮小するための係数
+        self.area_scale = self.mask_area / float(frame_w * frame_h)
+
+    def fit_frame(self, frame):
+        """実際のフレームサイズが設定と異なる場合は座標をスケーリングして再構築"""
+        frame_h, frame_w = frame.shape[:2]
+        if (frame_w, frame_h) != self.frame_size:
+            sx = frame_w / float(self.frame_size[0])
+            sy = frame_h / float(self.frame_size[1])
+            self.points = [(int(round(x * sx)), int(round(y * sy))) for x, y in self.points]
+            self.frame_size = (frame_w, frame_h)
+            self._build()
+            return True
+        return False
+
+    def crop(self, frame):
+        """帯のバウンディング矩形を切り出し（コピーなしのビュー）"""
+        x0, y0, x1, y1 = self.roi
+        return frame[y0:y1, x0:x1]
+
+    def apply_mask(self, fg_mask):
+        """帯の外側の前景を除去"""
+        if not self.needs_mask:
+            return fg_mask
+        return cv2.bitwise_and(fg_mask, self.mask)
+
+    def display_points(self, x, y, width, height):
+        """プレビュー表示座標へ変換"""
+        sx = width / float(self.frame_size[0])
+        sy = height / float(self.frame_size[1])
+        return [(int(x + px * sx), int(y + py * sy)) for px, py in self.points]